@@ -0,0 +1,136 @@
+"""
+Benchmark collecting the metadata of scraper streams.
+
+Compares looking up the metadata methods with dir() and getattr() for every
+stream, as was done before, to iterating the metadata method table of the
+class in BaseScraper._collect_elements(). The synthetic scraper resembles
+a scraper of a video file or a multi-frame image, with many streams and a
+metadata method for each metadata key.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/collect_elements.py [number of streams]
+
+The default number of streams is 2000.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from file_scraper.base import BaseScraper, SkipElementException
+from file_scraper.utils import (combine_metadata, is_important, is_metadata,
+                                metadata)
+
+KEYS = ['codec_name', 'codec_creator_app', 'codec_creator_app_version',
+        'codec_quality', 'data_rate', 'data_rate_mode', 'dar', 'par',
+        'frame_rate', 'width', 'height', 'bits_per_sample', 'color',
+        'sampling', 'signal_format', 'sound', 'duration', 'channels']
+
+
+def _metadata_method(key):
+    """
+    Return metadata method returning a value for the key.
+
+    :key: Metadata key
+    :returns: Metadata-decorated method
+    """
+    def _method(self):
+        """Return value."""
+        return '%s %s' % (key, self.stream)
+    return metadata()(_method)
+
+
+class StreamScraper(BaseScraper):
+    """Scraper with the given number of streams."""
+
+    _supported = {'video/mp4': ['']}
+
+    def __init__(self, streams):
+        """
+        Initialize scraper.
+
+        :streams: Number of streams
+        """
+        super(StreamScraper, self).__init__('filename', 'video/mp4')
+        self.stream = None
+        self._streams = streams
+
+    def scrape_file(self):
+        """Do nothing."""
+        pass
+
+    def iter_tool_streams(self, stream_type):
+        """Iterate the streams."""
+        for index in range(self._streams):
+            self.stream = index
+            yield {}
+
+    @metadata()
+    def _index(self):
+        """Return stream index."""
+        return self.stream
+
+    @metadata(important=True)
+    def _stream_type(self):
+        """Return stream type."""
+        return 'video'
+
+
+for _key in KEYS:
+    setattr(StreamScraper, '_' + _key, _metadata_method(_key))
+
+
+def reflection_collect(scraper):
+    """
+    Collect the metadata by looking up the methods for every stream.
+
+    :scraper: StreamScraper instance
+    """
+    # pylint: disable=protected-access
+    for _ in scraper.iter_tool_streams(None):
+        indexed_metadata = {}
+        for method in dir(scraper):
+            if is_metadata(getattr(scraper, method)):
+                try:
+                    indexed_metadata[method[1:]] = getattr(scraper, method)()
+                except SkipElementException:
+                    pass
+            if is_important(getattr(scraper, method)):
+                scraper._add_important(method[1:], getattr(scraper, method)())
+        dict_meta = {indexed_metadata['index']: indexed_metadata}
+        scraper.streams = combine_metadata(scraper.streams, dict_meta)
+
+
+def table_collect(scraper):
+    """
+    Collect the metadata with the metadata method table.
+
+    :scraper: StreamScraper instance
+    """
+    scraper._collect_elements()  # pylint: disable=protected-access
+
+
+def main(streams):
+    """
+    Print the collection time per stream in both ways.
+
+    :streams: Number of streams
+    """
+    results = []
+    for (label, function) in [('dir/getattr', reflection_collect),
+                              ('method table', table_collect)]:
+        seconds = []
+        for _ in range(3):
+            scraper = StreamScraper(streams)
+            start = time.time()
+            function(scraper)
+            seconds.append(time.time() - start)
+        results.append(scraper.streams)
+        print('%-13s %8.1f us/stream' % (
+            label, min(seconds) * 1000000.0 / streams))
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,55 @@
+"""
+Benchmark per-file latency of FidoDetector.
+
+Compares detection with a cold Fido engine (signatures loaded for every file,
+as was done before the engine was shared) to detection with the shared,
+already loaded engine.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/fido_detection.py [file ...]
+
+If no files are given, the well-formed test files are used.
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+import file_scraper.detectors
+from file_scraper.detectors import FidoDetector
+from tests.common import get_files
+
+
+def detect(filenames, cold):
+    """
+    Run FidoDetector for the given files.
+
+    :filenames: List of file paths
+    :cold: True to reload the signatures for every file
+    """
+    for filename in filenames:
+        if cold:
+            # pylint: disable=protected-access
+            file_scraper.detectors._FIDO_CACHE['stamp'] = None
+        FidoDetector(filename).detect()
+
+
+def main(filenames):
+    """
+    Print the mean detection time per file.
+
+    :filenames: List of file paths
+    """
+    if not filenames:
+        filenames = [filename for filename, _ in get_files(well_formed=True)]
+    for label, cold in [('reload per file', True), ('shared engine', False)]:
+        detect(filenames[:1], cold)
+        seconds = min(timeit.repeat(lambda: detect(filenames, cold),
+                                    number=1, repeat=3))
+        print('%-16s %8.2f ms/file' % (
+            label, 1000.0 * seconds / len(filenames)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+"""
+Benchmark the start-up time of file-scraper.
+
+Compares importing the scraper with importing also all registered scraper
+modules and their 3rd party libraries, as was done before at start-up, and
+with importing only the scrapers of one mimetype. Each import is timed in a
+new Python process.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/import_time.py [number of runs]
+
+The default number of runs is 5.
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+
+SCRIPTS = [
+    ('all scrapers',
+     'from file_scraper.iterator import registered_scrapers\n'
+     'registered_scrapers()\n'),
+    ('scraper only', ''),
+    ('text/csv scrapers',
+     'from file_scraper.iterator import planned_scrapers\n'
+     'planned_scrapers("text/csv", None)\n'),
+]
+
+TIMER = (
+    'import time\n'
+    'start = time.time()\n'
+    'import file_scraper.scraper\n'
+    '%s'
+    'print(time.time() - start)\n')
+
+
+def main(runs):
+    """
+    Print the best import time of each script.
+
+    :runs: Number of runs
+    """
+    for (label, script) in SCRIPTS:
+        best = min(
+            float(subprocess.check_output(
+                [sys.executable, '-c', TIMER % script]).split()[-1])
+            for _ in range(runs))
+        print('%-18s %8.1f ms' % (label, best * 1000.0))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
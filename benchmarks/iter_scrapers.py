@@ -0,0 +1,68 @@
+"""
+Benchmark finding the scrapers of a file.
+
+Compares calling is_supported() of every scraper class, as was done before,
+to finding the scrapers from the dispatch index with planned_scrapers().
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/iter_scrapers.py [number of lookups]
+
+The default number of lookups is 20000.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from file_scraper.iterator import (SCRAPER_SUPERCLASSES, ScraperNotFound,
+                                   load_class, planned_scrapers,
+                                   registered_scrapers)
+
+FILES = [('text/xml', '1.0'), ('application/pdf', 'A-1b'),
+         ('image/tiff', '6.0'), ('video/mp4', ''), ('text/plain', None)]
+CLASSES = []
+
+
+def supporting_scrapers(mimetype, version, check_wellformed, params):
+    """
+    Find the scrapers by calling is_supported() of all scraper classes.
+
+    :mimetype: Mimetype of the file
+    :version: Version of the file
+    :check_wellformed: True for the full well-formed check
+    :params: Scraper parameters
+    :returns: List of scraper classes
+    """
+    scrapers = [cls for cls in CLASSES
+                if cls.is_supported(mimetype, version, check_wellformed,
+                                    params)]
+    return scrapers or [ScraperNotFound]
+
+
+def main(lookups):
+    """
+    Print the time of finding the scrapers in both ways.
+
+    :lookups: Number of lookups
+    """
+    registered = registered_scrapers()
+    CLASSES.extend(registered)
+    CLASSES.extend(cls for (module, name) in SCRAPER_SUPERCLASSES
+                   for cls in load_class(module, name).__subclasses__()
+                   if cls not in registered)
+    results = []
+    for (label, function) in [('is_supported', supporting_scrapers),
+                              ('dispatch index', planned_scrapers)]:
+        start = time.time()
+        for index in range(lookups):
+            (mimetype, version) = FILES[index % len(FILES)]
+            result = function(mimetype, version, True, {})
+        results.append(result)
+        print('%-15s %8.1f us/lookup' % (
+            label, (time.time() - start) * 1000000.0 / lookups))
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
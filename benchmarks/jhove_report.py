@@ -0,0 +1,97 @@
+"""
+Benchmark collecting fields from large JHove XML reports.
+
+Compares querying each field from the parsed report with a new XPath query,
+as was done before, to collecting all fields in one pass over the report
+with parse_report(). The synthetic report resembles the report of a TIFF
+or PDF file with a large property tree. The fields are read as many times
+as the metadata methods of the JHove scrapers read them.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/jhove_report.py [number of properties]
+
+The default number of properties is 200000.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from lxml import etree
+
+from file_scraper.jhove_base import NAMESPACES, REPORT_FIELDS, parse_report
+
+FIELD_READS = ['status', 'mimeType', 'version', 'mimeType', 'profile',
+               'profile', 'profile', 'format']
+
+
+def jhove_report(properties):
+    """
+    Create synthetic JHove report.
+
+    :properties: Number of properties
+    :returns: Report as bytes
+    """
+    parts = [b'<?xml version="1.0" encoding="UTF-8"?>\n'
+             b'<jhove xmlns="http://hul.harvard.edu/ois/xml/ns/jhove">'
+             b'<repInfo uri="file.tif"><format>TIFF</format>'
+             b'<version>6.0</version><status>Well-Formed and valid</status>'
+             b'<profile>Baseline RGB (Class R)</profile>'
+             b'<mimeType>image/tiff</mimeType><properties>']
+    for index in range(properties):
+        parts.append(b'<property><name>Entry%d</name><values arity="Scalar" '
+                     b'type="Integer"><value>%d</value></values></property>'
+                     % (index, index))
+    parts.append(b'</properties></repInfo></jhove>')
+    return b''.join(parts)
+
+
+def xpath_fields(report):
+    """
+    Read the fields with XPath queries from the parsed report.
+
+    :report: Report as bytes
+    :returns: Dict of field values
+    """
+    tree = etree.fromstring(report)
+    fields = {}
+    for field in FIELD_READS:
+        results = tree.xpath('//j:%s/text()' % field, namespaces=NAMESPACES)
+        fields[field] = '\n'.join(results) if results else None
+    return fields
+
+
+def parsed_fields(report):
+    """
+    Read the fields collected with parse_report().
+
+    :report: Report as bytes
+    :returns: Dict of field values
+    """
+    (collected, _) = parse_report(report, REPORT_FIELDS)
+    return dict((field, collected.get(field)) for field in FIELD_READS)
+
+
+def main(properties):
+    """
+    Print the time of reading the fields in both ways.
+
+    :properties: Number of properties
+    """
+    report = jhove_report(properties)
+    results = []
+    for (label, function) in [('xpath per read', xpath_fields),
+                              ('one pass', parsed_fields)]:
+        seconds = []
+        for _ in range(3):
+            start = time.time()
+            result = function(report)
+            seconds.append(time.time() - start)
+        results.append(result)
+        print('%-15s %8.3f s' % (label, min(seconds)))
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,63 @@
+"""
+Benchmark collecting the metadata of files with many streams.
+
+Runs the FFMpeg metadata scraper with synthetic ffprobe results of
+increasing numbers of streams and prints the collection time per stream,
+which stays constant when the collection is linear in the number of
+streams. Before the streams were indexed and the collected metadata merged
+once, the time per stream grew with the number of streams.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/media_streams.py [number of streams ...]
+
+The default numbers of streams are 100, 1000 and 5000.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+import ffmpeg
+
+from file_scraper.ffmpeg_base import FFMpeg
+
+
+def probe_result(streams):
+    """
+    Return synthetic ffprobe result with video and audio streams.
+
+    :streams: Number of streams
+    :returns: ffprobe result as dict
+    """
+    return {'format': {'format_name': 'mxf', 'encoder': 'encoder 1.0'},
+            'streams': [{'index': index,
+                         'codec_type': 'video' if index % 2 else 'audio',
+                         'codec_long_name': 'codec', 'width': 720,
+                         'height': 576, 'pix_fmt': 'yuv422p',
+                         'sample_rate': '48000', 'channels': 2}
+                        for index in range(streams)]}
+
+
+def main(stream_counts):
+    """
+    Print the collection time per stream.
+
+    :stream_counts: List of numbers of streams
+    """
+    for streams in stream_counts:
+        result = probe_result(streams)
+        ffmpeg.probe = lambda filename, result=result: result
+        seconds = []
+        for _ in range(3):
+            scraper = FFMpeg('filename', 'application/mxf')
+            start = time.time()
+            scraper.scrape_file()
+            seconds.append(time.time() - start)
+        assert len(scraper.streams) == streams + 1
+        print('%6d streams %8.1f us/stream' % (
+            streams, min(seconds) * 1000000.0 / streams))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000])
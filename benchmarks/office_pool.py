@@ -0,0 +1,58 @@
+"""
+Benchmark converting office files with the LibreOffice profile pool.
+
+Compares scraping office files with the Office scraper, when a new
+LibreOffice user profile is created for each file, as was done before, to
+scraping them with a new soffice process and the initialized profiles of
+the pool, and with the long-lived LibreOffice instances of the pool.
+Requires LibreOffice, and pyuno for the instances.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/office_pool.py [number of runs]
+
+The default number of runs is 10.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+import file_scraper.office_pool
+from file_scraper.scrapers.office import Office
+
+FILES = [
+    ('tests/data/application_vnd.oasis.opendocument.text/valid_1.1.odt',
+     'application/vnd.oasis.opendocument.text'),
+    ('tests/data/application_msword/valid_11.0.doc', 'application/msword'),
+    ('tests/data/application_vnd.ms-excel/valid_11.0.xls',
+     'application/vnd.ms-excel'),
+]
+
+
+def main(runs):
+    """
+    Print the time of scraping the files in each way.
+
+    :runs: Number of runs
+    """
+    uno = file_scraper.office_pool.uno
+    for (label, params, instance) in [
+            ('new profile', {}, False),
+            ('profile pool', {'office_pool': True}, False),
+            ('instance', {'office_pool': True}, True)]:
+        if instance and uno is None:
+            print('%-13s pyuno is not available' % label)
+            continue
+        file_scraper.office_pool.uno = uno if instance else None
+        start = time.time()
+        for index in range(runs):
+            (filename, mimetype) = FILES[index % len(FILES)]
+            scraper = Office(filename, mimetype, params=params)
+            scraper.scrape_file()
+            assert scraper.well_formed, scraper.errors()
+        print('%-13s %8.2f s/file' % (label, (time.time() - start) / runs))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
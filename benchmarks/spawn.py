@@ -0,0 +1,45 @@
+"""
+Benchmark launching tools from a large scraper process.
+
+Compares running a short command with run_command() in the scraper process
+to running it in the spawn server, when the scraper process has a large
+amount of memory in use, like a batch worker with loaded Fido signatures,
+XML schemas and images.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/spawn.py [MiB in use] [number of runs]
+
+The defaults are 1024 MiB and 200 runs.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from file_scraper.base import Shell
+from file_scraper.spawn_server import spawn_server
+
+COMMAND = ['true']
+
+
+def main(mebibytes, runs):
+    """
+    Print the time of launching the command in both ways.
+
+    :mebibytes: Memory in use in the scraper process
+    :runs: Number of runs
+    """
+    ballast = b'x' * (mebibytes * 2**20)  # pylint: disable=unused-variable
+    spawn_server()  # Started beforehand, as in a long-lived worker
+    for (label, spawn) in [('run_command', False), ('spawn server', True)]:
+        start = time.time()
+        for _ in range(runs):
+            assert Shell(COMMAND, spawn=spawn).returncode == 0
+        print('%-14s %8.2f ms/run' % (
+            label, (time.time() - start) * 1000.0 / runs))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1024,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -0,0 +1,103 @@
+"""
+Benchmark filtering of duplicate elements from Schematron SVRL output.
+
+Compares the filter with a preceding-sibling XPath query for each element
+and serialization through a second parsed tree, as was done before, to the
+filter with one pass over the result tree. The synthetic SVRL output
+resembles the result of validating a large METS document, where the same
+rules are fired for a large number of elements.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/svrl_filter.py [number of fired rules]
+
+The default number of fired rules is 200000.
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from lxml import etree
+
+from file_scraper.scrapers.schematron import Schematron
+
+SVRL = 'http://purl.oclc.org/dsdl/svrl'
+
+
+def svrl_output(rules):
+    """
+    Create synthetic SVRL output.
+
+    :rules: Number of fired rules
+    :returns: Root element of the SVRL output
+    """
+    root = etree.Element('{%s}schematron-output' % SVRL, nsmap={'svrl': SVRL})
+    for index in range(rules):
+        if index % 1000 == 0:
+            etree.SubElement(root, '{%s}active-pattern' % SVRL,
+                             id='pattern_%d' % (index // 10000))
+        etree.SubElement(root, '{%s}fired-rule' % SVRL,
+                         context='mets:file[%d]' % (index // 100))
+        if index % 5000 == 0:
+            failed = etree.SubElement(root, '{%s}failed-assert' % SVRL,
+                                      test='@ID')
+            etree.SubElement(failed, '{%s}text' % SVRL).text = 'Missing ID.'
+    return root
+
+
+def xpath_filter(result):
+    """
+    Filter duplicate elements with XPath queries from the serialized result.
+
+    :result: Result as string
+    :returns: Filtered result as string
+    """
+    svrl = {'svrl': SVRL}
+    root = etree.fromstring(result)
+    patterns = root.xpath('./svrl:active-pattern', namespaces=svrl)
+    for pattern in patterns:
+        prev = pattern.xpath('preceding-sibling::svrl:active-pattern[1]',
+                             namespaces=svrl)
+        if prev and pattern.get('id') == prev[0].get('id'):
+            pattern.getparent().remove(pattern)
+
+    rules = root.xpath('svrl:fired-rule', namespaces=svrl)
+    for rule in rules:
+        prev = rule.xpath('preceding-sibling::svrl:fired-rule[1]',
+                          namespaces=svrl)
+        if prev and rule.get('context') == prev[0].get('context'):
+            rule.getparent().remove(rule)
+
+    return etree.tostring(
+        root, pretty_print=True, xml_declaration=False,
+        encoding='UTF-8', with_comments=True)
+
+
+def main(rules):
+    """
+    Print the filtering time with both filters.
+
+    :rules: Number of fired rules
+    """
+    root = svrl_output(rules)
+    scraper = Schematron('filename', 'text/xml')
+    # pylint: disable=protected-access
+    filters = [
+        ('xpath per element', lambda root: xpath_filter(etree.tostring(root))),
+        ('single pass', scraper._filter_duplicate_elements)]
+    results = []
+    for label, function in filters:
+        seconds = []
+        for _ in range(3):
+            copy = etree.fromstring(etree.tostring(root))
+            start = time.time()
+            result = function(copy)
+            seconds.append(time.time() - start)
+        results.append(result)
+        print('%-18s %8.3f s' % (label, min(seconds)))
+    assert results[0] == results[1]
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,223 @@
+"""
+Asyncio backend for scraping files.
+
+This module requires Python 3. run_command_async() runs a 3rd party tool
+as an asyncio subprocess with the resource limits of
+run_command_limited(), so that the tools of many files are run at the same
+time from one event loop without a thread for each tool.
+
+The scrapers run their tools synchronously in scrape_file(). Therefore
+scrape_file_async() runs scrape_file() until it needs a tool, which has
+not been run yet, runs the tool with run_command_async(), and then runs
+scrape_file() again from the original state with the results of the tools
+already run. A scraper, which does not give the same command again, e.g.
+because the command has a new temporary file, or which writes the output
+of a tool to a file, is run in an executor thread instead. The Python code
+of the scrapers and the detectors is run in the event loop. The exits of
+the processes are waited by the child watcher of asyncio, which is a
+thread blocking in waitpid() for each process before Python 3.12, unless
+another watcher is set.
+"""
+import asyncio
+import copy
+import os
+import signal
+import subprocess
+
+from file_scraper.base import _ToolNeeded, _ToolReplay
+from file_scraper.utils import (CHUNK_SIZE, _command_env, _limited_result,
+                                _rlimit_command)
+
+
+async def run_command_async(cmd, stdout=subprocess.PIPE, env=None,
+                            limits=None):
+    """
+    Run a command as an asyncio subprocess.
+
+    The command is run in a session of its own, and the limits are applied
+    as in run_command_limited(): the time limit by the event loop, the
+    output limit while reading the outputs, and the CPU time and memory
+    limits as resource limits of the process. The process group is killed
+    also if the coroutine is cancelled.
+
+    :cmd: Command to execute as list
+    :stdout: File handle for directing stdout to a file
+    :env: Override process environment variables
+    :limits: Dict of resource limits, see run_command_limited(), or None
+    :returns: Tuple (statuscode, stdout, stderr, exceeded), where exceeded
+              is the key of the exceeded limit or None
+    """
+    limits = limits or {}
+    proc = await asyncio.create_subprocess_exec(
+        *_rlimit_command(cmd, limits), stdout=stdout,
+        stderr=subprocess.PIPE, env=_command_env(env),
+        start_new_session=True)
+    killed = []
+
+    def _kill(reason):
+        """Kill the process group because of the given exceeded limit."""
+        if not killed:
+            killed.append(reason)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    outputs = {}
+    readers = [
+        _read_limited(stream, limits.get('max_output'), outputs, name, _kill)
+        for (name, stream) in [('stdout', proc.stdout),
+                               ('stderr', proc.stderr)]
+        if stream is not None]
+    try:
+        await asyncio.wait_for(_communicate(proc, readers),
+                               limits.get('timeout'))
+    except asyncio.TimeoutError:
+        _kill('timeout')
+    except asyncio.CancelledError:
+        _kill(None)
+        raise
+    await proc.wait()
+    return _limited_result(
+        cmd, limits, proc.returncode,
+        dict((name, b"".join(chunks)) for (name, chunks) in outputs.items()),
+        killed)
+
+
+async def _communicate(proc, readers):
+    """
+    Read the outputs of a process and wait for it to exit.
+
+    :proc: asyncio.subprocess.Process instance
+    :readers: Coroutines reading the outputs
+    """
+    await asyncio.gather(*readers)
+    await proc.wait()
+
+
+async def _read_limited(stream, max_output, outputs, name, kill):
+    """
+    Read output stream of a process, kill the process on too much output.
+
+    The read chunks are stored as they are read, so that they are kept also
+    if the reading is cancelled.
+
+    :stream: asyncio.StreamReader instance
+    :max_output: Maximum number of bytes to read, None for no limit
+    :outputs: Dict, where the list of the read chunks is stored
+    :name: Key of the output in outputs
+    :kill: Function to kill the process, called with 'max_output'
+    """
+    chunks = outputs.setdefault(name, [])
+    size = 0
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if max_output is not None and size + len(chunk) > max_output:
+            chunks.append(chunk[:max_output - size])
+            kill('max_output')
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+
+
+async def run_shell(shell):
+    """
+    Run the command of a Shell asynchronously and store the results.
+
+    :shell: file_scraper.base.Shell instance
+    :returns: Returncode, stdout, stderr as dictionary, see Shell.run()
+    """
+    # pylint: disable=protected-access
+    if shell._returncode is None and shell._error is None:
+        try:
+            (shell._returncode, shell._stdout, shell._stderr,
+             shell._exceeded) = await run_command_async(
+                 shell.command, stdout=shell.output_file, env=shell.env,
+                 limits=shell.limits)
+        except OSError as error:
+            shell._error = error
+    return shell.run()
+
+
+async def scrape_file_async(scraper, executor=None):
+    """
+    Run scrape_file() of a scraper with the tools run asynchronously.
+
+    :scraper: Scraper instance
+    :executor: concurrent.futures executor for the scrapers, which can not
+               be run again with the results of the run tools, None for the
+               default executor of the event loop
+    """
+    # pylint: disable=protected-access
+    replay = _ToolReplay()
+    scraper._replay = replay
+    state = dict(vars(scraper))
+    try:
+        while True:
+            _restore(scraper, state)
+            try:
+                scraper.scrape_file()
+                return
+            except _ToolNeeded as needed:
+                shell = needed.shell
+                key = needed.key
+            if key is None or replay.hits < len(replay.shells):
+                break
+            try:
+                await run_shell(shell)
+            except OSError:
+                pass  # Raised again, when the scraper uses the shell
+            replay.shells[key] = shell
+    finally:
+        scraper._replay = None
+
+    _restore(scraper, state)
+    scraper._replay = None
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, scraper.scrape_file)
+
+
+def _restore(scraper, state):
+    """
+    Restore the attributes of a scraper for running scrape_file() again.
+
+    The lists, dicts and sets are copied, so that the original state is
+    kept for the next run. Their contents are not copied.
+
+    :scraper: Scraper instance
+    :state: Dict of the original attributes
+    """
+    attributes = vars(scraper)
+    attributes.clear()
+    for (name, value) in state.items():
+        if isinstance(value, (list, dict, set)):
+            value = copy.copy(value)
+        attributes[name] = value
+
+
+async def scrape_async(scraper, executor=None, check_wellformed=True,
+                       concurrent=False, result_cache=None, checksums=None):
+    """
+    Scrape a file with the tools run asynchronously.
+
+    :scraper: file_scraper.scraper.Scraper instance
+    :executor: concurrent.futures executor for the scrapers, which can not
+               be run again with the results of the run tools, None for the
+               default executor of the event loop
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :concurrent: True, run the scrapers of the file at the same time;
+                 False, run the scrapers one after another.
+    :result_cache: ResultCache instance, None to scrape always.
+    :checksums: List of checksum algorithms to be calculated.
+    """
+    # pylint: disable=protected-access
+    for scrapers in scraper._scrape_steps(check_wellformed, result_cache,
+                                          checksums):
+        if concurrent:
+            await asyncio.gather(*[scrape_file_async(tool, executor)
+                                   for tool in scrapers])
+        else:
+            for tool in scrapers:
+                await scrape_file_async(tool, executor)
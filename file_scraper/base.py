@@ -1,28 +1,41 @@
 """Base module for scrapers."""
 import abc
+import collections
+import os
 import subprocess
-from file_scraper.utils import (run_command, combine_metadata, ensure_str,
-                                metadata, is_metadata, is_important)
+import threading
+from file_scraper.spawn_server import SpawnServerUnavailable, spawn_server
+from file_scraper.utils import (run_command, run_command_limited,
+                                combine_metadata, ensure_str, metadata,
+                                is_metadata, is_important)
 
 
 class Shell(object):
     """Shell command handler for non-Python 3rd party software."""
 
-    def __init__(self, command, output_file=subprocess.PIPE, env=None):
+    def __init__(self, command, output_file=subprocess.PIPE, env=None,
+                 limits=None, spawn=False):
         """
         Initialize instance.
 
         :command: Command to execute as list
         :output_file: Output file handle
         :env: Environment variables
+        :limits: Dict of resource limits, see run_command_limited(), or None
+        :spawn: True for running the command in the spawn server of the
+                process, see file_scraper.spawn_server
         """
         self.command = command
 
         self._stdout = None
         self._stderr = None
         self._returncode = None
+        self._exceeded = None
+        self._error = None
         self.output_file = output_file
         self.env = env
+        self.limits = limits
+        self.spawn = spawn
 
     @property
     def returncode(self):
@@ -57,17 +70,208 @@ class Shell(object):
 
         :returns: Returncode, stdout, stderr as dictionary
         """
+        if self._error is not None:
+            raise self._error
         if self._returncode is None:
-            (self._returncode, self._stdout,
-             self._stderr) = run_command(cmd=self.command,
-                                         stdout=self.output_file,
-                                         env=self.env)
+            (self._returncode, self._stdout, self._stderr,
+             self._exceeded) = self._execute()
         return {
             'returncode': self._returncode,
             'stderr': self._stderr,
             'stdout': self._stdout
         }
 
+    def run_async(self):
+        """
+        Run the command as an asyncio subprocess and store the results.
+
+        Requires Python 3. The command is not run in the spawn server. If the
+        command can not be run, the error is raised also by the later calls
+        of run().
+
+        :returns: Coroutine returning the same as run()
+        """
+        from file_scraper.aio import run_shell  # Requires Python 3
+        return run_shell(self)
+
+    def _execute(self):
+        """
+        Execute the command, in the spawn server if it is used.
+
+        The command is run in this process, if the spawn server can not be
+        used. If the server fails after the command was sent to it, the
+        error is raised, as the command may already have been run.
+
+        :returns: Tuple (returncode, stdout, stderr, exceeded limit)
+        """
+        server = spawn_server() if self.spawn else None
+        if server is not None:
+            try:
+                return server.run(self.command, stdout=self.output_file,
+                                  env=self.env, limits=self.limits)
+            except SpawnServerUnavailable:
+                pass
+        if self.limits:
+            return run_command_limited(cmd=self.command, limits=self.limits,
+                                       stdout=self.output_file,
+                                       env=self.env)
+        return run_command(cmd=self.command, stdout=self.output_file,
+                           env=self.env) + (None,)
+
+    @property
+    def limit_error(self):
+        """
+        Error message of an exceeded resource limit.
+
+        :returns: Error message, or None if the command has not been run or
+                  no limit was exceeded
+        """
+        messages = {
+            'timeout': '%s was stopped after the time limit of %s seconds.',
+            'cpu_time': '%s was stopped after the CPU time limit of %s '
+                        'seconds.',
+            'memory': '%s was terminated by a signal with the memory limit '
+                      'of %s bytes.',
+            'max_output': '%s was stopped after its output exceeded %s '
+                          'bytes.'
+        }
+        if self._exceeded is None:
+            return None
+        return messages[self._exceeded] % (os.path.basename(self.command[0]),
+                                           self.limits[self._exceeded])
+
+
+class ArtifactStore(object):
+    """
+    Store of tool outputs shared between the scrapers of one file.
+
+    Scraper.scrape() gives a new store to the scrapers in the parameter
+    'artifact_store', so that e.g. a file parsed with a 3rd party tool can be
+    used by several scrapers without running the tool again. Each artifact is
+    created only once even if the scrapers are run in parallel threads.
+
+    With max_size, the store can also be used as a long-lived in-memory
+    cache, from which the least recently used artifacts are removed.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        Initialize empty store.
+
+        :max_size: Maximum number of stored artifacts, None for no limit
+        """
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._max_size = max_size
+
+    def get(self, key, factory, valid=None):
+        """
+        Return artifact, create it if it is not stored yet.
+
+        If the creation fails, the same exception is raised again for all
+        the subsequent calls with the same key. In a store with a maximum
+        size, used as a long-lived cache, the error is not stored, so that a
+        transient error is not raised for the lifetime of the process, and
+        the artifact is created again in the next call.
+
+        :key: Artifact key, e.g. tuple of the tool name, file path and
+              options given to the tool
+        :factory: Function without arguments creating the artifact
+        :valid: Function returning False for a stored artifact, which is out
+                of date and must be created again, or None
+        :returns: Stored artifact
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                entry = {'lock': threading.Lock()}
+            self._entries[key] = entry
+            while self._max_size is not None and \
+                    len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        with entry['lock']:
+            if 'value' in entry and valid is not None and \
+                    not valid(entry['value']):
+                del entry['value']
+            if 'value' not in entry and 'error' not in entry:
+                try:
+                    entry['value'] = factory()
+                except Exception as exception:  # pylint: disable=broad-except
+                    if self._max_size is not None:
+                        self._discard(key, entry)
+                        raise
+                    entry['error'] = exception
+        if 'error' in entry:
+            raise entry['error']
+        return entry['value']
+
+    def _discard(self, key, entry):
+        """
+        Remove an entry, if it is still stored with the key.
+
+        :key: Artifact key
+        :entry: Entry dict of the artifact
+        """
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+
+class _ToolNeeded(BaseException):
+    """
+    Raised, when a scraper run again by file_scraper.aio needs a new tool.
+
+    This is not an Exception, so that the error handling of the scrapers
+    does not catch it.
+    """
+
+    def __init__(self, shell, key):
+        """
+        Initialize exception.
+
+        :shell: Shell of the tool, None for a tool run without a Shell
+        :key: Key of the shell in _ToolReplay, None if the shell can not be
+              replayed
+        """
+        super(_ToolNeeded, self).__init__(
+            shell.command if shell is not None else None)
+        self.shell = shell
+        self.key = key
+
+
+class _ToolReplay(object):
+    """
+    Tools already run for a scraper in file_scraper.aio.
+
+    When scrape_file() is run again, the shells already run are given for
+    the same commands, and _ToolNeeded is raised for a new command.
+    """
+
+    def __init__(self):
+        """Initialize instance."""
+        self.shells = {}  # Run shells keyed with the commands
+        self.hits = 0  # Number of shells given in the current run
+
+    def shell(self, shell):
+        """
+        Return the already run shell for the command of the given shell.
+
+        The output is not replayed, if it is written to a file.
+
+        :shell: Shell instance, which has not been run
+        :returns: Shell instance, which has been run
+        :raises: _ToolNeeded if the command has not been run
+        """
+        if shell.output_file != subprocess.PIPE:
+            raise _ToolNeeded(shell, None)
+        key = (tuple(shell.command),
+               tuple(sorted((shell.env or {}).items())),
+               tuple(sorted((shell.limits or {}).items())))
+        if key not in self.shells:
+            raise _ToolNeeded(shell, key)
+        self.hits += 1
+        return self.shells[key]
+
 
 class BaseScraper(object):
     """Base class for scrapers."""
@@ -103,6 +307,70 @@ class BaseScraper(object):
         self._errors = []  # Errors in scraping
         self._check_wellformed = check_wellformed  # True for well-formed check
         self._params = params  # Extra parameters needed
+        self._shells = []  # Shells of the run 3rd party tools
+        self._stream_cache = {}  # Values computed for the current stream
+        self._replay = None  # _ToolReplay in file_scraper.aio
+
+    def _artifact(self, key, factory):
+        """
+        Return artifact shared with the other scrapers of the file.
+
+        :key: Artifact key
+        :factory: Function without arguments creating the artifact
+        :returns: Artifact from the store given in the parameters, or a new
+                  artifact if there is no store
+        """
+        store = self._params.get('artifact_store')
+        if store is None:
+            return factory()
+        return store.get(key, factory)
+
+    def _tool_shell(self, command, **kwargs):
+        """
+        Return Shell for running a 3rd party tool with resource limits.
+
+        The limits are taken from the parameter 'tool_limits', which is a
+        dict of limits keyed with the tool names, i.e. the basenames of the
+        commands. The limits with key 'default' are used for all tools,
+        unless overridden in the limits of the tool. The exceeded limits are
+        reported in the errors by _collect_elements(). With parameter
+        'spawn_server', the tool is run in the spawn server of the process.
+
+        :command: Command to execute as list
+        :kwargs: Other arguments for Shell
+        :returns: Shell instance
+        """
+        limits = self._tool_limits(os.path.basename(command[0]))
+        shell = Shell(command, limits=limits or None,
+                      spawn=self._params.get('spawn_server', False), **kwargs)
+        if self._replay is not None:
+            shell = self._replay.shell(shell)
+        self._shells.append(shell)
+        return shell
+
+    def _tool_limits(self, tool):
+        """
+        Return the resource limits of a 3rd party tool.
+
+        :tool: Name of the tool, see _tool_shell()
+        :returns: Dict of limits, empty if there are no limits
+        """
+        tool_limits = self._params.get('tool_limits') or {}
+        limits = dict(tool_limits.get('default') or {})
+        limits.update(tool_limits.get(tool) or {})
+        return limits
+
+    def _blocking_call(self):
+        """
+        Mark that scrape_file() makes blocking calls, e.g. to a tool run
+        without a Shell.
+
+        This must be called before the blocking calls, so that
+        file_scraper.aio runs the scraper in an executor thread instead of
+        running it again in the event loop.
+        """
+        if self._replay is not None:
+            raise _ToolNeeded(None, None)
 
     @classmethod
     def is_supported(cls, mimetype, version=None,
@@ -141,6 +409,20 @@ class BaseScraper(object):
         """
         pass
 
+    def scrape_file_async(self, executor=None):
+        """
+        Run scrape_file() with the 3rd party tools as asyncio subprocesses.
+
+        Requires Python 3. See file_scraper.aio for how the tools are run.
+
+        :executor: concurrent.futures executor for a scraper, which can not be
+                   run with asyncio subprocesses, None for the default
+                   executor of the event loop
+        :returns: Coroutine
+        """
+        from file_scraper.aio import scrape_file_async  # Requires Python 3
+        return scrape_file_async(self, executor)
+
     def messages(self, message=None):
         """
         Return diagnostic messages.
@@ -175,25 +457,54 @@ class BaseScraper(object):
 
         Values returned from metadata-decorated methods will be collected.
         """
+        collected = {}
         for _ in self.iter_tool_streams(None):
             indexed_metadata = {}
-            for method in dir(self):
-                if is_metadata(getattr(self, method)):
-                    try:
-                        indexed_metadata[method[1:]] = getattr(self, method)()
-                    except SkipElementException:
-                        # happens when <method>-method is not to be indexed.
-                        pass
-                if is_important(getattr(self, method)):
-                    self._add_important(method[1:], getattr(self, method)())
-            dict_meta = {indexed_metadata['index']: indexed_metadata}
-            self.streams = combine_metadata(self.streams, dict_meta)
+            for (method, key, important) in self._metadata_methods():
+                try:
+                    value = getattr(self, method)()
+                except SkipElementException:
+                    # happens when <method>-method is not to be indexed.
+                    continue
+                indexed_metadata[key] = value
+                if important:
+                    self._add_important(key, value)
+            if indexed_metadata['index'] in collected:
+                collected = combine_metadata(
+                    collected, {indexed_metadata['index']: indexed_metadata})
+            else:
+                collected[indexed_metadata['index']] = indexed_metadata
+        self.streams = combine_metadata(self.streams, collected)
         self.mimetype = self.streams[0]['mimetype']
         self.version = self.streams[0]['version']
+        for shell in self._shells:
+            if shell.limit_error is not None:
+                self.errors(shell.limit_error)
+        self._shells = []
         self.info = {'class': self.__class__.__name__,
                      'messages': self.messages(),
                      'errors': self.errors()}
 
+    @classmethod
+    def _metadata_methods(cls):
+        """
+        Return the metadata-decorated methods of the class.
+
+        The table is built once for each class and stored in the class, so
+        that the methods are not looked up again for every stream.
+
+        :returns: List of tuples (method name, metadata key, important flag)
+        """
+        methods = cls.__dict__.get('_metadata_table')
+        if methods is None:
+            methods = []
+            for name in dir(cls):
+                method = getattr(cls, name)
+                if is_metadata(method):
+                    methods.append((name, name[1:], is_important(method)))
+            cls._metadata_table = methods
+        return methods
+
     def _check_supported(self):
         """Check that resulted mimetype and possible version are supported."""
         if self._mimetype() is None:
@@ -0,0 +1,213 @@
+"""Persistent cache for scraping results."""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+import six
+
+from file_scraper.iterator import scraper_names
+from file_scraper.utils import hexdigest
+
+DEFAULT_CACHE_PATH = '~/.file-scraper/result-cache.sqlite'
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # Bytes of pickled results
+
+KEY_ALGORITHM = 'SHA-256'
+RESULT_KEYS = ['mimetype', 'version', 'streams', 'info', 'well_formed']
+
+
+class ResultCache(object):
+    """
+    Scraping result cache stored in a local SQLite database.
+
+    Results are keyed with the digest of the file content, the scraper
+    classes, the well-formed check option and the scraper parameters,
+    including the digests of the files given in the parameters, e.g.
+    schematron rules.
+    Versions of the 3rd party tools are not known by file-scraper, so those
+    should be given with extra_hash, if the cache must not survive tool
+    updates. When the cache grows over the given size, the least recently
+    used results are removed.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_MAX_SIZE,
+                 extra_hash=None):
+        """
+        Initialize cache.
+
+        :path: Path of the cache database
+        :max_size: Maximum total size of the cached results in bytes
+        :extra_hash: Extra string to be added in the keys, e.g. tool versions
+        """
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.extra_hash = extra_hash
+        self._initialized = False
+
+    def _connect(self):
+        """
+        Connect to the cache database and create it if needed.
+
+        :returns: SQLite connection
+        """
+        if not self._initialized:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(self.path)):
+                    raise
+        connection = sqlite3.connect(self.path, timeout=60)
+        if not self._initialized:
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    'key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                    'accessed REAL)')
+                connection.execute(
+                    'CREATE INDEX IF NOT EXISTS results_accessed '
+                    'ON results (accessed)')
+                # Total size of the results, kept up to date so that the
+                # whole table is not scanned for every stored result
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS meta ('
+                    'name TEXT PRIMARY KEY, value INTEGER)')
+                connection.execute(
+                    "INSERT OR IGNORE INTO meta (name, value) VALUES "
+                    "('total_size', "
+                    "(SELECT COALESCE(SUM(size), 0) FROM results))")
+            self._initialized = True
+        return connection
+
+    def key(self, filename, check_wellformed, params, digest=None):
+        """
+        Return cache key for scraping the given file.
+
+        :filename: File path
+        :check_wellformed: True for the full well-formed check, False for just
+                           identification and metadata scraping
+        :params: Extra parameters for the scrapers
+        :digest: Already calculated SHA-256 digest of the file, None to read
+                 the file
+        :returns: Cache key as string
+        """
+        if digest is None:
+            digest = hexdigest(filename, algorithm=KEY_ALGORITHM)
+        extra = json.dumps({
+            'digest': digest,
+            'scrapers': scraper_names(),
+            'check_wellformed': check_wellformed,
+            'params': params,
+            'param_files': _param_files(params),
+            'extra_hash': self.extra_hash}, sort_keys=True, default=str)
+        return hashlib.sha256(extra.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Return cached result.
+
+        :key: Cache key
+        :returns: Result as dict, or None if not cached
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            with connection:
+                connection.execute(
+                    'UPDATE results SET accessed = ? WHERE key = ?',
+                    (time.time(), key))
+        finally:
+            connection.close()
+        return pickle.loads(bytes(row[0]))
+
+    def put(self, key, result):
+        """
+        Store result to the cache and evict old results if needed.
+
+        :key: Cache key
+        :result: Result as dict
+        """
+        value = pickle.dumps(result, protocol=2)
+        connection = self._connect()
+        try:
+            with connection:
+                _add_total_size(connection, '-(SELECT COALESCE(SUM(size), 0) '
+                                'FROM results WHERE key = ?)', (key,))
+                connection.execute(
+                    'INSERT OR REPLACE INTO results (key, value, size, '
+                    'accessed) VALUES (?, ?, ?, ?)',
+                    (key, sqlite3.Binary(value), len(value), time.time()))
+                _add_total_size(connection, '?', (len(value),))
+                self._evict(connection)
+        finally:
+            connection.close()
+
+    def _evict(self, connection):
+        """
+        Remove least recently used results until the cache fits in max_size.
+
+        :connection: SQLite connection
+        """
+        total = connection.execute(
+            "SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+        if total <= self.max_size:
+            return
+        evicted = []
+        evicted_size = 0
+        for (key, size) in connection.execute(
+                'SELECT key, size FROM results ORDER BY accessed'):
+            if total - evicted_size <= self.max_size:
+                break
+            evicted.append((key,))
+            evicted_size += size
+        connection.executemany('DELETE FROM results WHERE key = ?', evicted)
+        _add_total_size(connection, '?', (-evicted_size,))
+
+    def clear(self):
+        """Remove all results from the cache."""
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('DELETE FROM results')
+                connection.execute(
+                    "UPDATE meta SET value = 0 WHERE name = 'total_size'")
+        finally:
+            connection.close()
+
+
+def _add_total_size(connection, expression, arguments):
+    """
+    Add to the total size of the results.
+
+    The size is updated with one statement, so that concurrent processes
+    do not overwrite the updates of each other.
+
+    :connection: SQLite connection in a transaction
+    :expression: SQL expression of the added size
+    :arguments: Arguments of the expression
+    """
+    connection.execute(
+        "UPDATE meta SET value = value + %s WHERE name = 'total_size'"
+        % expression, arguments)
+
+
+def _param_files(params):
+    """
+    Return digests of the files given in the scraper parameters.
+
+    :params: Scraper parameters
+    :returns: Sorted list of (path, SHA-256 digest) of the existing files in
+              the parameter values and in their lists
+    """
+    paths = set()
+    for value in (params or {}).values():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for path in values:
+            if isinstance(path, six.string_types) and os.path.isfile(path):
+                paths.add(path)
+    return [(path, hexdigest(path, algorithm=KEY_ALGORITHM))
+            for path in sorted(paths)]
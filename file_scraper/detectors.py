@@ -1,61 +1,119 @@
 """File format detectors."""
-# pylint: disable=ungrouped-imports
+import os
+import re
+import threading
 
-import ctypes
-
-try:
-    from file_scraper.defaults import MAGIC_LIBRARY
-
-    ctypes.cdll.LoadLibrary(MAGIC_LIBRARY)
-except OSError:
-    print('%s not found, MS Office detection may not work properly if '
-          'file command library is older.' % MAGIC_LIBRARY)
-
-import magic
+from fido import CONFIG_DIR
 from fido.fido import Fido, defaults
 from fido.pronomutils import get_local_pronom_versions
 from file_scraper.base import BaseDetector
 from file_scraper.defaults import PRONOM_DICT, MIMETYPE_DICT, VERSION_DICT, \
     PRIORITY_PRONOM
-from file_scraper.utils import encode
+from file_scraper.magic_base import magic_analyze
 
 
-class _FidoReader(Fido):
-    """Fido wrapper to get pronom code, mimetype and version."""
+FIDO_FORMAT_FILES = ['formats-v94.xml', 'format_extensions.xml']
+
+_FIDO_LOCK = threading.Lock()
+_FIDO_CACHE = {'stamp': None, 'engine': None}
+
+
+def _fido_signature_stamp():
+    """
+    Return the modification state of the Fido signature files.
+
+    The stamp changes whenever one of the signature files is replaced or
+    modified on disk, so it can be used to invalidate the cached engine.
+
+    :returns: Tuple of (path, mtime, size) tuples
+    """
+    filenames = ['versions.xml', defaults['containersignature_file']] + \
+        FIDO_FORMAT_FILES
+    stamp = []
+    for filename in filenames:
+        path = os.path.join(os.path.abspath(CONFIG_DIR), filename)
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
 
+def fido_engine():
+    """
+    Return the process-wide Fido signature engine.
+
+    The PRONOM signature files are loaded once and the engine is shared by
+    all readers in all threads. The engine is rebuilt only if the signature
+    files have changed on disk.
+
+    :returns: Fido instance with loaded signatures
+    """
     # Global variable in Fido
-    # pylint: disable=invalid-name, global-statement
     # pylint: disable=global-variable-not-assigned
     global defaults
 
+    stamp = _fido_signature_stamp()
+    if _FIDO_CACHE['stamp'] == stamp:
+        return _FIDO_CACHE['engine']
+    with _FIDO_LOCK:
+        stamp = _fido_signature_stamp()
+        if _FIDO_CACHE['stamp'] != stamp:
+            versions = get_local_pronom_versions()
+            defaults['xml_pronomSignature'] = versions.pronom_signature
+            defaults['containersignature_file'] = \
+                versions.pronom_container_signature
+            defaults['xml_fidoExtensionSignature'] = \
+                versions.fido_extension_signature
+            defaults['format_files'] = [defaults['xml_pronomSignature']]
+            defaults['format_files'].append(
+                defaults['xml_fidoExtensionSignature'])
+            engine = Fido(quiet=True, format_files=FIDO_FORMAT_FILES)
+            engine.regexes = {}  # Compiled signature regexes
+            _FIDO_CACHE['engine'] = engine
+            _FIDO_CACHE['stamp'] = _fido_signature_stamp()
+        return _FIDO_CACHE['engine']
+
+
+class _FidoReader(Fido):
+    """Fido wrapper to get pronom code, mimetype and version."""
+
     def __init__(self, filename):
         """
         Initialize the reader.
 
-        Fido is done with old-style python and does not inherit object,
-        so super() is not available.
+        The loaded signatures are taken from the shared Fido engine instead
+        of loading the signature files again. Fido is done with old-style
+        python and does not inherit object, so super() is not available.
         :filename: File path
         """
+        # pylint: disable=super-init-not-called
+        self.__dict__.update(fido_engine().__dict__)
+        self.handle_matches = self.print_matches
         self.filename = filename  # File path
         self.puid = None  # Identified pronom code
         self.mimetype = None  # Identified mime type
         self.version = None  # Identified file format version
-        Fido.__init__(self, quiet=True, format_files=[
-            'formats-v94.xml', 'format_extensions.xml'])
 
     def identify(self):
         """Identify file format with using pronom registry."""
-        versions = get_local_pronom_versions()
-        defaults['xml_pronomSignature'] = versions.pronom_signature
-        defaults['containersignature_file'] = \
-            versions.pronom_container_signature
-        defaults['xml_fidoExtensionSignature'] = \
-            versions.fido_extension_signature
-        defaults['format_files'] = [defaults['xml_pronomSignature']]
-        defaults['format_files'].append(
-            defaults['xml_fidoExtensionSignature'])
         self.identify_file(filename=self.filename, extension=False)
 
+    def get_regex(self, pat):
+        """
+        Return compiled regex of the given signature pattern.
+
+        The compiled regexes are cached in the shared engine.
+        :pat: Pattern element from the signature file
+        :returns: Compiled regex
+        """
+        regex = self.regexes.get(pat)
+        if regex is None:
+            regex = re.compile(Fido.get_regex(self, pat))
+            self.regexes[pat] = regex
+        return regex
+
     def print_matches(self, fullname, matches, delta_t, matchtype=''):
         """
         Get puid, mimetype and version.
@@ -147,10 +205,7 @@ class MagicDetector(BaseDetector):
 
     def detect(self):
         """Detect mimetype."""
-        magic_ = magic.open(magic.MAGIC_MIME_TYPE)
-        magic_.load()
-        mimetype = magic_.file(encode(self.filename))
-        magic_.close()
+        mimetype = magic_analyze(self.filename, description=False)['mimetype']
         if mimetype in MIMETYPE_DICT:
             self.mimetype = MIMETYPE_DICT[mimetype]
         else:
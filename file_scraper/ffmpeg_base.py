@@ -1,4 +1,5 @@
 """Metadata scraper for video file formats and streams."""
+import copy
 import re
 from fractions import Fraction
 
@@ -9,7 +10,7 @@ except ImportError:
 
 from file_scraper.base import BaseScraper, SkipElementException
 from file_scraper.utils import iso8601_duration, strip_zeros, metadata, \
-    ensure_str
+    ensure_str, stream_cached
 
 
 class FFMpeg(BaseScraper):
@@ -27,6 +28,8 @@ class FFMpeg(BaseScraper):
         """
         self._ffmpeg_stream = None  # Current ffprobe stream
         self._ffmpeg = None  # All ffprobe streams
+        self._ffmpeg_index = {}  # Streams keyed with stream index
+        self._ffmpeg_has_audio = None  # True if there are audio streams
         super(FFMpeg, self).__init__(filename, mimetype, check_wellformed,
                                      params)
 
@@ -37,14 +40,21 @@ class FFMpeg(BaseScraper):
             self._collect_elements()
             return
         try:
-            self._ffmpeg = ffmpeg.probe(self.filename)
+            # The probe result is shared with the other scrapers, so the
+            # stream indexes are changed in a copy
+            self._ffmpeg = copy.deepcopy(self._artifact(
+                ('ffprobe', self.filename),
+                lambda: ffmpeg.probe(self.filename)))
             for stream in [self._ffmpeg['format']] + self._ffmpeg['streams']:
                 if 'index' not in stream:
                     stream['index'] = 0
                 else:
                     stream['index'] = stream['index'] + 1
+            self._ffmpeg_index = {}
+            for stream in reversed(self._ffmpeg['streams']):
+                self._ffmpeg_index[stream['index']] = stream
             self.set_tool_stream(0)
-        except self._ffmpeg.Error as err:
+        except ffmpeg.Error as err:
             self.errors('Error in analyzing file.')
             self.errors(ensure_str(err.stderr))
         else:
@@ -84,11 +94,11 @@ class FFMpeg(BaseScraper):
         if self._ffmpeg is not None:
             if index == 0:
                 self._ffmpeg_stream = self._ffmpeg['format']
+            elif index in self._ffmpeg_index:
+                self._ffmpeg_stream = self._ffmpeg_index[index]
+            else:
                 return
-            for stream in self._ffmpeg['streams']:
-                if stream['index'] == index:
-                    self._ffmpeg_stream = stream
-                    return
+            self._stream_cache = {}
 
     def _hascontainer(self):
         """Check if file has a video container."""
@@ -137,6 +147,7 @@ class FFMpeg(BaseScraper):
         return '(:unav)'
 
     @metadata()
+    @stream_cached
     def _stream_type(self):
         """Return stream type."""
         if self._ffmpeg is None:
@@ -273,11 +284,18 @@ class FFMpeg(BaseScraper):
             raise SkipElementException()
         if self._ffmpeg is None:
             return None
-        for stream in self._ffmpeg["streams"]:
-            if stream['codec_type'] == 'audio':
-                return 'Yes'
+        if self._has_audio():
+            return 'Yes'
         return 'No'
 
+    def _has_audio(self):
+        """Return True if the file has audio streams."""
+        if self._ffmpeg_has_audio is None:
+            self._ffmpeg_has_audio = any(
+                stream['codec_type'] == 'audio'
+                for stream in self._ffmpeg['streams'])
+        return self._ffmpeg_has_audio
+
     @metadata()
     def _audio_data_encoding(self):
         """Return audio data encoding."""
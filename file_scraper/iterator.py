@@ -1,38 +1,153 @@
 """Scraper iterator."""
-# flake8: noqa
-# pylint:disable=unused-import
+import importlib
+import sys
+
 from file_scraper.base import BaseScraper
-from file_scraper.detectors import FidoDetector, MagicDetector
-from file_scraper.jhove_base import JHove
-from file_scraper.magic_base import BinaryMagic, TextMagic
-from file_scraper.mediainfo_base import Mediainfo
-from file_scraper.pil_base import Pil
-from file_scraper.wand_base import Wand
-from file_scraper.scrapers.jhove import GifJHove, HtmlJHove, JpegJHove, \
-    PdfJHove, TiffJHove, Utf8JHove, WavJHove
-from file_scraper.scrapers.xmllint import Xmllint
-from file_scraper.scrapers.lxml_encoding import XmlEncoding
-from file_scraper.scrapers.warctools import GzipWarctools, WarcWarctools, \
-    ArcWarctools
-from file_scraper.scrapers.ghostscript import GhostScript
-from file_scraper.scrapers.pngcheck import Pngcheck
-from file_scraper.scrapers.csv_scraper import Csv
-from file_scraper.scrapers.mediainfo import MpegMediainfo, WavMediainfo, \
-    MkvMediainfo, MovMediainfo
-from file_scraper.scrapers.ffmpeg import FFMpegWellformed
-from file_scraper.scrapers.office import Office
-from file_scraper.scrapers.magic import TextFileMagic, XmlFileMagic, \
-    HtmlFileMagic, PdfFileMagic, OfficeFileMagic, PngFileMagic, \
-    JpegFileMagic, Jp2FileMagic, TiffFileMagic, XhtmlFileMagic, \
-    ArcFileMagic
-from file_scraper.scrapers.wand import TiffWand, ImageWand
-from file_scraper.scrapers.pil import ImagePil, JpegPil, TiffPil
-from file_scraper.scrapers.pspp import Pspp
-from file_scraper.scrapers.verapdf import VeraPdf
-from file_scraper.scrapers.dpx import Dpx
-from file_scraper.scrapers.vnu import Vnu
 from file_scraper.scrapers.dummy import ScraperNotFound
 
+OFFICE_MIMETYPES = [
+    'application/vnd.oasis.opendocument.text',
+    'application/vnd.oasis.opendocument.spreadsheet',
+    'application/vnd.oasis.opendocument.presentation',
+    'application/vnd.oasis.opendocument.graphics',
+    'application/vnd.oasis.opendocument.formula',
+    'application/msword',
+    'application/vnd.ms-excel',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.'
+    'presentation']
+MEDIA_MIMETYPES = ['video/mpeg', 'video/mp4', 'audio/mpeg', 'audio/mp4',
+                   'video/MP1S', 'video/MP2P', 'video/MP2T']
+
+# The scraper classes in the order they are run, with the mimetypes which
+# they may support. The module of a scraper is imported only when a file of
+# its mimetypes is scraped, so that the 3rd party libraries of the other
+# scrapers are not loaded.
+SCRAPERS = [
+    ('file_scraper.scrapers.xmllint', 'Xmllint', ['text/xml']),
+    ('file_scraper.scrapers.lxml_encoding', 'XmlEncoding',
+     ['text/xml', 'text/html']),
+    ('file_scraper.scrapers.warctools', 'GzipWarctools',
+     ['application/gzip']),
+    ('file_scraper.scrapers.warctools', 'WarcWarctools',
+     ['application/warc']),
+    ('file_scraper.scrapers.warctools', 'ArcWarctools',
+     ['application/x-internet-archive']),
+    ('file_scraper.scrapers.ghostscript', 'GhostScript', ['application/pdf']),
+    ('file_scraper.scrapers.pngcheck', 'Pngcheck', ['image/png']),
+    ('file_scraper.scrapers.csv_scraper', 'Csv', ['text/csv']),
+    ('file_scraper.scrapers.ffmpeg', 'FFMpegWellformed',
+     MEDIA_MIMETYPES + ['video/x-matroska', 'video/quicktime', 'video/dv']),
+    ('file_scraper.scrapers.office', 'Office', OFFICE_MIMETYPES),
+    ('file_scraper.scrapers.pspp', 'Pspp', ['application/x-spss-por']),
+    ('file_scraper.scrapers.verapdf', 'VeraPdf', ['application/pdf']),
+    ('file_scraper.scrapers.dpx', 'Dpx', ['image/x-dpx']),
+    ('file_scraper.scrapers.vnu', 'Vnu', ['text/html']),
+    ('file_scraper.scrapers.magic', 'PdfFileMagic', ['application/pdf']),
+    ('file_scraper.scrapers.magic', 'OfficeFileMagic', OFFICE_MIMETYPES),
+    ('file_scraper.scrapers.magic', 'ArcFileMagic',
+     ['application/x-internet-archive']),
+    ('file_scraper.scrapers.magic', 'PngFileMagic', ['image/png']),
+    ('file_scraper.scrapers.magic', 'JpegFileMagic', ['image/jpeg']),
+    ('file_scraper.scrapers.magic', 'Jp2FileMagic', ['image/jp2']),
+    ('file_scraper.scrapers.magic', 'TiffFileMagic', ['image/tiff']),
+    ('file_scraper.scrapers.magic', 'TextFileMagic',
+     ['text/plain', 'text/csv']),
+    ('file_scraper.scrapers.magic', 'XmlFileMagic', ['text/xml']),
+    ('file_scraper.scrapers.magic', 'XhtmlFileMagic',
+     ['application/xhtml+xml']),
+    ('file_scraper.scrapers.magic', 'HtmlFileMagic', ['text/html']),
+    ('file_scraper.scrapers.jhove', 'GifJHove', ['image/gif']),
+    ('file_scraper.scrapers.jhove', 'HtmlJHove',
+     ['text/html', 'application/xhtml+xml']),
+    ('file_scraper.scrapers.jhove', 'JpegJHove', ['image/jpeg']),
+    ('file_scraper.scrapers.jhove', 'TiffJHove', ['image/tiff']),
+    ('file_scraper.scrapers.jhove', 'PdfJHove', ['application/pdf']),
+    ('file_scraper.scrapers.jhove', 'WavJHove', ['audio/x-wav']),
+    ('file_scraper.scrapers.mediainfo', 'MovMediainfo',
+     ['video/quicktime', 'video/dv']),
+    ('file_scraper.scrapers.mediainfo', 'MkvMediainfo', ['video/x-matroska']),
+    ('file_scraper.scrapers.mediainfo', 'WavMediainfo', ['audio/x-wav']),
+    ('file_scraper.scrapers.mediainfo', 'MpegMediainfo', MEDIA_MIMETYPES),
+    ('file_scraper.scrapers.pil', 'TiffPil', ['image/tiff']),
+    ('file_scraper.scrapers.pil', 'ImagePil',
+     ['image/png', 'image/jp2', 'image/gif']),
+    ('file_scraper.scrapers.pil', 'JpegPil', ['image/jpeg']),
+    ('file_scraper.scrapers.wand', 'TiffWand', ['image/tiff']),
+    ('file_scraper.scrapers.wand', 'ImageWand',
+     ['image/png', 'image/jpeg', 'image/jp2', 'image/gif']),
+]
+
+# The superclasses of the scraper classes, as (module, class name). The
+# subclasses not listed in SCRAPERS, e.g. scrapers defined by the users of
+# file-scraper, are run after the listed ones, if the module of their
+# superclass has been imported.
+SCRAPER_SUPERCLASSES = [
+    ('file_scraper.base', 'BaseScraper'),
+    ('file_scraper.magic_base', 'BinaryMagic'),
+    ('file_scraper.magic_base', 'TextMagic'),
+    ('file_scraper.jhove_base', 'JHove'),
+    ('file_scraper.mediainfo_base', 'Mediainfo'),
+    ('file_scraper.pil_base', 'Pil'),
+    ('file_scraper.wand_base', 'Wand'),
+]
+
+DETECTORS = [
+    ('file_scraper.detectors', 'FidoDetector'),
+    ('file_scraper.detectors', 'MagicDetector'),
+]
+
+_REGISTRY = {}
+_DISPATCH = {}
+
+
+def load_class(module, name):
+    """
+    Import a class.
+
+    :module: Module name
+    :name: Class name
+    :returns: The class
+    """
+    return getattr(importlib.import_module(module), name)
+
+
+def register_scraper(module, name, mimetypes):
+    """
+    Register a scraper class to be run after the other registered ones.
+
+    The module of the scraper is imported only when a file of the given
+    mimetypes is scraped.
+
+    :module: Module name
+    :name: Class name
+    :mimetypes: List of the mimetypes which the scraper may support
+    """
+    SCRAPERS.append((module, name, list(mimetypes)))
+    _REGISTRY.clear()
+    _DISPATCH.clear()
+
+
+def registered_scrapers():
+    """
+    Import all registered scraper classes.
+
+    :returns: List of the scraper classes in the order they are run
+    """
+    return [load_class(module, name) for (module, name, _) in SCRAPERS]
+
+
+def scraper_names():
+    """
+    Return the names of the registered scraper classes without importing
+    them.
+
+    :returns: Sorted list of names 'module.class'
+    """
+    return sorted('%s.%s' % (module, name) for (module, name, _) in SCRAPERS)
+
 
 def iter_detectors():
     """
@@ -41,34 +156,184 @@ def iter_detectors():
     We want to keep the detectors in ordered list.
     :returns: detector class
     """
-    for cls in [FidoDetector, MagicDetector]:
-        yield cls
+    for (module, name) in DETECTORS:
+        yield load_class(module, name)
 
 
-def iter_scrapers(mimetype, version, check_wellformed=True, params=None):
+def _candidate(cls, mimetype):
     """
-    Iterate scrapers.
+    Return the dispatch candidate of a scraper class for a mimetype.
+
+    :cls: Scraper class
+    :mimetype: Mimetype of the file
+    :returns: Tuple (scraper class, supported versions or None for any
+              version, True if only for well-formed check), where the
+              versions are None and the well-formed flag is None for the
+              classes overriding is_supported(). None, if the class does not
+              support the mimetype.
+    """
+    # pylint: disable=protected-access
+    if cls.is_supported.__func__ is not BaseScraper.is_supported.__func__:
+        return (cls, None, None)
+    if mimetype not in cls._supported:
+        return None
+    return (cls, None if cls._allow_versions else cls._supported[mimetype],
+            cls._only_wellformed)
+
+
+def _registry():
+    """
+    Return the registry index, built from SCRAPERS at the first call.
+
+    The index is built in a local variable and stored with one assignment,
+    so that other threads never see a partially built index.
+
+    :returns: Dict with the (module, class name) lists of the registered
+              scrapers keyed with mimetype in key 'index', the set of the
+              registered (module, class name) in key 'names' and the
+              candidates of the mimetypes already dispatched in key
+              'candidates'
+    """
+    registry = _REGISTRY.get('registry')
+    if registry is None:
+        index = {}
+        for (module, name, mimetypes) in SCRAPERS:
+            for mimetype in mimetypes:
+                index.setdefault(mimetype, []).append((module, name))
+        registry = {
+            'index': index,
+            'names': set((module, name) for (module, name, _) in SCRAPERS),
+            'candidates': {}
+        }
+        _REGISTRY['registry'] = registry
+    return registry
+
+
+def _registered_candidates(mimetype):
+    """
+    Return the candidates of the registered scraper classes for a mimetype.
+
+    The modules of the scrapers are imported when the candidates of the
+    mimetype are needed for the first time.
+
+    :mimetype: Mimetype of the file
+    :returns: List of candidates, see _candidate(), in the order of SCRAPERS
+    """
+    registry = _registry()
+    candidates = registry['candidates'].get(mimetype)
+    if candidates is None:
+        candidates = [
+            candidate for candidate in (
+                _candidate(load_class(module, name), mimetype)
+                for (module, name) in registry['index'].get(mimetype, []))
+            if candidate is not None]
+        registry['candidates'][mimetype] = candidates
+    return candidates
+
+
+def _loaded_superclasses():
+    """
+    Return the scraper superclasses, which modules have been imported.
+
+    :returns: List of classes
+    """
+    superclasses = []
+    for (module, name) in SCRAPER_SUPERCLASSES:
+        superclass = getattr(sys.modules.get(module), name, None)
+        if superclass is not None:
+            superclasses.append(superclass)
+    return superclasses
+
+
+def _dispatch_index():
+    """
+    Return the dispatch index of the scraper classes not in SCRAPERS.
+
+    The index maps mimetypes to the candidate scraper classes, in the order
+    the classes are iterated, with their supported versions and the
+    well-formed check requirements. The classes overriding is_supported()
+    are candidates for all mimetypes, and is_supported() is called for them
+    at dispatch. The index is built again only if the scraper classes have
+    changed, e.g. when new scraper classes have been imported. The index is
+    stored together with the classes in one assignment, so that other
+    threads get either the old or the new index.
+
+    :returns: Tuple (dict of candidate lists keyed with mimetype, candidate
+              list for other mimetypes), see _candidate() for the
+              candidates
+    """
+    classes = tuple(tuple(superclass.__subclasses__())
+                    for superclass in _loaded_superclasses())
+    state = _DISPATCH.get('state')
+    if state is not None and state[0] == classes:
+        return state[1]
+
+    registered = _registry()['names']
+    by_mimetype = {}
+    hooked = []
+    for cls in (cls for subclasses in classes for cls in subclasses):
+        if (cls.__module__, cls.__name__) in registered:
+            continue
+        candidate = _candidate(cls, None)
+        if candidate is not None:
+            hooked.append(candidate)
+            for mimetype_candidates in by_mimetype.values():
+                mimetype_candidates.append(candidate)
+            continue
+        for mimetype in cls._supported:  # pylint: disable=protected-access
+            if mimetype not in by_mimetype:
+                by_mimetype[mimetype] = list(hooked)
+            by_mimetype[mimetype].append(_candidate(cls, mimetype))
+
+    index = (by_mimetype, hooked)
+    _DISPATCH['state'] = (classes, index)
+    return index
+
+
+def planned_scrapers(mimetype, version, check_wellformed=True, params=None):
+    """
+    Return the scrapers which would be run for a file.
+
+    The registered scrapers of the mimetype are imported, and run before
+    the other scraper classes defined.
 
     :mimetype: Identified mimetype of the file
     :version: Identified file format version
     :check_wellformed: True for the full well-formed check, False for just
                        identification and metadata scraping
     :params: Extra parameters needed for the scraper
-    :returns: scraper class
+    :returns: List of scraper classes, ScraperNotFound if no scraper is
+              found
     """
-
-    # pylint: disable=no-member
     if params is None:
         params = {}
-    found_scraper = False
-
-    scraper_superclasses = [BaseScraper, BinaryMagic, TextMagic, JHove,
-                            Mediainfo, Pil, Wand]
-    for superclass in scraper_superclasses:
-        for cls in superclass.__subclasses__():
+    (by_mimetype, hooked) = _dispatch_index()
+    scrapers = []
+    for (cls, versions, only_wellformed) in (
+            _registered_candidates(mimetype) +
+            by_mimetype.get(mimetype, hooked)):
+        if only_wellformed is None:
             if cls.is_supported(mimetype, version, check_wellformed, params):
-                found_scraper = True
-                yield cls
+                scrapers.append(cls)
+        elif (versions is None or version in versions) and \
+                (check_wellformed or not only_wellformed):
+            scrapers.append(cls)
+    return scrapers or [ScraperNotFound]
+
+
+def iter_scrapers(mimetype, version, check_wellformed=True, params=None):
+    """
+    Iterate scrapers.
 
-    if not found_scraper:
-        yield ScraperNotFound
+    The scrapers are found from the registry and the dispatch index of the
+    scraper classes, see planned_scrapers().
+
+    :mimetype: Identified mimetype of the file
+    :version: Identified file format version
+    :check_wellformed: True for the full well-formed check, False for just
+                       identification and metadata scraping
+    :params: Extra parameters needed for the scraper
+    :returns: scraper class
+    """
+    for cls in planned_scrapers(mimetype, version, check_wellformed, params):
+        yield cls
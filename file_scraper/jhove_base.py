@@ -1,13 +1,21 @@
 """Module for checking files with Jhove scraper."""
 import os
 import abc
+import atexit
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
 
 try:
     import lxml.etree
 except ImportError:
     pass
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
+from file_scraper.spawn_server import SpawnServerError
 from file_scraper.utils import metadata, ensure_str
 
 NAMESPACES = {'j': 'http://hul.harvard.edu/ois/xml/ns/jhove',
@@ -15,6 +23,190 @@ NAMESPACES = {'j': 'http://hul.harvard.edu/ois/xml/ns/jhove',
 JHOVE_HOME = '/usr/share/java/jhove'
 EXTRA_JARS = os.path.join(JHOVE_HOME, 'bin/JhoveView.jar')
 CP = os.path.join(JHOVE_HOME, 'bin/jhove-apps-1.18.1.jar') + ':' + EXTRA_JARS
+JHOVE_CONF = os.path.join(JHOVE_HOME, 'conf/jhove.conf')
+JHOVE_MAIN = 'edu.harvard.hul.ois.jhove.Jhove'
+
+NAILGUN_JAR = '/usr/share/java/nailgun/nailgun-server.jar'
+NAILGUN_SERVER = 'com.martiansoftware.nailgun.NGServer'
+NAILGUN_STARTUP_TIMEOUT = 30  # Seconds to wait for the JVM to listen
+# Exit codes of the ng client for failures in the client or connection,
+# i.e. cases where JHove was not run at all.
+NAILGUN_ERRORS = [226, 227, 228, 229, 230, 231]
+# Fields collected from the JHove reports
+REPORT_FIELDS = ('format', 'version', 'status', 'mimeType', 'profile')
+
+
+class JHoveDaemon(object):
+    """
+    Long-lived JHove JVM served with Nailgun.
+
+    JHove is run inside one JVM, which is started with the Nailgun server.
+    The files are given to it with the ng client, so the JVM startup and
+    JHove module loading is done only once. The server listens to a unix
+    socket in a temporary directory readable only by the user, so that
+    other users can not run code in the JVM, and each process has a server
+    of its own.
+    """
+
+    def __init__(self):
+        """Initialize the daemon."""
+        self._process = None
+        self._pid = None
+        self._socket_dir = None
+
+    @property
+    def alive(self):
+        """Return True if the JVM of this process is running."""
+        return (self._process is not None and self._pid == os.getpid()
+                and self._process.poll() is None)
+
+    @property
+    def address(self):
+        """Return the Nailgun server address of the socket."""
+        return 'local:' + os.path.join(self._socket_dir, 'nailgun.sock')
+
+    def server_command(self):
+        """
+        Return the command starting the JVM.
+
+        :returns: Command as list
+        """
+        return ['java', '-cp', CP + ':' + NAILGUN_JAR, NAILGUN_SERVER,
+                self.address]
+
+    def start(self):
+        """
+        Start the JVM and wait until it accepts connections.
+
+        :returns: True if the JVM was started, False otherwise
+        """
+        self.stop()
+        self._pid = os.getpid()
+        self._socket_dir = tempfile.mkdtemp(prefix='file-scraper-jhove-')
+        try:
+            with open(os.devnull, 'wb') as devnull:
+                self._process = subprocess.Popen(
+                    self.server_command(), stdout=devnull, stderr=devnull)
+        except OSError:
+            self.stop()
+            return False
+        deadline = time.time() + NAILGUN_STARTUP_TIMEOUT
+        while self.alive and time.time() < deadline:
+            if self._accepts():
+                return True
+            time.sleep(0.1)
+        self.stop()
+        return False
+
+    def _accepts(self):
+        """
+        Return True if the server accepts connections to the socket.
+
+        :returns: True if connected, False otherwise
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.settimeout(1)
+            connection.connect(self.address[len('local:'):])
+            return True
+        except socket.error:
+            return False
+        finally:
+            connection.close()
+
+    def stop(self):
+        """Stop the JVM and remove the socket, if started by this process."""
+        if self.alive:
+            self._process.terminate()
+            self._process.wait()
+        if self._socket_dir is not None and self._pid == os.getpid():
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+        self._process = None
+        self._socket_dir = None
+
+    def command(self, args):
+        """
+        Return the command which runs JHove in the JVM.
+
+        :args: JHove arguments as list
+        :returns: Command as list
+        """
+        return ['ng', '--nailgun-server', self.address, JHOVE_MAIN,
+                '-c', JHOVE_CONF] + args
+
+
+_DAEMON_LOCK = threading.Lock()
+_DAEMON = {}
+
+
+def jhove_daemon():
+    """
+    Return the running JHove daemon of this process.
+
+    The daemon is started at the first call, and restarted if it has died.
+    A forked child process starts a daemon of its own.
+
+    :returns: JHoveDaemon instance, or None if it can not be started
+    """
+    with _DAEMON_LOCK:
+        daemon = _DAEMON.get(os.getpid())
+        if daemon is None:
+            _DAEMON.clear()
+            daemon = JHoveDaemon()
+            atexit.register(daemon.stop)
+            _DAEMON[os.getpid()] = daemon
+        if not daemon.alive and not daemon.start():
+            return None
+        return daemon
+
+
+_XPATHS = {}
+
+
+def jhove_xpath(query):
+    """
+    Return compiled XPath query for JHove reports.
+
+    The queries are compiled only once, and the JHove namespaces can be used
+    in them.
+
+    :query: XPath query
+    :returns: lxml.etree.XPath instance
+    """
+    xpath = _XPATHS.get(query)
+    if xpath is None:
+        xpath = lxml.etree.XPath(query, namespaces=NAMESPACES)
+        _XPATHS[query] = xpath
+    return xpath
+
+
+def parse_report(report, fields, keep_tree=False):
+    """
+    Collect the given fields from a JHove XML report in one pass.
+
+    The values of a field are the text contents of the JHove elements with
+    the name of the field, joined with newlines, as with XPath query
+    '//j:<field>/text()'. The elements of all the fields are found with one
+    iteration over the report, instead of a separate query for each field.
+
+    :report: JHove XML report
+    :fields: Names of the collected fields
+    :keep_tree: True for returning also the parsed report
+    :returns: Tuple (dict of field values, root element of the report or
+              None if the tree is not kept)
+    :raises: XMLSyntaxError if the report is not well-formed
+    """
+    root = lxml.etree.fromstring(report or b'')
+    tags = dict(('{%s}%s' % (NAMESPACES['j'], field), field)
+                for field in fields)
+    values = {}
+    for element in root.iter(*tags):
+        texts = [element.text] + [child.tail for child in element]
+        values.setdefault(tags[element.tag], []).extend(
+            text for text in texts if text is not None)
+    joined = dict((field, '\n'.join(texts))
+                  for (field, texts) in values.items() if texts)
+    return (joined, root if keep_tree else None)
 
 
 class JHove(BaseScraper):
@@ -22,6 +214,8 @@ class JHove(BaseScraper):
 
     __metaclass__ = abc.ABCMeta
     _jhove_module = None  # JHove module
+    _report_fields = REPORT_FIELDS  # Fields collected from the report
+    _keep_report = False  # True for XPath queries to the report
 
     def __init__(self, filename, mimetype, check_wellformed=True, params=None):
         """
@@ -33,8 +227,12 @@ class JHove(BaseScraper):
                            detection and metadata scraping
         :params: Extra parameters needed for the scraper
         """
-        self._report = None  # JHove report
+        if params is None:
+            params = {}
+        self._report = None  # JHove report, if kept
+        self._fields = None  # Field values from the JHove report
         self._shell = None  # Shell object
+        self._use_daemon = params.get('jhove_daemon', False)
         super(JHove, self).__init__(filename, mimetype, check_wellformed,
                                     params)
 
@@ -47,15 +245,26 @@ class JHove(BaseScraper):
             self._collect_elements()
             return
 
-        exec_cmd = ['jhove', '-h', 'XML', '-m',
-                    self._jhove_module, self.filename]
-        self._shell = Shell(exec_cmd)
+        self._shell = self._run_jhove(['-h', 'XML', '-m', self._jhove_module],
+                                      self.filename)
+        if self._shell.limit_error is not None:
+            # The report is missing or cut short, the limit error is
+            # collected from the shell
+            self._collect_elements()
+            return
 
         if self._shell.returncode != 0:
             self.errors("JHove returned error: %s\n%s" % (
                 self._shell.returncode, self._shell.stderr))
 
-        self._report = lxml.etree.fromstring(self._shell.stdout)
+        try:
+            (self._fields, self._report) = parse_report(
+                self._shell.stdout, self._report_fields, self._keep_report)
+        except lxml.etree.XMLSyntaxError as exception:
+            self.errors("JHove report is not well-formed: %s\n%s" % (
+                exception, ensure_str(self._shell.stderr)))
+            self._collect_elements()
+            return
 
         status = self.report_field("status")
         self.messages(status)
@@ -67,6 +276,33 @@ class JHove(BaseScraper):
         self._check_supported()
         self._collect_elements()
 
+    def _run_jhove(self, args, filename):
+        """
+        Run JHove with the given arguments for a file.
+
+        JHove is run in the JHove daemon, if it is used. If the daemon can
+        not be reached or the Nailgun client can not be run, JHove command
+        line tool is used instead. The daemon resolves relative paths
+        against the working directory of the JVM, so it is given the
+        absolute path of the file.
+
+        :args: JHove arguments as list
+        :filename: File to check
+        :returns: Shell instance
+        """
+        if self._use_daemon:
+            daemon = jhove_daemon()
+            if daemon is not None:
+                shell = self._tool_shell(
+                    daemon.command(args + [os.path.abspath(filename)]))
+                try:
+                    if shell.returncode not in NAILGUN_ERRORS:
+                        return shell
+                except (OSError, SpawnServerError):
+                    pass
+                daemon.stop()
+        return self._tool_shell(['jhove'] + args + [filename])
+
     @metadata()
     def _mimetype(self):
         """Return mimetype given by JHove."""
@@ -84,11 +320,24 @@ class JHove(BaseScraper):
         pass
 
     def report_field(self, field):
-        """Return field value from JHoves XML output stored to self.report."""
-        if self._report is None:
+        """
+        Return field value from JHoves XML output.
+
+        The fields in _report_fields are collected when the report is
+        parsed. Other fields are queried from the report, if it is kept.
+
+        :field: Name of the field
+        :returns: Field value, or None if the field is not found
+        :raises: ValueError if the field is not collected from the report
+        """
+        if self._fields is None:
             return None
-        query = '//j:%s/text()' % field
-        results = self._report.xpath(query, namespaces=NAMESPACES)
+        if field in self._report_fields:
+            return self._fields.get(field)
+        if self._report is None:
+            raise ValueError('Field %s is not collected from the JHove '
+                             'report.' % field)
+        results = jhove_xpath('//j:%s/text()' % field)(self._report)
         if not results:
             return None
         return '\n'.join(results)
@@ -1,7 +1,9 @@
 """Scraper for various binary and text file formats."""
 # pylint: disable=ungrouped-imports
 import os.path
+import contextlib
 import ctypes
+import threading
 
 try:
     from file_scraper.defaults import MAGIC_LIBRARY
@@ -20,6 +22,62 @@ from file_scraper.base import BaseScraper
 from file_scraper.defaults import MIMETYPE_DICT
 from file_scraper.utils import encode, metadata
 
+_MAGIC_LOCK = threading.Lock()
+_MAGIC_COOKIES = {}
+
+
+@contextlib.contextmanager
+def magic_cookie(flags):
+    """
+    Reserve a loaded libmagic cookie.
+
+    Loading the magic database is slow, so the cookies are loaded once and
+    kept in a pool, one list of free cookies for each set of flags. A
+    libmagic cookie must not be used by several threads at once, so a
+    cookie is used by one caller at a time, and a new cookie is loaded only
+    if all cookies of the flags are in use. The pool does not grow with
+    the number of threads, which have used it.
+
+    :flags: libmagic flags, e.g. magic.MAGIC_MIME_TYPE
+    :returns: Context manager giving a loaded magic cookie
+    """
+    with _MAGIC_LOCK:
+        free = _MAGIC_COOKIES.setdefault(flags, [])
+        cookie = free.pop() if free else None
+    if cookie is None:
+        cookie = magic.open(flags)
+        cookie.load()
+    try:
+        yield cookie
+    finally:
+        with _MAGIC_LOCK:
+            _MAGIC_COOKIES[flags].append(cookie)
+
+
+def magic_analyze(filename, description=True):
+    """
+    Analyze file with libmagic.
+
+    Mimetype and encoding are resolved with one query.
+
+    :filename: File path
+    :description: True to resolve also the textual description of the file,
+                  which needs another query
+    :returns: Dict with keys 'mimetype', 'encoding' and 'description'. The
+              values are None, if libmagic gives no result.
+    """
+    filename = encode(filename)
+    with magic_cookie(magic.MAGIC_MIME) as cookie:
+        result = cookie.file(filename)
+    (mimetype, _, encoding) = (result or '').partition('; charset=')
+    if description:
+        with magic_cookie(magic.MAGIC_NONE) as cookie:
+            description = cookie.file(filename)
+    return {
+        'mimetype': mimetype or None,
+        'encoding': encoding or None,
+        'description': description or None}
+
 
 class BinaryMagic(BaseScraper):
     """Scraper for binary files."""
@@ -53,16 +111,10 @@ class BinaryMagic(BaseScraper):
             self._collect_elements()
             return
         try:
-            magic_ = magic.open(magic.MAGIC_MIME_TYPE)
-            magic_.load()
-            self._magic_mimetype = magic_.file(encode(self.filename))
-            magic_.close()
-
-            magic_ = magic.open(magic.MAGIC_NONE)
-            magic_.load()
-            self._magic_version = magic_.file(
-                encode(self.filename)).split(self._starttag)[-1]
-            magic_.close()
+            result = magic_analyze(self.filename)
+            self._magic_mimetype = result['mimetype']
+            self._magic_version = result['description'].split(
+                self._starttag)[-1]
             if self._endtag:
                 self._magic_version = self._magic_version.split(
                     self._endtag)[0]
@@ -140,24 +192,14 @@ class TextMagic(BaseScraper):
             self._collect_elements()
             return
         try:
-            magic_ = magic.open(magic.MAGIC_MIME_TYPE)
-            magic_.load()
-            self._magic_mimetype = magic_.file(encode(self.filename))
-            magic_.close()
-
-            magic_ = magic.open(magic.MAGIC_NONE)
-            magic_.load()
-            self._magic_version = magic_.file(
-                encode(self.filename)).split(self._starttag)[-1]
-            magic_.close()
+            result = magic_analyze(self.filename)
+            self._magic_mimetype = result['mimetype']
+            self._magic_version = result['description'].split(
+                self._starttag)[-1]
             if self._endtag:
                 self._magic_version = self._magic_version.split(
                     self._endtag)[0]
-
-            magic_ = magic.open(magic.MAGIC_MIME_ENCODING)
-            magic_.load()
-            self._magic_charset = magic_.file(encode(self.filename))
-            magic_.close()
+            self._magic_charset = result['encoding']
             if self._mimetype() == self.mimetype or \
                     (self._mimetype() in MIMETYPE_DICT and
                      MIMETYPE_DICT[self._mimetype()] == self.mimetype):
@@ -5,6 +5,7 @@ Please note that you can not use Mediainfo with FFMpeg.
 The streams are in different order, and there is no way
 to fix that.
 """
+import copy
 import re
 
 try:
@@ -13,7 +14,8 @@ except ImportError:
     pass
 
 from file_scraper.base import BaseScraper, SkipElementException
-from file_scraper.utils import iso8601_duration, strip_zeros, metadata, decode
+from file_scraper.utils import (iso8601_duration, strip_zeros, metadata,
+                                decode, stream_cached)
 
 
 class Mediainfo(BaseScraper):
@@ -44,7 +46,9 @@ class Mediainfo(BaseScraper):
             self._collect_elements()
             return
         try:
-            self._mediainfo = MediaInfo.parse(decode(self.filename))
+            mediainfo = self._artifact(
+                ('mediainfo', self.filename),
+                lambda: MediaInfo.parse(decode(self.filename)))
         except Exception as e:  # pylint: disable=invalid-name, broad-except
             self.errors('Error in analyzing file.')
             self.errors(str(e))
@@ -53,18 +57,20 @@ class Mediainfo(BaseScraper):
             self._collect_elements()
             return
 
-        for index, track in enumerate(self._mediainfo.tracks):
+        # The parsed result is shared with the other scrapers, so the tracks
+        # are reordered in a copy: the first general track, then the audio
+        # and video tracks, and then the other tracks, in the original order
+        self._mediainfo = copy.copy(mediainfo)
+        tracks = list(mediainfo.tracks)
+        for index, track in enumerate(tracks):
             if track.track_type == 'General':
-                self._mediainfo.tracks.insert(
-                    0, self._mediainfo.tracks.pop(index))
+                tracks.insert(0, tracks.pop(index))
                 break
-
-        streamnr = 1
-        for index, track in enumerate(self._mediainfo.tracks[1:]):
-            if track.track_type in ['Audio', 'Video']:
-                self._mediainfo.tracks.insert(
-                    streamnr, self._mediainfo.tracks.pop(index + 1))
-                streamnr = streamnr + 1
+        self._mediainfo.tracks = tracks[:1] + [
+            track for track in tracks[1:]
+            if track.track_type in ['Audio', 'Video']] + [
+                track for track in tracks[1:]
+                if track.track_type not in ['Audio', 'Video']]
 
         truncated = False
         track_found = False
@@ -103,6 +109,7 @@ class Mediainfo(BaseScraper):
                         stream_type is None:
                     self._mediainfo_stream = stream
                     self._mediainfo_index = index
+                    self._stream_cache = {}
                     yield stream
                 index = index + 1
 
@@ -115,6 +122,7 @@ class Mediainfo(BaseScraper):
         if self._mediainfo is not None and self._mediainfo.tracks:
             self._mediainfo_stream = self._mediainfo.tracks[index]
             self._mediainfo_index = index
+            self._stream_cache = {}
 
     def _hascontainer(self):
         """Find out if file is a video container."""
@@ -140,6 +148,7 @@ class Mediainfo(BaseScraper):
         return None
 
     @metadata()
+    @stream_cached
     def _stream_type(self):
         """Return stream type."""
         if self._mediainfo is None:
@@ -0,0 +1,471 @@
+"""
+Pool of initialized LibreOffice user profiles for the Office scraper.
+
+Starting soffice with a new user profile creates and initializes the
+profile before the document is converted, which takes several seconds. The
+pool keeps the initialized profiles, so that the following conversions
+start with a ready profile. Each profile is used by one conversion at a
+time, because soffice started with a profile in use would hand the document
+over to the running instance. The profiles and the scratch directories of
+the converted files are kept on tmpfs, if /dev/shm is available.
+
+If pyuno is available, each profile also has a long-lived headless
+LibreOffice instance, which accepts the conversions over a UNO pipe, so
+that soffice is started only once for many documents. Otherwise, or if the
+instance can not be started, a new soffice process converts each document
+with the initialized profile.
+
+A profile is removed and created again after a given number of documents,
+and after a failed conversion, e.g. when soffice has crashed or has been
+stopped by a resource limit, so that a broken profile is not used again. A
+document, which LibreOffice can not read, does not reset the profile.
+"""
+import atexit
+import contextlib
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import uno
+except ImportError:
+    uno = None
+
+from six.moves.urllib.request import pathname2url
+
+from file_scraper.utils import _rlimit_command, _session_options
+
+DEFAULT_MAX_DOCUMENTS = 100
+TMPFS_DIR = '/dev/shm'
+OFFICE_STARTUP_TIMEOUT = 60  # Seconds to wait for the instance to connect
+# Limits, which can be applied to a long-lived instance. With other limits
+# each document is converted with a new soffice process.
+INSTANCE_LIMITS = ('timeout', 'memory')
+# PDF export filters for the document services
+PDF_FILTERS = [
+    ('com.sun.star.text.GenericTextDocument', 'writer_pdf_Export'),
+    ('com.sun.star.sheet.SpreadsheetDocument', 'calc_pdf_Export'),
+    ('com.sun.star.presentation.PresentationDocument', 'impress_pdf_Export'),
+    ('com.sun.star.drawing.DrawingDocument', 'draw_pdf_Export'),
+    ('com.sun.star.formula.FormulaProperties', 'math_pdf_Export')]
+
+
+class OfficeInstanceError(Exception):
+    """Raised, when the LibreOffice instance has died or was stopped."""
+
+
+class OfficeInstance(object):
+    """
+    Long-lived headless LibreOffice instance of one profile.
+
+    The instance is started with soffice --accept, and the documents are
+    loaded and exported to PDF over the UNO pipe with pyuno. The memory
+    limit is set for the instance, and the time limit is applied to each
+    conversion by killing the instance.
+    """
+
+    def __init__(self, profile, limits=None):
+        """
+        Initialize the instance.
+
+        :profile: OfficeProfile instance
+        :limits: Dict of resource limits, see run_command_limited(), or None
+        """
+        self.profile = profile
+        self.limits = limits or {}
+        self.pipe = 'file-scraper-office-%s' % uuid.uuid4().hex
+        self._process = None
+        self._pid = None
+        self._desktop = None
+        self._timed_out = False
+
+    @property
+    def alive(self):
+        """Return True if the instance of this process is running."""
+        return (self._process is not None and self._pid == os.getpid()
+                and self._process.poll() is None)
+
+    def command(self):
+        """
+        Return the command starting the instance.
+
+        :returns: Command as list
+        """
+        return ['soffice', '-env:UserInstallation=%s' % self.profile.url,
+                '--headless', '--invisible', '--nologo', '--nodefault',
+                '--norestore',
+                '--accept=pipe,name=%s;urp;StarOffice.ComponentContext' %
+                self.pipe]
+
+    def start(self):
+        """
+        Start the instance and wait until it accepts connections.
+
+        :returns: True if the instance was started, False otherwise
+        """
+        self.stop()
+        self._pid = os.getpid()
+        env = dict(os.environ, HOME=self.profile.home)
+        try:
+            with open(os.devnull, 'wb') as devnull:
+                self._process = subprocess.Popen(
+                    _rlimit_command(self.command(), {
+                        'memory': self.limits.get('memory')}),
+                    stdout=devnull, stderr=devnull, env=env,
+                    **_session_options())
+        except OSError:
+            self.stop()
+            return False
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.time() + OFFICE_STARTUP_TIMEOUT
+        while self.alive and time.time() < deadline:
+            try:
+                context = resolver.resolve(
+                    'uno:pipe,name=%s;urp;StarOffice.ComponentContext' %
+                    self.pipe)
+                self._desktop = context.ServiceManager.\
+                    createInstanceWithContext('com.sun.star.frame.Desktop',
+                                              context)
+                return True
+            except Exception:  # pylint: disable=broad-except
+                time.sleep(0.1)
+        self.stop()
+        return False
+
+    def _kill(self):
+        """Kill the instance with the processes it has started."""
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except OSError:
+            self._process.kill()
+
+    def _on_timeout(self):
+        """Kill the instance, when a conversion exceeds the time limit."""
+        self._timed_out = True
+        self._kill()
+
+    def stop(self):
+        """Stop the instance, if started by this process."""
+        if self.alive:
+            try:
+                self._desktop.terminate()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            self._kill()
+            self._process.wait()
+        self._process = None
+        self._desktop = None
+
+    def convert(self, filename):
+        """
+        Convert a file to PDF in the scratch directory of the profile.
+
+        The messages and errors are like the outputs of soffice
+        --convert-to.
+
+        :filename: File to convert
+        :returns: Tuple (messages, errors)
+        :raises: OfficeInstanceError if the instance died or was stopped
+                 after the time limit
+        """
+        target = os.path.join(self.profile.scratch, os.path.splitext(
+            os.path.basename(filename))[0] + '.pdf')
+        timer = None
+        if self.limits.get('timeout'):
+            timer = threading.Timer(self.limits['timeout'], self._on_timeout)
+            timer.daemon = True
+            timer.start()
+        try:
+            return self._convert(filename, target)
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    def _convert(self, filename, target):
+        """
+        Load a file and export it to PDF.
+
+        :filename: File to convert
+        :target: Path of the PDF file
+        :returns: Tuple (messages, errors)
+        :raises: OfficeInstanceError if the instance is not usable
+        """
+        try:
+            document = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(filename)), '_blank',
+                0, _properties(Hidden=True, ReadOnly=True, UpdateDocMode=0,
+                               MacroExecutionMode=0))
+        except Exception:  # pylint: disable=broad-except
+            document = None
+        if document is None:
+            self._check()
+            return ('', 'Error: source file could not be loaded\n')
+        try:
+            filters = [name for (service, name) in PDF_FILTERS
+                       if document.supportsService(service)]
+            if filters:
+                document.storeToURL(uno.systemPathToFileUrl(target),
+                                    _properties(FilterName=filters[0]))
+        except Exception:  # pylint: disable=broad-except
+            filters = None
+        finally:
+            try:
+                document.close(True)
+            except Exception:  # pylint: disable=broad-except
+                pass
+        self._check()
+        if filters is None:
+            return ('', 'Error: source file could not be converted\n')
+        if not filters:
+            return ('', 'Error: no export filter\n')
+        return ('convert %s -> %s using filter : %s\n' % (
+            os.path.abspath(filename), target, filters[0]), '')
+
+    def _check(self):
+        """
+        Check that the instance is still usable after a conversion.
+
+        :raises: OfficeInstanceError if the instance died or was stopped
+                 after the time limit, or the connection to it is lost
+        """
+        if self._timed_out:
+            raise OfficeInstanceError(
+                'soffice was stopped after the time limit of %s seconds.' %
+                self.limits['timeout'])
+        if not self.alive:
+            raise OfficeInstanceError(
+                'LibreOffice instance died during the conversion.')
+        try:
+            self._desktop.getCurrentComponent()
+        except Exception:  # pylint: disable=broad-except
+            raise OfficeInstanceError(
+                'Connection to the LibreOffice instance was lost.')
+
+
+def instance_limits(limits):
+    """
+    Return the limits of a LibreOffice instance, if it can be used.
+
+    :limits: Dict of resource limits of soffice, or None
+    :returns: Dict of the set limits, or None if pyuno is not available or
+              a limit can not be applied to an instance
+    """
+    limits = dict((key, value) for (key, value) in (limits or {}).items()
+                  if value)
+    if uno is None or set(limits) - set(INSTANCE_LIMITS):
+        return None
+    return limits
+
+
+def _properties(**values):
+    """
+    Return UNO property values.
+
+    :values: Values keyed with the property names
+    :returns: Tuple of com.sun.star.beans.PropertyValue structs
+    """
+    properties = []
+    for (name, value) in sorted(values.items()):
+        prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+class OfficeProfile(object):
+    """LibreOffice user profile and scratch directory of one conversion."""
+
+    def __init__(self, path):
+        """
+        Initialize profile.
+
+        :path: Directory of the profile, created if missing
+        """
+        self.path = path
+        self.home = os.path.join(path, 'home')
+        self.scratch = os.path.join(path, 'scratch')
+        self.documents = 0
+        self.failed = False
+        self._instance = None
+        self._no_instance = False
+        self.create()
+
+    @property
+    def url(self):
+        """Return the profile URL for the UserInstallation option."""
+        return 'file:' + pathname2url(os.path.join(self.path, 'user'))
+
+    def command(self, filename, target='pdf'):
+        """
+        Return the soffice command converting a file with this profile.
+
+        :filename: File to convert
+        :target: Target format of the conversion
+        :returns: Command as list
+        """
+        return ['soffice', '-env:UserInstallation=%s' % self.url,
+                '--headless', '--norestore', '--convert-to', target,
+                '--outdir', self.scratch, filename]
+
+    def instance(self, limits=None):
+        """
+        Return the running LibreOffice instance of the profile.
+
+        The instance is started, if it is not running. It is not used
+        without pyuno, with other limits than INSTANCE_LIMITS, or if it has
+        failed to start with this profile.
+
+        :limits: Dict of resource limits of soffice, or None
+        :returns: OfficeInstance, or None if the instance can not be used
+        """
+        limits = instance_limits(limits)
+        if limits is None or self._no_instance:
+            return None
+        if self._instance is None or not self._instance.alive or \
+                self._instance.limits != limits:
+            self.stop()
+            self._instance = OfficeInstance(self, limits)
+            if not self._instance.start():
+                self._instance = None
+                self._no_instance = True
+        return self._instance
+
+    def stop(self):
+        """Stop the LibreOffice instance of the profile."""
+        if self._instance is not None:
+            self._instance.stop()
+            self._instance = None
+
+    def create(self):
+        """Create the directories of the profile."""
+        for path in [self.home, self.scratch]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def clean(self):
+        """Remove the converted files from the scratch directory."""
+        for name in os.listdir(self.scratch):
+            path = os.path.join(self.scratch, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def reset(self):
+        """Stop the instance, remove the profile and create it again."""
+        self.stop()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.documents = 0
+        self.failed = False
+        self._no_instance = False
+        self.create()
+
+
+class OfficePool(object):
+    """
+    Pool of LibreOffice user profiles.
+
+    The profiles are created when needed, so there are as many profiles as
+    there have been conversions at the same time.
+    """
+
+    def __init__(self, max_documents=DEFAULT_MAX_DOCUMENTS, root=None):
+        """
+        Initialize pool.
+
+        :max_documents: Number of documents converted with a profile, before
+                        it is created again
+        :root: Directory of the profiles, by default a new directory on
+               tmpfs or in the default temporary directory
+        """
+        if root is None:
+            tmpfs = TMPFS_DIR if os.access(TMPFS_DIR, os.W_OK) else None
+            root = tempfile.mkdtemp(prefix='file-scraper-office-', dir=tmpfs)
+        self.root = root
+        self._pid = os.getpid()
+        self.max_documents = max_documents
+        self._lock = threading.Lock()
+        self._free = []
+        self._profiles = []
+
+    @contextlib.contextmanager
+    def profile(self):
+        """
+        Reserve a profile for a conversion.
+
+        Set the failed attribute of the profile, if the conversion failed.
+        The profile is reset after the failed conversion, or when it has
+        been used for max_documents conversions. The scratch directory is
+        emptied after each conversion.
+
+        :returns: Context manager giving OfficeProfile instance
+        """
+        with self._lock:
+            if self._free:
+                profile = self._free.pop()
+            else:
+                profile = OfficeProfile(os.path.join(
+                    self.root, 'profile-%d' % (len(self._profiles) + 1)))
+                self._profiles.append(profile)
+        try:
+            yield profile
+        except Exception:
+            profile.failed = True
+            raise
+        finally:
+            self._release(profile)
+
+    def _release(self, profile):
+        """
+        Return a profile to the pool.
+
+        :profile: OfficeProfile instance
+        """
+        profile.documents += 1
+        if profile.failed or profile.documents >= self.max_documents:
+            profile.reset()
+        else:
+            profile.clean()
+        with self._lock:
+            self._free.append(profile)
+
+    def close(self):
+        """
+        Stop the instances and remove the profiles, if the pool was created
+        in this process.
+        """
+        if self._pid == os.getpid():
+            for profile in self._profiles:
+                profile.stop()
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+_POOL_LOCK = threading.Lock()
+_POOL = {}
+
+
+def office_pool():
+    """
+    Return the profile pool of this process.
+
+    The pool is created at the first call. A forked child process creates a
+    pool of its own, so that the processes do not share the profiles.
+
+    :returns: OfficePool instance
+    """
+    with _POOL_LOCK:
+        pool = _POOL.get(os.getpid())
+        if pool is None:
+            _POOL.clear()
+            pool = OfficePool()
+            atexit.register(pool.close)
+            _POOL[os.getpid()] = pool
+        return pool
@@ -1,9 +1,13 @@
 """File metadata scraper."""
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from file_scraper.base import ArtifactStore
+from file_scraper.cache import KEY_ALGORITHM, RESULT_KEYS
 from file_scraper.iterator import iter_scrapers, iter_detectors
-from file_scraper.scrapers.jhove import Utf8JHove
-from file_scraper.scrapers.textfile import CheckTextFile
 from file_scraper.scrapers.dummy import FileExists
-from file_scraper.utils import (combine_metadata, hexdigest, ensure_str,
+from file_scraper.scrapers.textfile import CheckTextFile
+from file_scraper.utils import (combine_metadata, hexdigests, ensure_str,
                                 ensure_text)
 
 LOSE = [None, '(:unav)', '(:unap)']
@@ -29,6 +33,7 @@ class Scraper(object):
         self.info = None
         self._important = {}
         self._params = kwargs
+        self._checksums = {}
 
     def _identify(self):
         """Identify file format and version."""
@@ -50,11 +55,10 @@ class Scraper(object):
                     important['version'] is not None:
                 self.mimetype = important['version'][self.mimetype]
 
-    def _scrape_file(self, scraper):
-        """Scrape with the given scraper.
+    def _merge_results(self, scraper):
+        """Combine the results of an already run scraper.
         :scraper: Scraper instance
         """
-        scraper.scrape_file()
         self._important.update(scraper.importants())
         self.streams = combine_metadata(
             stream=self.streams, indexed_metadata=scraper.streams,
@@ -64,16 +68,21 @@ class Scraper(object):
             if self.well_formed in [None, True]:
                 self.well_formed = scraper.well_formed
 
-    def _check_utf8(self, check_wellformed):
+    def _utf8_scrapers(self, check_wellformed, params):
         """
         UTF-8 check only for UTF-8.
 
         We know the charset after actual scraping.
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :params: Parameters for the scraper
+        :returns: List of the scrapers for the check
         """
         if 'charset' in self.streams[0] and \
                 self.streams[0]['charset'] == 'UTF-8':
-            scraper = Utf8JHove(self.filename, self.mimetype, check_wellformed)
-            self._scrape_file(scraper)
+            from file_scraper.scrapers.jhove import Utf8JHove
+            return [Utf8JHove(self.filename, self.mimetype, check_wellformed,
+                              params)]
+        return []
 
     def _check_mimetype_version(self):
         """
@@ -91,31 +100,110 @@ class Scraper(object):
         else:
             self.streams[0]['version'] = self.version
 
-    def scrape(self, check_wellformed=True):
+    def scrape(self, check_wellformed=True, concurrent=False,
+               result_cache=None, checksums=None):
         """Scrape file and collect metadata.
         :check_wellformed: True, full scraping; False, skip well-formed check.
+        :concurrent: True, run the scrapers of the file in parallel threads;
+                     False, run the scrapers one after another.
+        :result_cache: ResultCache instance for storing and reusing the
+                       results of files with identical content, None to
+                       scrape always.
+        :checksums: List of checksum algorithms to be calculated during the
+                    scraping. The file is read only once for these and for
+                    the cache key, and the results are returned by
+                    checksum() and checksums() afterwards.
+        """
+        for scrapers in self._scrape_steps(check_wellformed, result_cache,
+                                           checksums):
+            if concurrent and len(scrapers) > 1:
+                _run_concurrently(scrapers)
+            else:
+                for scraper in scrapers:
+                    scraper.scrape_file()
+
+    def _scrape_steps(self, check_wellformed, result_cache, checksums):
+        """Scrape file as a generator of the scrapers to be run.
+
+        The generator yields lists of scraper instances, which must have
+        been run with scrape_file() before the generator is continued. Their
+        results are then combined in the given order. This way scrape() and
+        scrape_async() share the scraping, but run the scrapers differently.
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :result_cache: ResultCache instance, None to scrape always.
+        :checksums: List of checksum algorithms to be calculated.
         """
         self.streams = None
         self.info = {}
         self.well_formed = None
+        self._checksums = {}
 
         file_exists = FileExists(self.filename, None)
-        self._scrape_file(file_exists)
+        yield [file_exists]
+        self._merge_results(file_exists)
 
         if file_exists.well_formed is False:
             return
 
+        algorithms = list(checksums or [])
+        if result_cache is not None:
+            algorithms.append(KEY_ALGORITHM)
+        self.checksums(algorithms)
+
+        if result_cache is not None:
+            key = result_cache.key(self.filename, check_wellformed,
+                                   self._params,
+                                   digest=self._checksums[KEY_ALGORITHM])
+            result = result_cache.get(key)
+            if result is not None:
+                for attribute in RESULT_KEYS:
+                    setattr(self, attribute, result[attribute])
+                return
+
         self._identify()
-        for scraper_class in iter_scrapers(
+        params = dict(self._params, artifact_store=ArtifactStore())
+        scrapers = [
+            scraper_class(self.filename, self.mimetype, check_wellformed,
+                          params)
+            for scraper_class in iter_scrapers(
                 mimetype=self.mimetype, version=self.version,
-                check_wellformed=check_wellformed, params=self._params):
-            scraper = scraper_class(self.filename, self.mimetype,
-                                    check_wellformed, self._params)
-            self._scrape_file(scraper)
+                check_wellformed=check_wellformed, params=self._params)]
+        yield scrapers
+        for scraper in scrapers:
+            self._merge_results(scraper)
 
-        self._check_utf8(check_wellformed)
+        scrapers = self._utf8_scrapers(check_wellformed, params)
+        yield scrapers
+        for scraper in scrapers:
+            self._merge_results(scraper)
         self._check_mimetype_version()
 
+        if result_cache is not None:
+            result_cache.put(key, dict((attribute, getattr(self, attribute))
+                                       for attribute in RESULT_KEYS))
+
+    def scrape_async(self, check_wellformed=True, concurrent=False,
+                     result_cache=None, checksums=None, executor=None):
+        """Scrape file with the 3rd party tools as asyncio subprocesses.
+
+        Requires Python 3. The tools of several files can be run at the same
+        time from one event loop, e.g. with asyncio.gather(). See
+        file_scraper.aio for how the tools are run.
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :concurrent: True, run the scrapers of the file at the same time;
+                     False, run the scrapers one after another.
+        :result_cache: ResultCache instance, None to scrape always.
+        :checksums: List of checksum algorithms to be calculated.
+        :executor: concurrent.futures executor for a scraper, which can not be
+                   run with asyncio subprocesses, None for the default
+                   executor of the event loop
+        :returns: Coroutine
+        """
+        from file_scraper.aio import scrape_async  # Requires Python 3
+        return scrape_async(self, executor, check_wellformed=check_wellformed,
+                            concurrent=concurrent,
+                            result_cache=result_cache, checksums=checksums)
+
     def is_textfile(self):
         """Find out if file is a text file.
         :returns: True, if file is a text file, false otherwise
@@ -129,4 +217,94 @@ class Scraper(object):
         :algorithm: MD5 or SHA variant
         :returns: Calculated checksum
         """
-        return hexdigest(self.filename, algorithm)
+        return self.checksums([algorithm])[algorithm]
+
+    def checksums(self, algorithms):
+        """Return the checksums of the file with given algorithms.
+
+        All the checksums are calculated with one read pass. Checksums
+        already calculated for this file are not calculated again.
+        :algorithms: List of MD5 or SHA variants
+        :returns: Dict of calculated checksums, keyed with the algorithms
+        """
+        missing = [algorithm for algorithm in algorithms
+                   if algorithm not in self._checksums]
+        if missing:
+            self._checksums.update(hexdigests(self.filename, missing))
+        return dict((algorithm, self._checksums[algorithm])
+                    for algorithm in algorithms)
+
+
+def _run_scraper(scraper):
+    """Run the given scraper.
+    :scraper: Scraper instance
+    """
+    scraper.scrape_file()
+
+
+def _run_concurrently(scrapers):
+    """Run the given scrapers in threads.
+
+    :scrapers: List of scraper instances
+    """
+    pool = ThreadPool(len(scrapers))
+    try:
+        pool.map(_run_scraper, scrapers)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _init_worker():
+    """Load the detector signatures once when a worker process starts."""
+    from file_scraper.detectors import fido_engine
+    fido_engine()
+
+
+def _scrape_task(task):
+    """
+    Scrape one file in a worker process.
+
+    :task: Tuple (filename, check_wellformed, result_cache, checksums,
+           kwargs)
+    :returns: Scraper instance with the results
+    """
+    (filename, check_wellformed, result_cache, checksums, kwargs) = task
+    scraper = Scraper(filename, **kwargs)
+    scraper.scrape(check_wellformed=check_wellformed,
+                   result_cache=result_cache, checksums=checksums)
+    return scraper
+
+
+def scrape_many(filenames, workers=None, check_wellformed=True,
+                result_cache=None, checksums=None, **kwargs):
+    """
+    Scrape several files with a pool of worker processes.
+
+    The worker processes are kept alive for the whole batch, so the loaded
+    detector signatures are reused between files. Results are yielded in
+    the order the files are completed, not in the given order.
+
+    :filenames: Iterable of file paths
+    :workers: Number of worker processes, by default the number of CPUs.
+              With 1 the files are scraped in the calling process.
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :result_cache: ResultCache instance, None to scrape all files
+    :checksums: List of checksum algorithms to be calculated for each file
+    :kwargs: Extra arguments for certain scrapers
+    :returns: Generator of scraped Scraper instances
+    """
+    tasks = ((filename, check_wellformed, result_cache, checksums, kwargs)
+             for filename in filenames)
+    if workers == 1:
+        for task in tasks:
+            yield _scrape_task(task)
+        return
+
+    pool = multiprocessing.Pool(processes=workers, initializer=_init_worker)
+    try:
+        for scraper in pool.imap_unordered(_scrape_task, tasks):
+            yield scraper
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,9 +1,144 @@
 """Scraper for CSV file formats."""
+import codecs
+import collections
 import csv
+import io
+import itertools
+from operator import attrgetter, itemgetter
+
+import six
+from six.moves import map, zip  # pylint: disable=redefined-builtin
 
 from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata
 
+STREAM_BLOCK_SIZE = 1024 * 1024  # Read size in the streaming check
+
+
+def _ascii_compatible(charset):
+    """
+    Return True if the line breaks and CSV syntax are encoded as in ASCII.
+
+    :charset: Character encoding
+    :returns: True for e.g. UTF-8 and ISO-8859-15, False for e.g. UTF-16
+    """
+    try:
+        return codecs.encode(u'\r\n,;\t"', charset) == b'\r\n,;\t"'
+    except LookupError:
+        return False
+
+
+class _LineLocator(object):
+    """
+    Byte offsets of lines in a file.
+
+    The offsets are looked up only for the lines with errors, so the file is
+    read again only when the check has found an error. Lines are separated as
+    in Python universal newlines mode, i.e. with LF, CR or CR LF.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize locator.
+
+        :filename: File path
+        """
+        self._offsets = self._iter_offsets(filename)
+        self._line = 0
+        self._offset = 0
+
+    @staticmethod
+    def _iter_offsets(filename):
+        """
+        Generate byte offsets of the line starts.
+
+        :filename: File path
+        :returns: Generator of byte offsets, the first line starts at 0
+        """
+        offset = 0
+        with io.open(filename, 'rb') as infile:
+            for raw_line in infile:
+                for line in raw_line.splitlines(True):
+                    yield offset
+                    offset += len(line)
+        yield offset
+
+    def offset(self, line_num):
+        """
+        Return byte offset of the given line.
+
+        :line_num: Line number, counting from 1, not smaller than in the
+                   previous call
+        :returns: Byte offset
+        """
+        while self._line < line_num:
+            self._offset = next(self._offsets, self._offset)
+            self._line += 1
+        return self._offset
+
+    def close(self):
+        """Close the file."""
+        self._offsets.close()
+
+
+class _EncodingCheckReader(io.RawIOBase):
+    """Raw file reader, which checks the character encoding of the data."""
+
+    def __init__(self, rawfile, charset, error):
+        """
+        Initialize reader.
+
+        :rawfile: Binary file object to read
+        :charset: Character encoding
+        :error: Function called with the byte offset and the error message
+                for each encoding error
+        """
+        super(_EncodingCheckReader, self).__init__()
+        self._rawfile = rawfile
+        self._charset = charset
+        self._error = error
+        self._decoder = codecs.getincrementaldecoder(charset)()
+        self._offset = 0
+
+    def readable(self):
+        """Return True, the reader is readable."""
+        return True
+
+    def readinto(self, buf):
+        """
+        Read data to the given buffer and check its encoding.
+
+        :buf: Writable buffer
+        :returns: Number of bytes read
+        """
+        size = self._rawfile.readinto(buf)
+        self._check(bytes(buf[:size]), final=not size)
+        self._offset += size
+        return size
+
+    def _check(self, data, final):
+        """
+        Decode data to find the encoding errors.
+
+        :data: Next bytes of the file
+        :final: True if the end of file is reached
+        """
+        start = self._offset
+        while True:
+            # Bytes of an incomplete character left from the previous block
+            pending = self._decoder.getstate()[0]
+            try:
+                self._decoder.decode(data, final)
+                return
+            except UnicodeDecodeError as exception:
+                start = start - len(pending)
+                self._error(start + exception.start,
+                            "Invalid %s character: %s" % (
+                                self._charset, exception.reason))
+                self._decoder.reset()
+                data = exception.object[exception.end:]
+                start = start + exception.end
+
 
 class Csv(BaseScraper):
     """Scraper for CSV files."""
@@ -20,14 +155,19 @@ class Csv(BaseScraper):
         :mimetype: Predicted mimetype of the file
         :check_wellformed: True for the full well-formed check, False for just
                            detection and metadata scraping
-        :params: Extra parameters: delimiter and separator
+        :params: Extra parameters: delimiter, separator, fields, streaming,
+                 max_errors and charset
         """
         if params is None:
             params = {}
         self._csv_delimiter = params.get('delimiter', None)
         self._csv_separator = params.get('separator', None)
         self._csv_fields = params.get('fields', [])
+        self._csv_streaming = params.get('streaming', False)
+        self._csv_max_errors = params.get('max_errors', 1)
+        self._csv_charset = params.get('charset', 'UTF-8')
         self._csv_first_line = None
+        self._csv_errors = []  # (byte offset, error) in streaming check
         super(Csv, self).__init__(filename, mimetype, check_wellformed, params)
 
     def scrape_file(self):
@@ -38,6 +178,21 @@ class Csv(BaseScraper):
             return
         if self._csv_fields is None:
             self._csv_fields = []
+        if self._csv_streaming and not _ascii_compatible(self._csv_charset):
+            self.messages('Streaming check not supported for charset %s.'
+                          % self._csv_charset)
+            self._csv_streaming = False
+        try:
+            if self._csv_streaming:
+                self._check_streaming()
+            else:
+                self._check()
+        finally:
+            self._check_supported()
+            self._collect_elements()
+
+    def _check(self):
+        """Check CSV file with Python csv module, stop to the first error."""
         try:
             with open(self.filename, 'r') as csvfile:
                 reader = csv.reader(csvfile)
@@ -75,9 +230,127 @@ class Csv(BaseScraper):
             self.errors("Error reading file as CSV")
         else:
             self.messages("CSV file was checked successfully.")
-        finally:
-            self._check_supported()
-            self._collect_elements()
+
+    def _check_streaming(self):
+        """
+        Check CSV file in one pass with bounded memory.
+
+        The file is read in large binary blocks. Character encoding, quoting
+        and the field count of every record, compared to the given fields or
+        the header, are checked. Up to max_errors errors, or all errors if
+        max_errors is None, are collected with the line numbers and byte
+        offsets of the first lines of the records. The rows are handled by the C implementation of
+        the csv module, and Python code is run only for every block and
+        every error, not for every row.
+        """
+        with io.open(self.filename, 'rb') as rawfile:
+            if not self._csv_delimiter or not self._csv_separator:
+                # Line breaks normalized as in the universal newlines mode of
+                # the default check, so that CR is not sniffed as delimiter
+                sample = rawfile.read(1024).replace(
+                    b'\r\n', b'\n').replace(b'\r', b'\n')
+                if not six.PY2:
+                    sample = sample.decode(self._csv_charset, 'replace')
+                try:
+                    dialect = csv.Sniffer().sniff(sample)
+                except csv.Error as exception:
+                    self.errors("CSV error on line 0: %s" % exception)
+                    return
+                if not self._csv_delimiter:
+                    self._csv_delimiter = dialect.delimiter
+                if not self._csv_separator:
+                    self._csv_separator = dialect.lineterminator
+                rawfile.seek(0)
+
+            lines = io.BufferedReader(
+                _EncodingCheckReader(rawfile, self._csv_charset,
+                                     self._stream_error),
+                buffer_size=STREAM_BLOCK_SIZE)
+            if not six.PY2:
+                lines = io.TextIOWrapper(lines, encoding=self._csv_charset,
+                                         errors='replace', newline='')
+                # pylint: disable=protected-access
+                lines._CHUNK_SIZE = STREAM_BLOCK_SIZE
+            reader = csv.reader(lines, delimiter=self._csv_delimiter,
+                                lineterminator=self._csv_separator,
+                                strict=True, doublequote=True)
+            locator = _LineLocator(self.filename)
+            field_count = None
+            if self._csv_fields:
+                field_count = len(self._csv_fields)
+            position = 0
+            while self._csv_max_errors is None or \
+                    self._errors_before(position) < self._csv_max_errors:
+                # Line numbers at the ends of the last two records, so that
+                # the errors are located at the first line of the record
+                ends = collections.deque([reader.line_num], maxlen=2)
+                try:
+                    if self._csv_first_line is None:
+                        self._csv_first_line = next(reader, [])
+                        ends.append(reader.line_num)
+                        if field_count is None:
+                            field_count = len(self._csv_first_line)
+                        elif field_count != len(self._csv_first_line):
+                            self._stream_error(
+                                0, "CSV not well-formed: field counts in "
+                                "the given header parameter and the CSV "
+                                "header don't match")
+                    # Accepts empty lines and stops to the first record with
+                    # a wrong field count, or to the end of file. The line
+                    # numbers are stored after each record without running
+                    # Python code for the rows.
+                    counts = map(itemgetter(0), zip(
+                        map(len, reader),
+                        map(ends.append, map(attrgetter('line_num'),
+                                             itertools.repeat(reader)))))
+                    if all(map(frozenset([0, field_count]).__contains__,
+                               counts)):
+                        break
+                    line = ends[0] + 1
+                    position = locator.offset(line)
+                    self._stream_error(
+                        position,
+                        "CSV not well-formed: wrong field count on line %s, "
+                        "%s fields expected" % (line, field_count))
+                except csv.Error as exception:
+                    line = ends[-1] + 1
+                    position = locator.offset(line)
+                    self._stream_error(
+                        position,
+                        "CSV error on line %s: %s" % (line, exception))
+            locator.close()
+
+        for (offset, error) in sorted(
+                self._csv_errors)[:self._csv_max_errors]:
+            self.errors("%s (byte offset %s)." % (error, offset))
+        if self._csv_max_errors is not None and \
+                len(self._csv_errors) >= self._csv_max_errors:
+            self.messages("Check stopped after %s errors."
+                          % self._csv_max_errors)
+        elif not self._csv_errors:
+            self.messages("CSV file was checked successfully.")
+
+    def _errors_before(self, position):
+        """
+        Return the number of errors found up to the given byte offset.
+
+        The encoding errors are found when the blocks are read ahead of the
+        CSV parser, so the errors after the parsed position are not counted,
+        and the check does not stop before the earlier CSV errors are found.
+
+        :position: Byte offset parsed in the file
+        :returns: Number of errors
+        """
+        return sum(1 for (offset, _) in self._csv_errors if offset <= position)
+
+    def _stream_error(self, offset, error):
+        """
+        Collect error found in the streaming check.
+
+        :offset: Byte offset of the error in the file
+        :error: Error message
+        """
+        self._csv_errors.append((offset, error))
 
     @metadata()
     def _version(self):
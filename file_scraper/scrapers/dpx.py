@@ -1,5 +1,5 @@
 """DPX V2.0 scraper."""
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 
@@ -15,9 +15,9 @@ class Dpx(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        shell = Shell(['dpxv', self.filename])
+        shell = self._tool_shell(['dpxv', self.filename])
 
-        if shell.returncode != 0:
+        if shell.returncode != 0 and shell.limit_error is None:
             raise DPXvError(ensure_str(shell.stderr))
 
         self.errors(ensure_str(shell.stderr))
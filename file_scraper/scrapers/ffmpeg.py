@@ -1,5 +1,5 @@
 """FFMpeg wellformed scraper."""
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 
@@ -21,8 +21,8 @@ class FFMpegWellformed(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        shell = Shell(['ffmpeg', '-v', 'error', '-i', self.filename, '-f',
-                       'null', '-'])
+        shell = self._tool_shell(['ffmpeg', '-v', 'error', '-i',
+                                  self.filename, '-f', 'null', '-'])
 
         if shell.returncode == 0:
             self.messages('The file was analyzed successfully.')
@@ -1,6 +1,6 @@
 """PDF scraper implemented with ghostscript."""
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata
 
 
@@ -18,7 +18,7 @@ class GhostScript(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        shell = Shell([
+        shell = self._tool_shell([
             'gs', '-o', '/dev/null', '-sDEVICE=nullpage',
             self.filename])
 
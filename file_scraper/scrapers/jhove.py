@@ -5,11 +5,9 @@ try:
 except ImportError:
     pass
 
-from file_scraper.jhove_base import JHove
+from file_scraper.jhove_base import JHove, jhove_xpath
 from file_scraper.utils import metadata
 
-NAMESPACES = {'j': 'http://hul.harvard.edu/ois/xml/ns/jhove'}
-
 
 class GifJHove(JHove):
     """JHove GIF file format scraper."""
@@ -29,8 +27,9 @@ class GifJHove(JHove):
         or '1989a' is used. Hence '19' is prepended to the version returned by
         Jhove
         """
-        if self.report_field("version"):
-            return '19' + self.report_field("version")
+        version = self.report_field("version")
+        if version:
+            return '19' + version
         return None
 
     @metadata()
@@ -47,6 +46,7 @@ class HtmlJHove(JHove):
                   'application/xhtml+xml': ['1.0', '1.1']}
     _only_wellformed = True  # Only well-formed check
     _jhove_module = 'HTML-hul'  # JHove module
+    _keep_report = True  # Charset is queried from the report
 
     @metadata()
     def _version(self):
@@ -64,7 +64,7 @@ class HtmlJHove(JHove):
     def _get_charset_html(self):
         """Get the charset from the JHove report for HTML files."""
         query = '//j:property[j:name="Content"]//j:value/text()'
-        results = self._report.xpath(query, namespaces=NAMESPACES)
+        results = jhove_xpath(query)(self._report)
         try:
             result_mimetype = mimeparse.parse_mime_type(results[0])
             params = result_mimetype[2]
@@ -77,7 +77,7 @@ class HtmlJHove(JHove):
     def _get_charset_xml(self):
         """Get the charset from the JHove report for XHTML files."""
         query = '//j:property[j:name="Encoding"]//j:value/text()'
-        results = self._report.xpath(query, namespaces=NAMESPACES)
+        results = jhove_xpath(query)(self._report)
         try:
             return results[0]
         except IndexError:
@@ -222,9 +222,9 @@ class WavJHove(JHove):
         If the MIME type is a WAV type, audio/vnd.wave is returned, otherwise
         the same method from the superclass is called.
         """
-        if self.report_field('mimeType') is not None and \
-                (self.report_field('mimeType').split(';')[0]
-                 == 'audio/vnd.wave'):
+        mimetype = self.report_field('mimeType')
+        if mimetype is not None and \
+                mimetype.split(';')[0] == 'audio/vnd.wave':
             return 'audio/x-wav'
 
         return super(WavJHove, self)._mimetype()
@@ -237,11 +237,12 @@ class WavJHove(JHove):
         Set version as '2' if profile is BWF, otherwise we don't know.
         For now, we don't accept RF64.
         """
-        if self.report_field('profile') is None:
+        profile = self.report_field('profile')
+        if profile is None:
             return None
-        if 'RF64' in self.report_field('profile'):
+        if 'RF64' in profile:
             self.errors('RF64 is not a supported format')
-        elif 'BWF' in self.report_field('profile'):
+        elif 'BWF' in profile:
             return '2'
 
         return None
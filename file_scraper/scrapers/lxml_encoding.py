@@ -8,6 +8,7 @@ except ImportError:
 from io import open
 from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata
+from file_scraper.xml_base import parse_xml, scan_xml
 
 
 class XmlEncoding(BaseScraper):
@@ -61,15 +62,38 @@ class XmlEncoding(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        parser = etree.XMLParser(dtd_validation=False, no_network=True,
-                                 recover=True)
-        file_ = open(self.filename, 'rb')
-        tree = etree.parse(file_, parser)
-        self.charset = tree.docinfo.encoding
+        if self._params.get('streaming', False) and \
+                self.mimetype == 'text/xml':
+            # Read in the streaming well-formed check shared with Xmllint
+            self.charset = self._artifact(
+                ('xml_scan', self.filename),
+                lambda: scan_xml(self.filename))['encoding']
+        else:
+            self.charset = self._parse().docinfo.encoding
         self.messages('Encoding metadata found.')
         self._check_supported()
         self._collect_elements()
 
+    def _parse(self):
+        """
+        Parse the file.
+
+        The tree of a well-formed XML file is shared with Xmllint. Other
+        files are parsed in the recover mode.
+
+        :returns: Parsed document tree
+        """
+        if self.mimetype == 'text/xml':
+            try:
+                return self._artifact(('xml_tree', self.filename),
+                                      lambda: parse_xml(self.filename))
+            except etree.XMLSyntaxError:
+                pass
+        parser = etree.XMLParser(dtd_validation=False, no_network=True,
+                                 recover=True)
+        with open(self.filename, 'rb') as file_:
+            return etree.parse(file_, parser)
+
     @metadata()
     def _charset(self):
         """Return charset."""
@@ -1,7 +1,8 @@
 """Office file scraper."""
 import tempfile
 import shutil
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
+from file_scraper.office_pool import OfficeInstanceError, office_pool
 from file_scraper.utils import metadata, ensure_str
 
 
@@ -35,10 +36,13 @@ class Office(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
+        if self._params.get('office_pool', False):
+            self._convert_pooled()
+            return
         temp_dir = tempfile.mkdtemp()
         try:
             env = {'HOME': temp_dir}
-            shell = Shell([
+            shell = self._tool_shell([
                 'soffice', '--convert-to', 'pdf', '--outdir', temp_dir,
                 self.filename], env=env)
             self.errors(ensure_str(shell.stderr))
@@ -50,6 +54,39 @@ class Office(BaseScraper):
             self._check_supported()
             self._collect_elements()
 
+    def _convert_pooled(self):
+        """
+        Convert the file with a profile from the LibreOffice pool.
+
+        The file is converted in the LibreOffice instance of the profile, if
+        it can be used, and with a new soffice process otherwise. The
+        profile is reset, if soffice crashed or exceeded a limit. The
+        profiles are reserved for the whole conversion, so the asyncio
+        backend runs this in an executor thread.
+        """
+        self._blocking_call()
+        try:
+            with office_pool().profile() as profile:
+                instance = profile.instance(self._tool_limits('soffice'))
+                if instance is not None:
+                    (messages, errors) = instance.convert(self.filename)
+                    self.errors(errors)
+                    self.messages(messages)
+                else:
+                    shell = self._tool_shell(profile.command(self.filename),
+                                             env={'HOME': profile.home})
+                    profile.failed = (shell.returncode < 0 or
+                                      shell.limit_error is not None)
+                    self.errors(ensure_str(shell.stderr))
+                    self.messages(ensure_str(shell.stdout))
+        except OfficeInstanceError as exception:
+            self.errors(str(exception))
+        except Exception:  # pylint: disable=broad-except
+            self.errors('Error reading file.')
+        finally:
+            self._check_supported()
+            self._collect_elements()
+
     @metadata()
     def _stream_type(self):
         """Return file type."""
@@ -1,6 +1,6 @@
 """Module for pngcheck scraper."""
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 
@@ -21,7 +21,7 @@ class Pngcheck(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        shell = Shell(['pngcheck', self.filename])
+        shell = self._tool_shell(['pngcheck', self.filename])
 
         if shell.returncode != 0:
             self.errors("Failed: returncode %s" % shell.returncode)
@@ -4,7 +4,7 @@ import os
 import shutil
 import tempfile
 from io import open
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 PSPP_PATH = '/usr/bin/pspp-convert'
@@ -37,7 +37,7 @@ class Pspp(BaseScraper):
         temp_file = os.path.join(temp_dir, 'converted.por')
 
         try:
-            shell = Shell([
+            shell = self._tool_shell([
                 PSPP_PATH,
                 self.filename,
                 temp_file
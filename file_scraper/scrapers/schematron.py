@@ -1,10 +1,54 @@
 """Schematron scraper."""
+import fcntl
 import os
-import shutil
 import tempfile
+import threading
 import lxml.etree as etree
 from file_scraper.utils import hexdigest, metadata, ensure_str
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import ArtifactStore, BaseScraper, concat
+
+SCHEMATRON_CACHE_SIZE = 32  # Compiled validators kept in memory
+SCHEMATRON_DISK_CACHE_SIZE = 256 * 1024 * 1024  # Bytes of compiled files
+
+SVRL = '{http://purl.oclc.org/dsdl/svrl}'
+
+# Attributes identifying the duplicates of the SVRL elements
+DUPLICATE_KEYS = {
+    SVRL + 'active-pattern': 'id',
+    SVRL + 'fired-rule': 'context'
+}
+
+# Compiled stylesheets of the compilation phases and the compiled validators,
+# shared by all Schematron instances of the process
+_PHASES = ArtifactStore(max_size=SCHEMATRON_CACHE_SIZE)
+_VALIDATORS = ArtifactStore(max_size=SCHEMATRON_CACHE_SIZE)
+
+
+def _compiled_xslt(path):
+    """
+    Compile an XSLT file to be stored in the shared stores.
+
+    The results are read from the error log of the XSLT instance, so the
+    instance must not be used by several threads at once.
+
+    :path: XSLT file path
+    :returns: Tuple of lxml.etree.XSLT instance and lock for using it
+    """
+    return (etree.XSLT(etree.parse(path)), threading.Lock())
+
+
+def _use_cached(xslt_filename):
+    """
+    Mark a compiled file in the cache directory as recently used.
+
+    :xslt_filename: XSLT file name
+    :returns: True if the file exists in the cache, False otherwise
+    """
+    try:
+        os.utime(xslt_filename, None)
+    except OSError:
+        return False
+    return True
 
 
 class Schematron(BaseScraper):
@@ -30,8 +74,8 @@ class Schematron(BaseScraper):
         self._cache = params.get('cache', True)
         self._cachepath = os.path.expanduser(
             '~/.file-scraper/schematron-cache')
+        self._cache_size = SCHEMATRON_DISK_CACHE_SIZE
         self._schematron_dirname = '/usr/share/iso_schematron_xslt1'
-        self._returncode = None
         self._schematron_file = params.get('schematron', None)
         self._extra_hash = params.get('extra_hash', None)
         super(Schematron, self).__init__(filename, mimetype,
@@ -65,8 +109,7 @@ class Schematron(BaseScraper):
         if not self._check_wellformed:
             return None
         if not self.errors() and self.messages():
-            if self.messages().find('<svrl:failed-assert ') < 0 \
-                    and self._returncode == 0:
+            if self.messages().find('<svrl:failed-assert ') < 0:
                 return True
         return False
 
@@ -77,27 +120,65 @@ class Schematron(BaseScraper):
             self._collect_elements()
             return
 
-        if self._schematron_file is None:
+        schematron_files = self._schematron_files()
+        if not schematron_files:
             self.errors('Schematron file missing from parameters.')
             self._collect_elements()
             return
 
-        xslt_filename = self._compile_schematron()
-
-        shell = self._compile_phase(
-            stylesheet=xslt_filename,
-            inputfile=self.filename, allowed_codes=[0, 6])
-
-        self._returncode = shell.returncode
-        self.errors(ensure_str(shell.stderr))
+        validators = [(schematron_file, self._validator(schematron_file))
+                      for schematron_file in schematron_files]
+        try:
+            # Parse as xsltproc does, with DTD attribute defaults
+            document = etree.parse(self.filename, etree.XMLParser(
+                load_dtd=True, attribute_defaults=True))
+        except etree.XMLSyntaxError as exception:
+            self.errors(str(exception))
+            self._check_supported()
+            self._collect_elements()
+            return
 
-        if not self._verbose and shell.returncode == 0:
-            self.messages(
-                ensure_str(self._filter_duplicate_elements(shell.stdout)))
-        else:
-            self.messages(ensure_str(shell.stdout))
+        # The same document tree is validated with all the rule sets
+        results = []
+        for (schematron_file, (validator, lock)) in validators:
+            # The error log of the validator is shared by the threads
+            with lock:
+                try:
+                    result = validator(document)
+                except etree.XSLTApplyError as exception:
+                    raise SchematronValidatorError(
+                        "Error in validation: %s\n%s" % (
+                            exception, validator.error_log))
+                errors = [entry.message for entry in validator.error_log]
+            if not self._verbose:
+                output = ensure_str(
+                    self._filter_duplicate_elements(result.getroot()))
+            else:
+                output = ensure_str(bytes(result))
+            for error in errors:
+                self.errors(error)
+            self.messages(output)
+            results.append({
+                'schematron': schematron_file,
+                'messages': output,
+                'errors': concat(errors, 'ERROR: '),
+                'well_formed': not errors and
+                               output.find('<svrl:failed-assert ') < 0})
         self._check_supported()
         self._collect_elements()
+        self.info['schematron'] = results
+
+    def _schematron_files(self):
+        """
+        Return the given schematron files.
+
+        :returns: List of schematron file paths
+        """
+        if self._schematron_file is None:
+            return []
+        if isinstance(self._schematron_file, (list, tuple)):
+            return list(self._schematron_file)
+        return [self._schematron_file]
 
     @metadata()
     def _stream_type(self):
@@ -105,107 +186,173 @@ class Schematron(BaseScraper):
         return 'text'
 
     # pylint: disable=no-self-use
-    def _filter_duplicate_elements(self, result):
+    def _filter_duplicate_elements(self, root):
         """
         Filter duplicate elements from the result.
 
-        :result: Result as string
-        """
-        svrl = {'svrl': 'http://purl.oclc.org/dsdl/svrl'}
-        root = etree.fromstring(result)
-        patterns = root.xpath('./svrl:active-pattern', namespaces=svrl)
-        for pattern in patterns:
-            prev = pattern.xpath('preceding-sibling::svrl:active-pattern[1]',
-                                 namespaces=svrl)
-            if prev and pattern.get('id') == prev[0].get('id'):
-                pattern.getparent().remove(pattern)
+        Active patterns with the same id as the previous active pattern, and
+        fired rules with the same context as the previous fired rule are
+        removed in one pass over the children of the root element.
 
-        rules = root.xpath('svrl:fired-rule', namespaces=svrl)
-        for rule in rules:
-            prev = rule.xpath('preceding-sibling::svrl:fired-rule[1]',
-                              namespaces=svrl)
-            if prev and rule.get('context') == prev[0].get('context'):
-                rule.getparent().remove(rule)
+        :root: Root element of the SVRL result, modified in place
+        :returns: Filtered result as string
+        """
+        previous = {}
+        duplicates = []
+        for element in root:
+            attribute = DUPLICATE_KEYS.get(element.tag)
+            if attribute is None:
+                continue
+            value = element.get(attribute)
+            if element.tag in previous and previous[element.tag] == value:
+                duplicates.append(element)
+            previous[element.tag] = value
+        for element in duplicates:
+            root.remove(element)
 
         return etree.tostring(
             root, pretty_print=True, xml_declaration=False,
             encoding='UTF-8', with_comments=True)
 
-    # pylint: disable=too-many-arguments
-    def _compile_phase(self, stylesheet, inputfile, allowed_codes,
-                       outputfile=None, outputfilter=False):
+    def _compile_phase(self, stylesheet, document, outputfilter=False):
         """
         Compile one phase.
 
-        :stylesheet: XSLT file to used in the conversion
-        :inputfile: Input document filename
-        :outputfile: Filename of the resulted document, stdout if None
+        :stylesheet: XSLT file used in the conversion
+        :document: Input document as ElementTree
         :outputfilter: Use outputfilter parameter with value only_messages
-        :return: Shell instance
+        :returns: Resulted document as ElementTree
         """
-        cmd = ['xsltproc']
-        if outputfile:
-            cmd = cmd + ['-o', outputfile]
+        path = os.path.join(self._schematron_dirname, stylesheet)
+        (transform, lock) = _PHASES.get(path, lambda: _compiled_xslt(path))
+        params = {}
         if outputfilter and not self._verbose:
-            cmd = cmd + ['--stringparam', 'outputfilter', 'only_messages']
-        cmd = cmd + [os.path.join(self._schematron_dirname, stylesheet),
-                     inputfile]
-        shell = Shell(cmd)
-        if shell.returncode not in allowed_codes:
-            raise SchematronValidatorError(
-                "Error %s\nstdout:\n%s\nstderr:\n%s" % (
-                    shell.returncode, ensure_str(shell.stdout),
-                    ensure_str(shell.stderr)))
-        return shell
-
-    def _compile_schematron(self):
+            params['outputfilter'] = etree.XSLT.strparam('only_messages')
+        with lock:
+            try:
+                return transform(document, **params)
+            except etree.XSLTApplyError as exception:
+                raise SchematronValidatorError(
+                    "Error in %s: %s\n%s" % (stylesheet, exception,
+                                             transform.error_log))
+
+    def _compile_schematron(self, schematron_file):
         """
         Compile a schematron file.
 
+        The phases are run in-process, and the resulted validator is stored
+        to the cache directory.
+
+        :schematron_file: Schematron file path
         :returns: XSLT file name
         """
-        xslt_filename = self._generate_xslt_filename()
-        tempdir = tempfile.mkdtemp()
+        xslt_filename = self._generate_xslt_filename(schematron_file)
+        if self._cache and _use_cached(xslt_filename):
+            return xslt_filename
+
+        # Only one process compiles the file, and the others wait for it
+        with open(xslt_filename + '.lock', 'ab') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                if not self._cache or not _use_cached(xslt_filename):
+                    self._compile_to_file(schematron_file, xslt_filename)
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+        self._evict_cache(keep=xslt_filename)
+
+        return xslt_filename
+
+    def _compile_to_file(self, schematron_file, xslt_filename):
+        """
+        Compile a schematron file to the given XSLT file.
 
-        if self._cache:
-            if os.path.isfile(xslt_filename):
-                return xslt_filename
+        The file is written with a temporary name and renamed, so that the
+        other processes never see a partially written file.
 
+        :schematron_file: Schematron file path
+        :xslt_filename: XSLT file name
+        """
+        try:
+            document = etree.parse(schematron_file)
+        except etree.XMLSyntaxError as exception:
+            raise SchematronValidatorError(
+                "Error in %s: %s" % (schematron_file, exception))
+        document = self._compile_phase(
+            stylesheet='iso_dsdl_include.xsl', document=document)
+        document = self._compile_phase(
+            stylesheet='iso_abstract_expand.xsl', document=document)
+        document = self._compile_phase(
+            stylesheet='optimize_schematron.xsl', document=document)
+        document = self._compile_phase(
+            stylesheet='iso_svrl_for_xslt1.xsl', document=document,
+            outputfilter=True)
+
+        (handle, tempname) = tempfile.mkstemp(
+            dir=self._cachepath, prefix='.tmp.', suffix='.xsl')
         try:
-            self._compile_phase(
-                stylesheet='iso_dsdl_include.xsl',
-                inputfile=self._schematron_file,
-                outputfile=os.path.join(tempdir, 'step1.xsl'),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet='iso_abstract_expand.xsl',
-                inputfile=os.path.join(tempdir, 'step1.xsl'),
-                outputfile=os.path.join(tempdir, 'step2.xsl'),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet='optimize_schematron.xsl',
-                inputfile=os.path.join(tempdir, 'step2.xsl'),
-                outputfile=os.path.join(tempdir, 'step3.xsl'),
-                allowed_codes=[0])
-            self._compile_phase(
-                stylesheet='iso_svrl_for_xslt1.xsl',
-                inputfile=os.path.join(tempdir, 'step3.xsl'),
-                outputfile=os.path.join(tempdir, 'validator.xsl'),
-                outputfilter=not (self._verbose),
-                allowed_codes=[0])
-
-            shutil.move(os.path.join(tempdir, 'validator.xsl'),
-                        xslt_filename)
-
-        finally:
-            shutil.rmtree(tempdir)
+            with os.fdopen(handle, 'wb') as outfile:
+                outfile.write(etree.tostring(document))
+            os.rename(tempname, xslt_filename)
+        except Exception:
+            os.remove(tempname)
+            raise
+
+    def _evict_cache(self, keep):
+        """
+        Remove least recently used files from the cache directory.
 
-        return xslt_filename
+        Files are removed until the compiled files fit in the cache size.
 
-    def _generate_xslt_filename(self):
+        :keep: XSLT file name, which is not removed
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self._cachepath):
+            if not name.endswith('.validator.xsl'):
+                continue
+            path = os.path.join(self._cachepath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+            total += stat.st_size
+        for (_, path, size) in sorted(entries):
+            if total <= self._cache_size:
+                break
+            if path == keep:
+                continue
+            for filename in [path, path + '.lock']:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            total -= size
+
+    def _validator(self, schematron_file):
+        """
+        Return the compiled validator of a schematron file.
+
+        The validators are kept in memory, keyed with the XSLT file name,
+        which contains the digest of the schematron file and the extra
+        hash. Without cache, the validator is always compiled again.
+
+        :schematron_file: Schematron file path
+        :returns: Tuple of validator as lxml.etree.XSLT instance and lock
+                  for validating with it
+        """
+        if not self._cache:
+            return _compiled_xslt(self._compile_schematron(schematron_file))
+        return _VALIDATORS.get(
+            self._generate_xslt_filename(schematron_file),
+            lambda: _compiled_xslt(
+                self._compile_schematron(schematron_file)))
+
+    def _generate_xslt_filename(self, schematron_file):
         """
         Generate XSLT filename from schematron file.
 
+        :schematron_file: Schematron file path
         :returns: XSLT filename
         """
         try:
@@ -218,8 +365,8 @@ class Schematron(BaseScraper):
             extra = 'verbose'
         if self._extra_hash is not None:
             extra = "%s%s" % (extra, self._extra_hash)
-        schema_digest = hexdigest(self._schematron_file, extra_hash=extra)
-        schema_basename = os.path.basename(self._schematron_file)
+        schema_digest = hexdigest(schematron_file, extra_hash=extra)
+        schema_basename = os.path.basename(schematron_file)
 
         return os.path.join(self._cachepath, '%s.%s.validator.xsl' % (
             schema_basename, schema_digest))
@@ -1,5 +1,5 @@
 """Module for checking if the file is uitable as text file or not."""
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 FILECMD_PATH = "/opt/file-5.30/bin/file"
@@ -20,7 +20,7 @@ class CheckTextFile(BaseScraper):
 
         :returns: file mimetype
         """
-        shell = Shell([
+        shell = self._tool_shell([
             FILECMD_PATH, '-be', 'soft', '--mime-type',
             self.filename], env=ENV)
 
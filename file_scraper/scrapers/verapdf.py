@@ -5,7 +5,7 @@ try:
 except ImportError:
     pass
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 VERAPDF_PATH = '/usr/share/java/verapdf/verapdf'
@@ -32,8 +32,8 @@ class VeraPdf(BaseScraper):
             return
         cmd = [VERAPDF_PATH, self.filename]
 
-        shell = Shell(cmd)
-        if shell.returncode != 0:
+        shell = self._tool_shell(cmd)
+        if shell.returncode != 0 and shell.limit_error is None:
             raise VeraPDFError(ensure_str(shell.stderr))
         self.messages(ensure_str(shell.stdout))
 
@@ -1,6 +1,6 @@
 """A HTML5 scraper module using The Nu Html Checker."""
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 from file_scraper.utils import metadata, ensure_str
 
 VNU_PATH = "/usr/share/java/vnu/vnu.jar"
@@ -18,7 +18,7 @@ class Vnu(BaseScraper):
             self.messages('Skipping scraper: Well-formed check not used.')
             self._collect_elements()
             return
-        shell = Shell([
+        shell = self._tool_shell([
             'java', '-jar', VNU_PATH, '--verbose',
             self.filename])
         self.errors(ensure_str(shell.stderr))
@@ -4,7 +4,7 @@ import gzip
 import tempfile
 from io import open
 from file_scraper.utils import sanitize_string, metadata, ensure_str
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import BaseScraper
 
 
 class GzipWarctools(BaseScraper):
@@ -75,7 +75,7 @@ class WarcWarctools(BaseScraper):
         size = os.path.getsize(self.filename)
         if size == 0:
             self.errors('Empty file.')
-        shell = Shell(['warcvalid', self.filename])
+        shell = self._tool_shell(['warcvalid', self.filename])
 
         if shell.returncode != 0:
             self.errors("Failed: returncode %s" % shell.returncode)
@@ -142,8 +142,8 @@ class ArcWarctools(BaseScraper):
             self.errors('Empty file.')
         with tempfile.NamedTemporaryFile(prefix="scraper-warctools.") \
                 as warcfile:
-            shell = Shell(command=['arc2warc', self.filename],
-                          output_file=warcfile)
+            shell = self._tool_shell(command=['arc2warc', self.filename],
+                                     output_file=warcfile)
 
             if shell.returncode != 0:
                 self.errors("Failed: returncode %s" %
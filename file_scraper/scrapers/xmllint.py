@@ -2,18 +2,33 @@
 
 import os
 import tempfile
+import threading
 
 try:
     from lxml import etree
 except ImportError:
     pass
 
-from io import open
 from file_scraper.utils import ensure_str, metadata
 
-from file_scraper.base import BaseScraper, Shell
+from file_scraper.base import ArtifactStore, BaseScraper
+from file_scraper.xml_base import (XSI, find_schema_locations, parse_xml,
+                                   scan_xml)
+
+XSD_CACHE_SIZE = 16  # Compiled schemas kept in memory
+
+# Compiled XSD schemas shared by all Xmllint instances of the process
+_SCHEMAS = ArtifactStore(max_size=XSD_CACHE_SIZE)
+
+# Names of the libxml2 error domains as printed by xmllint
+ERROR_DOMAINS = {
+    'PARSER': 'parser',
+    'NAMESPACE': 'namespace',
+    'IO': 'I/O',
+    'SCHEMASP': 'Schemas parser',
+    'SCHEMASV': 'Schemas validity'
+}
 
-XSI = 'http://www.w3.org/2001/XMLSchema-instance'
 XS = '{http://www.w3.org/2001/XMLSchema}'
 
 SCHEMA_TEMPLATE = b"""<?xml version = "1.0" encoding = "UTF-8"?>
@@ -27,6 +42,96 @@ attributeFormDefault="unqualified">
 </xs:schema>"""
 
 
+def _file_state(path):
+    """
+    Return modification time and size of the given file.
+
+    :path: File path
+    :returns: Tuple (modification time, size), or None if the file does not
+              exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def _schema_files(locations):
+    """
+    Return the states of the local schema files used by the given schemas.
+
+    The schemas included, imported and redefined in the local schema files
+    are followed recursively. Remote schemas and schemas resolved with XML
+    catalogs are not local files, and they are not included.
+
+    :locations: Schema locations of the top level schemas
+    :returns: Tuple of (absolute path, file state) tuples, see _file_state()
+    """
+    states = {}
+    pending = list(locations)
+    while pending:
+        path = pending.pop()
+        if '://' in path or _file_state(path) is None:
+            continue
+        path = os.path.abspath(path)
+        if path in states:
+            continue
+        states[path] = _file_state(path)
+        try:
+            tree = etree.parse(path, etree.XMLParser(no_network=True))
+        except (etree.XMLSyntaxError, IOError):
+            continue
+        for element in tree.iter(XS + 'include', XS + 'import',
+                                 XS + 'redefine'):
+            location = element.get('schemaLocation')
+            if location:
+                pending.append(os.path.join(os.path.dirname(path), location))
+    return tuple(sorted(states.items()))
+
+
+def _up_to_date(compiled):
+    """
+    Return True if the local schema files of a compiled schema are unchanged.
+
+    :compiled: Compiled schema from the schema cache, see _compiled()
+    :returns: True if the schema can be used, False if it must be compiled
+              again
+    """
+    return all(_file_state(path) == state for (path, state) in compiled[3])
+
+
+def _compiled(schema, files):
+    """
+    Return compiled schema to be stored in the schema cache.
+
+    :schema: Compiled XMLSchema
+    :files: States of the local schema files, see _schema_files()
+    :returns: Tuple of the schema, lock for validating with it, the
+              warnings of the compilation as list of lines and the states
+              of the local schema files
+    """
+    return (schema, threading.Lock(), format_error_log(schema.error_log),
+            files)
+
+
+def format_error_log(error_log):
+    """
+    Format the errors logged by lxml as in the output of xmllint.
+
+    :error_log: lxml error log
+    :returns: List of error lines
+    """
+    lines = []
+    for entry in error_log:
+        level = 'warning' if entry.level_name == 'WARNING' else 'error'
+        lines.append('%s:%s: %s %s : %s' % (
+            entry.filename, entry.line,
+            ERROR_DOMAINS.get(entry.domain_name, entry.domain_name), level,
+            entry.message))
+    return lines
+
+
 class Xmllint(BaseScraper):
     """
     Xmllint scraper class.
@@ -57,6 +162,7 @@ class Xmllint(BaseScraper):
         self._catalogs = params.get('catalogs', True)
         self._no_network = params.get('no_network', True)
         self._catalog_path = params.get('catalog_path', None)
+        self._streaming = params.get('streaming', False)
         super(Xmllint, self).__init__(filename, mimetype, check_wellformed,
                                       params)
 
@@ -108,11 +214,8 @@ class Xmllint(BaseScraper):
             return
         # Try to check syntax by opening file in XML parser
         try:
-            file_ = open(self.filename, 'rb')
-            parser = etree.XMLParser(dtd_validation=False, no_network=True)
-            tree = etree.parse(file_, parser=parser)
-            self.version = tree.docinfo.xml_version
-            file_.close()
+            (tree, header) = self._parse()
+            self.version = header['version']
         except etree.XMLSyntaxError as exception:
             self.errors("Failed: document is not well-formed.")
             self.errors(str(exception))
@@ -125,14 +228,15 @@ class Xmllint(BaseScraper):
             return
 
         # Try check against DTD
-        if tree.docinfo.doctype:
+        if header['doctype']:
             (exitcode, stdout, stderr) = self.exec_xmllint(dtd_check=True)
 
         # Try check againts XSD
         else:
+            imports = None
             if not self._schema:
-                self._schema = self.construct_xsd(tree)
-                if not self._schema:
+                imports = self._schema_imports(header)
+                if not imports:
                     # No given schema and didn't find included schemas but XML
                     # was well formed.
                     self.messages("Success: Document is "
@@ -140,7 +244,13 @@ class Xmllint(BaseScraper):
                     self._collect_elements()
                     return
 
-            (exitcode, stdout, stderr) = self.exec_xmllint(schema=self._schema)
+            if tree is not None and self._validate_in_process():
+                (exitcode, stdout, stderr) = self.validate_xsd(tree, imports)
+            else:
+                if imports:
+                    self._schema = self.construct_xsd(imports)
+                (exitcode, stdout, stderr) = self.exec_xmllint(
+                    schema=self._schema)
         if exitcode == 0:
             self.messages(
                 "%s Success\n%s" % (self.filename, ensure_str(stdout)))
@@ -154,50 +264,97 @@ class Xmllint(BaseScraper):
         self._check_supported()
         self._collect_elements()
 
-    def construct_xsd(self, document_tree):
+    def _parse(self):
         """
-        Construct one schema file for the given document tree.
-
-        :returns: Path to the constructed XSD schema
+        Parse the file for the well-formed check.
+
+        The parsed tree is shared with XmlEncoding. In the streaming mode,
+        the document tree is not kept in memory, and the file is parsed in
+        one pass shared with XmlEncoding.
+
+        :returns: Tuple (tree, header), where tree is the parsed document tree
+                  or None in the streaming mode, and header is a dict with
+                  keys 'version', 'doctype', 'schema_locations' and
+                  'no_namespace_schema_locations'
+        :raises: XMLSyntaxError if the document is not well-formed, IOError
+                 if the file can not be read
         """
+        if self._streaming:
+            header = self._artifact(('xml_scan', self.filename),
+                                    lambda: scan_xml(self.filename))
+            if header['error'] is not None:
+                raise header['error']
+            return (None, header)
+
+        tree = self._artifact(('xml_tree', self.filename),
+                              lambda: parse_xml(self.filename))
+        (schema_locations, no_namespace_locations) = find_schema_locations(
+            tree)
+        return (tree, {
+            'version': tree.docinfo.xml_version,
+            'doctype': tree.docinfo.doctype,
+            'schema_locations': schema_locations,
+            'no_namespace_schema_locations': no_namespace_locations})
+
+    def _schema_imports(self, header):
+        """
+        Find the schemas used in the document.
 
-        xsd_exists = False
-
-        parser = etree.XMLParser(dtd_validation=False, no_network=True)
-        schema_tree = etree.XML(SCHEMA_TEMPLATE, parser)
-
-        schema_locations = set(document_tree.xpath(
-            '//*/@xsi:schemaLocation', namespaces={'xsi': XSI}))
-        for schema_location in schema_locations:
-            xsd_exists = True
+        :header: Dict with the schemaLocation attribute values in key
+                 'schema_locations' and the noNamespaceSchemaLocation values
+                 in key 'no_namespace_schema_locations'
+        :returns: Sorted list of (namespace, schema location) tuples, where
+                  namespace is None for noNamespaceSchemaLocation
+        """
+        imports = set()
 
+        for schema_location in header['schema_locations']:
             namespaces_locations = schema_location.strip().split()
             # Import all found namspace/schema location pairs
             for namespace, location in zip(*[iter(namespaces_locations)] * 2):
-                xs_import = etree.Element(XS + 'import')
-                xs_import.attrib['namespace'] = namespace
-                xs_import.attrib['schemaLocation'] = location
-                schema_tree.append(xs_import)
-
-        schema_locations = set(document_tree.xpath(
-            '//*/@xsi:noNamespaceSchemaLocation', namespaces={'xsi': XSI}))
-        for schema_location in schema_locations:
-            xsd_exists = True
+                imports.add((namespace, location))
 
+        for schema_location in header['no_namespace_schema_locations']:
             # Check if XSD file is included in SIP
             local_schema_location = os.path.dirname(
                 self.filename) + '/' + schema_location
             if os.path.isfile(local_schema_location):
                 schema_location = local_schema_location
+            imports.add((None, schema_location))
+
+        return sorted(imports, key=lambda pair: (pair[0] or '', pair[1]))
+
+    @staticmethod
+    def _schema_tree(imports, base_url=None):
+        """
+        Construct one schema importing the given schemas.
 
+        :imports: List of (namespace, schema location) tuples
+        :base_url: URL against which relative schema locations are resolved
+        :returns: Root element of the constructed schema
+        """
+        parser = etree.XMLParser(dtd_validation=False, no_network=True)
+        schema_tree = etree.XML(SCHEMA_TEMPLATE, parser, base_url=base_url)
+        for namespace, location in imports:
             xs_import = etree.Element(XS + 'import')
-            xs_import.attrib['schemaLocation'] = schema_location
+            if namespace is not None:
+                xs_import.attrib['namespace'] = namespace
+            xs_import.attrib['schemaLocation'] = location
             schema_tree.append(xs_import)
-        if xsd_exists:
+        return schema_tree
+
+    def construct_xsd(self, imports):
+        """
+        Construct one schema file importing the given schemas.
+
+        :imports: List of (namespace, schema location) tuples
+        :returns: Path to the constructed XSD schema
+        """
+        if imports:
             # Contstruct the schema
             _, schema = tempfile.mkstemp(
                 prefix='file-scraper-', suffix='.tmp')
-            elem_tree = etree.ElementTree(schema_tree)
+            elem_tree = etree.ElementTree(self._schema_tree(imports))
             elem_tree.write(schema)
             self._has_constructed_schema = True
 
@@ -205,6 +362,91 @@ class Xmllint(BaseScraper):
 
         return []
 
+    def _validate_in_process(self):
+        """
+        Return True if the XSD validation can be done in-process with lxml.
+
+        Catalogs given in catalog_path or in $SGML_CATALOG_FILES are used only
+        by xmllint, since libxml2 loads the catalogs once per process.
+        Loading the imported schemas from network can not be prevented
+        in-process, so with no_network, lxml is used only if libxml2 has been
+        built without HTTP support.
+
+        :returns: True for in-process validation, False for xmllint
+        """
+        if self._catalogs and (self._catalog_path is not None or
+                               os.environ.get('SGML_CATALOG_FILES')):
+            return False
+        # LIBXML_FEATURES is not available in old lxml versions
+        features = getattr(etree, 'LIBXML_FEATURES', ['http'])
+        return not self._no_network or 'http' not in features
+
+    def validate_xsd(self, document_tree, imports=None):
+        """
+        Validate the document tree against XSD schemas in-process.
+
+        The compiled schemas are kept in memory, keyed with the given schema
+        file or with the imported schemas and the XML catalogs, so that
+        documents using the same schemas do not compile them again. The
+        modification times and sizes of the top level local schema files are
+        included in the keys, so that e.g. a different SIP extracted to the
+        same path does not use the schemas of the previous one. The schema
+        is compiled again also if a local schema file included or imported
+        by them has changed.
+
+        :document_tree: Parsed document tree
+        :imports: List of (namespace, schema location) tuples to be imported,
+                  None to use the given schema file
+        :returns: tuple including: returncode, stdout, stderr as from
+                  exec_xmllint()
+        """
+        if imports is None:
+            name = self._schema
+            key = ('schema', os.path.abspath(self._schema),
+                   _file_state(self._schema))
+
+            def _compile():
+                """Compile the given schema file."""
+                files = _schema_files([self._schema])
+                # Parser errors include all the errors logged in the thread
+                etree.clear_error_log()
+                parser = etree.XMLParser(no_network=self._no_network)
+                return _compiled(etree.XMLSchema(etree.parse(self._schema,
+                                                             parser)), files)
+        else:
+            # Relative locations are resolved as in the constructed schema
+            # file of exec_xmllint()
+            name = os.path.join(tempfile.gettempdir(), 'file-scraper.tmp')
+            key = ('imports',
+                   tuple((namespace, location, _file_state(location))
+                         for (namespace, location) in imports),
+                   os.environ.get('XML_CATALOG_FILES'))
+
+            def _compile():
+                """Compile a schema importing the found schemas."""
+                files = _schema_files([location for (_, location) in imports])
+                return _compiled(etree.XMLSchema(
+                    self._schema_tree(imports, name)), files)
+
+        try:
+            (schema, lock, warnings, _) = _SCHEMAS.get(key, _compile,
+                                                       _up_to_date)
+        except (etree.XMLSyntaxError, etree.XMLSchemaParseError) as exception:
+            lines = format_error_log(exception.error_log)
+            lines.append('WXS schema %s failed to compile' % name)
+            return (1, '', '\n'.join(lines))
+        except IOError as exception:
+            return (1, '', str(exception))
+
+        # The error log of the schema is shared by the threads
+        with lock:
+            valid = schema.validate(document_tree)
+            lines = warnings + format_error_log(schema.error_log)
+        if valid:
+            return (0, '', '\n'.join(lines))
+        lines.append('%s fails to validate' % self.filename)
+        return (3, '', '\n'.join(lines))
+
     def exec_xmllint(self, dtd_check=False, schema=None):
         """
         Execute xmllint.
@@ -217,6 +459,7 @@ class Xmllint(BaseScraper):
         command += ['--valid'] if dtd_check else []
         command += ['--huge']
         command += ['--noout']
+        command += ['--stream'] if self._streaming else []
         command += ['--nonet'] if self._no_network else []
         command += ['--catalogs'] if self._catalogs else []
         command += ['--schema', schema] if schema else []
@@ -229,7 +472,7 @@ class Xmllint(BaseScraper):
         else:
             environment = None
 
-        shell = Shell(command, env=environment)
+        shell = self._tool_shell(command, env=environment)
 
         return (shell.returncode, shell.stdout, shell.stderr)
 
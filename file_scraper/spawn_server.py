@@ -0,0 +1,288 @@
+"""
+Spawn server for launching 3rd party tools from a small helper process.
+
+Forking a large scraper process, e.g. a batch worker with loaded Fido
+signatures, XML schemas and images, copies its page tables for every tool
+run. The spawn server is a separate small Python process, which runs the
+commands on behalf of the scraper process, so that the cost of starting a
+tool does not depend on the size of the scraper process. The requests and
+results are sent as pickled tuples over the pipes of the server, and the
+commands are run in threads of the server, so several tools can be run at
+the same time.
+
+The server is started with the environment of the scraper process at the
+time of starting. The environment variables given for the commands are set
+on top of it. The commands are run in the working directory of the scraper
+process at the time of the request.
+"""
+import atexit
+import fcntl
+import itertools
+import os
+import subprocess
+import sys
+import threading
+
+import six
+from six.moves import cPickle as pickle
+
+from file_scraper.utils import run_command, run_command_limited
+
+PICKLE_PROTOCOL = 2
+
+
+class SpawnServerError(Exception):
+    """Spawn server failed while running a command."""
+
+
+class SpawnServerUnavailable(SpawnServerError):
+    """Spawn server can not be used, and the command was not sent to it."""
+
+
+class SpawnServer(object):
+    """
+    Helper process running commands for the scraper process.
+
+    The results are read from the server in a reader thread, which wakes up
+    the threads waiting for them.
+    """
+
+    def __init__(self):
+        """Initialize the server."""
+        self._process = None
+        self._pid = None
+        self._send_lock = threading.Lock()
+        self._state = {'pending': {}, 'closed': True}
+        self._ids = itertools.count()
+
+    @property
+    def alive(self):
+        """Return True if the server of this process is running."""
+        return (self._process is not None and self._pid == os.getpid()
+                and self._process.poll() is None)
+
+    def start(self):
+        """
+        Start the server process.
+
+        :returns: True if the server was started, False otherwise
+        """
+        self.stop()
+        package_dir = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_dir] + [path for path in [env.get('PYTHONPATH')]
+                             if path])
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, '-m', 'file_scraper.spawn_server'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+                close_fds=True)
+        except OSError:
+            self._process = None
+            return False
+        self._pid = os.getpid()
+        self._state = {'pending': {}, 'closed': False}
+        reader = threading.Thread(
+            target=self._read_results,
+            args=(self._process, self._state, self._send_lock))
+        reader.daemon = True
+        reader.start()
+        return True
+
+    def stop(self):
+        """Stop the server, if it is running in this process."""
+        if self.alive:
+            self._process.stdin.close()
+            self._process.wait()
+        self._process = None
+
+    def run(self, cmd, stdout=subprocess.PIPE, env=None, limits=None):
+        """
+        Run command in the server.
+
+        :cmd: Command to execute as list
+        :stdout: A file handle with a file name can be given, for appending
+                 stdout to the file.
+        :env: Environment variables to set for the command
+        :limits: Dict of resource limits, see run_command_limited(), or None
+        :returns: Tuple (statuscode, stdout, stderr, exceeded), where
+                  exceeded is the key of an exceeded limit or None
+        :raises: SpawnServerUnavailable if the command could not be sent to
+                 the server, SpawnServerError if the server exited before
+                 the command was finished, or the error of running the
+                 command in the server
+        """
+        output_path = None
+        if stdout is not subprocess.PIPE:
+            output_path = getattr(stdout, 'name', None)
+            if not isinstance(output_path, six.string_types):
+                raise SpawnServerUnavailable('Output file has no file name.')
+            output_path = os.path.abspath(output_path)
+            stdout.flush()
+        cwd = os.getcwd()
+        done = threading.Event()
+        waiter = [done, None, None]
+        with self._send_lock:
+            if not self.alive or self._state['closed']:
+                raise SpawnServerUnavailable('Spawn server is not running.')
+            pending = self._state['pending']
+            request_id = next(self._ids)
+            pending[request_id] = waiter
+            try:
+                pickle.dump((request_id, cmd, output_path, env, limits, cwd),
+                            self._process.stdin, PICKLE_PROTOCOL)
+                self._process.stdin.flush()
+            except (IOError, OSError):
+                pending.pop(request_id, None)
+                raise SpawnServerUnavailable(
+                    'Spawn server is not reachable.')
+        done.wait()
+        if waiter[2] is not None:
+            raise waiter[2]
+        return waiter[1]
+
+    @staticmethod
+    def _read_results(process, state, send_lock):
+        """
+        Read results from the server and give them to the waiting threads.
+
+        :process: Popen instance of the server
+        :state: Dict with the waiters of the sent requests keyed with request
+                id in key 'pending', and key 'closed' set to True when the
+                server has exited
+        :send_lock: Lock for sending the requests
+        """
+        pending = state['pending']
+        while True:
+            try:
+                (request_id, result, error) = pickle.load(process.stdout)
+            except Exception:  # pylint: disable=broad-except
+                break
+            waiter = pending.pop(request_id)
+            (waiter[1], waiter[2]) = (result, error)
+            waiter[0].set()
+        with send_lock:
+            state['closed'] = True
+            for request_id in list(pending):
+                waiter = pending.pop(request_id)
+                waiter[2] = SpawnServerError('Spawn server exited.')
+                waiter[0].set()
+
+
+_SERVER_LOCK = threading.Lock()
+_SERVER = {}
+
+
+def spawn_server():
+    """
+    Return the running spawn server of this process.
+
+    The server is started at the first call, and restarted if it has died.
+    A forked child process starts a server of its own.
+
+    :returns: SpawnServer instance, or None if it can not be started
+    """
+    with _SERVER_LOCK:
+        server = _SERVER.get(os.getpid())
+        if server is None:
+            _SERVER.clear()
+            server = SpawnServer()
+            atexit.register(server.stop)
+            _SERVER[os.getpid()] = server
+        if not server.alive and not server.start():
+            return None
+        return server
+
+
+def serve(infile, outfile):
+    """
+    Run the requested commands until the input is closed.
+
+    :infile: Binary input stream of the requests
+    :outfile: Binary output stream of the results
+    """
+    write_lock = threading.Lock()
+    handlers = []
+    while True:
+        try:
+            request = pickle.load(infile)
+        except EOFError:
+            break
+        handler = threading.Thread(target=_handle,
+                                   args=(request, outfile, write_lock))
+        handler.daemon = True
+        handler.start()
+        handlers = [thread for thread in handlers if thread.is_alive()]
+        handlers.append(handler)
+    for handler in handlers:
+        handler.join()
+
+
+def _handle(request, outfile, write_lock):
+    """
+    Run a requested command and write the result.
+
+    :request: Tuple (request id, command, output path, env, limits,
+              working directory)
+    :outfile: Binary output stream of the results
+    :write_lock: Lock for writing to the output stream
+    """
+    (request_id, cmd, output_path, env, limits, cwd) = request
+    try:
+        result = (request_id,
+                  _execute(cmd, output_path, env, limits, cwd), None)
+    except Exception as exception:  # pylint: disable=broad-except
+        result = (request_id, None, exception)
+    with write_lock:
+        pickle.dump(result, outfile, PICKLE_PROTOCOL)
+        outfile.flush()
+
+
+def _execute(cmd, output_path, env, limits, cwd):
+    """
+    Run command.
+
+    :cmd: Command to execute as list
+    :output_path: Absolute path of the file where stdout is appended, or
+                  None
+    :env: Environment variables to set for the command
+    :limits: Dict of resource limits or None
+    :cwd: Working directory of the command
+    :returns: Tuple (statuscode, stdout, stderr, exceeded)
+    """
+    if output_path is None:
+        if limits:
+            return run_command_limited(cmd, limits, env=env, cwd=cwd)
+        return run_command(cmd, env=env, cwd=cwd) + (None,)
+    with open(output_path, 'ab') as output_file:
+        if limits:
+            return run_command_limited(cmd, limits, stdout=output_file,
+                                       env=env, cwd=cwd)
+        return run_command(cmd, stdout=output_file, env=env,
+                           cwd=cwd) + (None,)
+
+
+def _protocol_stream(fd, mode):
+    """
+    Move a standard stream away from the inherited file descriptor.
+
+    The commands inherit the standard streams, so the protocol is moved to
+    a new descriptor closed on exec, and /dev/null is put in its place.
+
+    :fd: File descriptor of the standard stream
+    :mode: File mode of the returned stream
+    :returns: Binary stream of the protocol
+    """
+    new_fd = os.dup(fd)
+    flags = fcntl.fcntl(new_fd, fcntl.F_GETFD)
+    fcntl.fcntl(new_fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, fd)
+    os.close(devnull)
+    return os.fdopen(new_fd, mode)
+
+
+if __name__ == '__main__':
+    serve(_protocol_stream(0, 'rb'), _protocol_stream(1, 'wb'))
@@ -1,10 +1,14 @@
 """Utilities for scrapers."""
 import sys
 import os
+import functools
 import unicodedata
 import string
+import signal
 import subprocess
+import threading
 import hashlib
+import io
 import six
 
 
@@ -18,6 +22,9 @@ def decode(filename):
     return ensure_text(filename, encoding=sys.getfilesystemencoding())
 
 
+CHUNK_SIZE = 1024 * 1024
+
+
 def hexdigest(filename, algorithm='sha1', extra_hash=None):
     """Calculte hash of given file.
     :filename: File path
@@ -25,16 +32,36 @@ def hexdigest(filename, algorithm='sha1', extra_hash=None):
     :extra_hash: Hash to be appended in calculation
     :returns: Calculated hash
     """
-    algorithm = algorithm.replace("-", "").lower().strip()
-    checksum = hashlib.new(algorithm)
-    with open(filename, 'rb') as input_file:
-        for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
-            checksum.update(chunk)
-        if extra_hash:
-            if isinstance(extra_hash, str):
-                extra_hash = extra_hash.encode('utf-8')
+    return hexdigests(filename, [algorithm], extra_hash)[algorithm]
+
+
+def hexdigests(filename, algorithms, extra_hash=None):
+    """Calculate several hashes of given file with one read pass.
+    :filename: File path
+    :algorithms: List of hash algorithms. MD5 or SHA variants.
+    :extra_hash: Hash to be appended in calculation
+    :returns: Dict of calculated hashes, keyed with the given algorithms
+    """
+    checksums = {}
+    for algorithm in algorithms:
+        checksums[algorithm] = hashlib.new(
+            algorithm.replace("-", "").lower().strip())
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with io.open(filename, 'rb') as input_file:
+        while True:
+            size = input_file.readinto(buf)
+            if not size:
+                break
+            for checksum in checksums.values():
+                checksum.update(view[:size])
+    if extra_hash:
+        if isinstance(extra_hash, six.text_type):
+            extra_hash = extra_hash.encode('utf-8')
+        for checksum in checksums.values():
             checksum.update(extra_hash)
-    return checksum.hexdigest()
+    return dict((algorithm, checksum.hexdigest())
+                for (algorithm, checksum) in checksums.items())
 
 
 def sanitize_string(dirty_string):
@@ -144,7 +171,7 @@ def combine_metadata(stream, indexed_metadata, lose=None, important=None):
 
     for stream_index, metadata_dict in six.iteritems(indexed_metadata):
 
-        if stream_index not in stream.keys():
+        if stream_index not in stream:
             stream[stream_index] = metadata_dict
             continue
 
@@ -171,7 +198,22 @@ def combine_metadata(stream, indexed_metadata, lose=None, important=None):
     return stream
 
 
-def run_command(cmd, stdout=subprocess.PIPE, env=None):
+def _command_env(env):
+    """Return environment for a command.
+
+    :param env: Environment variables to override, or None
+    :returns: Copy of the process environment with the given variables, or
+        None for inheriting the process environment as such
+    """
+    if not env:
+        return None
+    _env = os.environ.copy()
+    for key, value in six.iteritems(env):
+        _env[key] = value
+    return _env
+
+
+def run_command(cmd, stdout=subprocess.PIPE, env=None, cwd=None):
     """Execute command.
 
     Scraper specific error handling is supported by forwarding exceptions.
@@ -179,19 +221,17 @@ def run_command(cmd, stdout=subprocess.PIPE, env=None):
     :param cmd: commandline command.
     :param stdout: a file handle can be given, for directing stdout to file.
     :param env: Override process environment variables
+    :param cwd: Working directory of the command, None for the current one
     :returns: Tuple (statuscode, stdout, stderr)
     """
-    _env = os.environ.copy()
-
-    if env:
-        for key, value in six.iteritems(env):
-            _env[key] = value
+    _env = _command_env(env)
 
     proc = subprocess.Popen(cmd,
                             stdout=stdout,
                             stderr=subprocess.PIPE,
                             shell=False,
-                            env=_env)
+                            env=_env,
+                            cwd=cwd)
 
     (stdout_result, stderr_result) = proc.communicate()
     if not stdout_result:
@@ -202,6 +242,206 @@ def run_command(cmd, stdout=subprocess.PIPE, env=None):
     return statuscode, stdout_result, stderr_result
 
 
+def run_command_limited(cmd, limits, stdout=subprocess.PIPE, env=None,
+                        cwd=None):
+    """Execute command with resource limits.
+
+    The command is killed, if it runs longer than the time limit or writes
+    more output than the output limit. The command is started in a session
+    of its own, and the whole process group is killed, so that also the
+    tools started by wrapper scripts are stopped. The CPU time and memory
+    limits are set as resource limits of the process by a small Python
+    wrapper, which then executes the command, as setting them in a
+    preexec_fn is not safe when the process has threads. The memory limit is
+    reported as exceeded only if the command failed with an out of memory
+    error message, as failing allocations do not have an exit status of
+    their own.
+
+    :param cmd: commandline command.
+    :param limits: Dict of limits, each of them None or missing for no
+        limit: 'timeout' for wall-clock seconds, 'cpu_time' for CPU seconds,
+        'memory' for bytes of address space and 'max_output' for bytes of
+        both stdout and stderr.
+    :param stdout: a file handle can be given, for directing stdout to file.
+    :param env: Override process environment variables
+    :param cwd: Working directory of the command, None for the current one
+    :returns: Tuple (statuscode, stdout, stderr, exceeded), where exceeded
+        is the key of the exceeded limit or None
+    """
+    _env = _command_env(env)
+
+    session = _session_options()
+    proc = subprocess.Popen(_rlimit_command(cmd, limits),
+                            stdout=stdout,
+                            stderr=subprocess.PIPE,
+                            shell=False,
+                            env=_env,
+                            cwd=cwd,
+                            **session)
+    killed = []
+
+    def _kill(reason):
+        """Kill the process group because of the given exceeded limit."""
+        if not killed:
+            killed.append(reason)
+        try:
+            if session:
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+
+    timer = None
+    if limits.get('timeout'):
+        timer = threading.Timer(limits['timeout'], _kill, ['timeout'])
+        timer.daemon = True
+        timer.start()
+
+    outputs = {}
+    readers = []
+    for (name, stream) in [('stdout', proc.stdout), ('stderr', proc.stderr)]:
+        if stream is None:
+            continue
+        reader = threading.Thread(target=_read_limited, args=(
+            stream, limits.get('max_output'), outputs, name, _kill))
+        reader.daemon = True
+        reader.start()
+        readers.append(reader)
+    for reader in readers:
+        reader.join()
+    proc.wait()
+    if timer is not None:
+        timer.cancel()
+
+    return _limited_result(cmd, limits, proc.returncode, outputs, killed)
+
+
+def _limited_result(cmd, limits, statuscode, outputs, killed):
+    """Return the result of a command run with resource limits.
+
+    :param cmd: commandline command.
+    :param limits: Dict of limits, see run_command_limited()
+    :param statuscode: Exit status of the command
+    :param outputs: Dict of the read bytes in keys 'stdout' and 'stderr'
+    :param killed: List of the limits, for which the command was killed
+    :returns: Tuple (statuscode, stdout, stderr, exceeded), see
+        run_command_limited()
+    :raises: OSError if the command could not be executed
+    """
+    stderr = outputs.get('stderr') or ""
+    marker = EXEC_ERROR_MARKER.encode('ascii')
+    if statuscode == EXEC_ERROR_STATUS and stderr.startswith(marker):
+        error = int(stderr[len(marker):])
+        raise OSError(error, os.strerror(error), cmd[0])
+    exceeded = killed[0] if killed else None
+    if exceeded is None and limits.get('cpu_time') and \
+            statuscode in [-signal.SIGXCPU, -signal.SIGKILL]:
+        exceeded = 'cpu_time'
+    elif exceeded is None and limits.get('memory') and statuscode != 0 and \
+            stderr and _out_of_memory(stderr):
+        exceeded = 'memory'
+    return (statuscode, outputs.get('stdout') or "", stderr, exceeded)
+
+
+OUT_OF_MEMORY_MESSAGES = [b'memoryerror', b'cannot allocate memory',
+                          b'out of memory', b'outofmemoryerror',
+                          b'bad_alloc', b'memory exhausted']
+
+
+def _out_of_memory(stderr):
+    """Find out if a command failed because of failing memory allocations.
+
+    :param stderr: Standard error output of the command
+    :returns: True, if the output has an out of memory error message
+    """
+    stderr = stderr.lower()
+    return any(message in stderr for message in OUT_OF_MEMORY_MESSAGES)
+
+
+EXEC_ERROR_MARKER = 'file-scraper-exec-error:'
+EXEC_ERROR_STATUS = 127
+
+RLIMIT_WRAPPER = """
+import os
+import resource
+import sys
+(cpu_time, memory) = [int(value) for value in sys.argv[1:3]]
+if cpu_time:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time + 1))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+try:
+    os.execvp(sys.argv[3], sys.argv[3:])
+except OSError as error:
+    sys.stderr.write('%s%%d' %% error.errno)
+    sys.stderr.flush()
+    os._exit(%d)
+""" % (EXEC_ERROR_MARKER, EXEC_ERROR_STATUS)
+
+
+def _rlimit_command(cmd, limits):
+    """Return the command setting the resource limits for a command.
+
+    The limits are set by a Python wrapper, which executes the command
+    with the limits. The command is returned as such, if it has no CPU
+    time or memory limit.
+
+    :param cmd: commandline command.
+    :param limits: Dict of limits, see run_command_limited()
+    :returns: Command as list
+    """
+    if not limits.get('cpu_time') and not limits.get('memory'):
+        return cmd
+    # SIGXCPU at the soft CPU time limit, SIGKILL at the hard limit
+    return [sys.executable, '-E', '-S', '-c', RLIMIT_WRAPPER,
+            str(int(limits.get('cpu_time') or 0)),
+            str(int(limits.get('memory') or 0))] + list(cmd)
+
+
+def _session_options():
+    """Return Popen options starting the command in a new session.
+
+    The command is started in a session of its own, so that it can be
+    killed with the processes it has started. Python 2 has no
+    start_new_session option, so there the session is created in
+    preexec_fn, but only if the process has no other threads.
+
+    :returns: Dict of keyword arguments for Popen, empty if the session
+        can not be created
+    """
+    if not six.PY2:
+        return {'start_new_session': True}
+    if threading.active_count() == 1:
+        return {'preexec_fn': os.setsid}
+    return {}
+
+
+def _read_limited(stream, max_output, outputs, name, kill):
+    """Read output stream of a process, kill the process on too much output.
+
+    :param stream: Output stream
+    :param max_output: Maximum number of bytes to read, None for no limit
+    :param outputs: Dict, where the read bytes are stored
+    :param name: Key of the output in outputs
+    :param kill: Function to kill the process, called with 'max_output'
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if max_output is not None and size + len(chunk) > max_output:
+            chunks.append(chunk[:max_output - size])
+            kill('max_output')
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    stream.close()
+    outputs[name] = b"".join(chunks)
+
+
 def metadata(important=False):
     """Decorator to help set a flag attribute to the function that it
     can be collected for metadata.
@@ -218,6 +458,30 @@ def metadata(important=False):
     return _wrapper
 
 
+def stream_cached(func):
+    """Decorator to compute the value of a scraper method once per stream.
+
+    The value is stored in the _stream_cache dict of the scraper, which must
+    be emptied when the current stream of the scraper is changed.
+    Exceptions are not stored.
+
+    :param func: Scraper method without arguments
+    :returns: Wrapped method
+    """
+
+    @functools.wraps(func)
+    def _wrapper(self):
+        # pylint: disable=protected-access
+        try:
+            return self._stream_cache[func.__name__]
+        except KeyError:
+            value = func(self)
+            self._stream_cache[func.__name__] = value
+            return value
+
+    return _wrapper
+
+
 def is_metadata(func):
     """To help let scraper know the given function has metadata flagged."""
     return callable(func) and getattr(func, 'metadata', False)
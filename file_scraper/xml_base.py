@@ -0,0 +1,111 @@
+"""Shared parsing of XML files for the XML scrapers."""
+
+try:
+    from lxml import etree
+except ImportError:
+    pass
+
+from io import open
+
+XSI = 'http://www.w3.org/2001/XMLSchema-instance'
+SCHEMA_LOCATION = '{%s}schemaLocation' % XSI
+NO_NAMESPACE_SCHEMA_LOCATION = '{%s}noNamespaceSchemaLocation' % XSI
+
+
+def parse_xml(filename):
+    """
+    Parse an XML file to a document tree.
+
+    The tree is shared by the XML scrapers of the file through the artifact
+    store, so it must not be modified.
+
+    :filename: File path
+    :returns: Parsed document tree
+    :raises: XMLSyntaxError if the document is not well-formed, IOError if
+             the file can not be read
+    """
+    with open(filename, 'rb') as file_:
+        parser = etree.XMLParser(dtd_validation=False, no_network=True)
+        return etree.parse(file_, parser=parser)
+
+
+def scan_xml(filename):
+    """
+    Check well-formedness of an XML file in one streaming pass.
+
+    The file is parsed with iterparse, and the elements are removed after
+    they have been parsed, so that the memory usage does not depend on the
+    size of the document. The XML declaration, the doctype and the schema
+    locations are collected during the same pass. The hardcoded limits of
+    libxml2 for the size of text nodes and the depth of the tree are
+    disabled, as this check is used for very large files.
+
+    :filename: File path
+    :returns: Dict with keys 'version', 'encoding' and 'doctype' from the
+              document header, 'schema_locations' and
+              'no_namespace_schema_locations' as sets of the found attribute
+              values, and 'error', which is the XMLSyntaxError of a not
+              well-formed document, or None
+    """
+    result = {'version': None, 'encoding': None, 'doctype': None,
+              'schema_locations': set(),
+              'no_namespace_schema_locations': set(),
+              'error': None}
+    with open(filename, 'rb') as file_:
+        events = etree.iterparse(file_, events=('start', 'end'),
+                                 dtd_validation=False, no_network=True,
+                                 huge_tree=True)
+        root = None
+        try:
+            for event, element in events:
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    _add_attribute(result['schema_locations'], element,
+                                   SCHEMA_LOCATION)
+                    _add_attribute(result['no_namespace_schema_locations'],
+                                   element, NO_NAMESPACE_SCHEMA_LOCATION)
+                    continue
+                # Remove the parsed element and its preceding siblings
+                element.clear()
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+        except etree.XMLSyntaxError as exception:
+            result['error'] = exception
+    # The encoding is known in docinfo only after parsing
+    if root is not None:
+        docinfo = root.getroottree().docinfo
+        result['version'] = docinfo.xml_version
+        result['encoding'] = docinfo.encoding
+        result['doctype'] = docinfo.doctype
+    return result
+
+
+def find_schema_locations(document_tree):
+    """
+    Find the schema locations given in a parsed document.
+
+    :document_tree: Parsed document tree
+    :returns: Tuple of sets of the schemaLocation and
+              noNamespaceSchemaLocation attribute values
+    """
+    schema_locations = set(document_tree.xpath(
+        '//*/@xsi:schemaLocation', namespaces={'xsi': XSI}))
+    no_namespace_locations = set(document_tree.xpath(
+        '//*/@xsi:noNamespaceSchemaLocation', namespaces={'xsi': XSI}))
+    return (schema_locations, no_namespace_locations)
+
+
+def _add_attribute(values, element, name):
+    """
+    Add value of the given attribute to a set, if the attribute exists.
+
+    :values: Set of values
+    :element: Element
+    :name: Attribute name
+    """
+    value = element.get(name)
+    if value is not None:
+        values.add(value)
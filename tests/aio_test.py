@@ -0,0 +1,237 @@
+"""
+Tests for the asyncio backend.
+
+This module tests that:
+    - run_command_async() gives the same results as run_command_limited()
+      and applies the limits.
+    - The tools of several scrapers are run at the same time from one event
+      loop as asyncio subprocesses without executor threads.
+    - scrape_file_async() runs scrape_file() again with the results of the
+      run tools, and runs the scrapers, which do not give the same command
+      again or make blocking calls, in the executor.
+    - scrape_file_async() and Scraper.scrape_async() give the same results
+      as the synchronous scraping.
+"""
+import threading
+import time
+
+import pytest
+import six
+
+from file_scraper.base import BaseScraper
+from file_scraper.scraper import Scraper
+from file_scraper.scrapers.xmllint import Xmllint
+from file_scraper.utils import metadata, run_command_limited
+
+pytestmark = pytest.mark.skipif(six.PY2, reason='Requires Python 3')
+
+
+def _run(awaitable):
+    """
+    Run awaitable in a new event loop.
+
+    :awaitable: Function without arguments returning the awaitable
+    :returns: Result of the awaitable
+    """
+    import asyncio
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(awaitable())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class _SleepScraper(BaseScraper):
+    """Scraper running a slow tool."""
+
+    def scrape_file(self):
+        """Run the tool."""
+        self.messages(str(self._tool_shell(['sleep', '0.5']).returncode))
+        self._collect_elements()
+
+    @metadata()
+    def _stream_type(self):
+        """Return file type."""
+        return 'binary'
+
+
+class _TwoToolScraper(BaseScraper):
+    """Scraper running two tools, and a missing one."""
+
+    def scrape_file(self):
+        """Run the tools."""
+        self.messages('start')
+        self.messages(self._tool_shell(['echo', 'first']).stdout.decode())
+        self.messages(self._tool_shell(['echo', 'second']).stdout.decode())
+        try:
+            self._tool_shell(['missing_command_xyz']).returncode
+        except OSError:
+            self.errors('missing')
+        self._collect_elements()
+
+    @metadata()
+    def _stream_type(self):
+        """Return file type."""
+        return 'binary'
+
+
+class _ChangingScraper(_SleepScraper):
+    """Scraper giving a different command in each run."""
+
+    runs = 0
+
+    def scrape_file(self):
+        """Run the tool."""
+        _ChangingScraper.runs += 1
+        shell = self._tool_shell(['echo', str(_ChangingScraper.runs)])
+        self.messages(shell.stdout.decode().strip())
+        self._collect_elements()
+
+
+@pytest.mark.parametrize(('command', 'limits'), [
+    (['echo', 'output'], None),
+    (['sh', '-c', 'echo error >&2; exit 3'], {'timeout': 10}),
+    (['yes'], {'max_output': 1000}),
+    (['python', '-c', 'while True: pass'], {'cpu_time': 1}),
+])
+def test_run_command_async(command, limits):
+    """Test that the results are the same as with run_command_limited()."""
+    from file_scraper.aio import run_command_async
+    result = _run(lambda: run_command_async(command, limits=limits))
+    assert result == run_command_limited(command, limits or {})
+
+
+def test_run_command_async_timeout():
+    """Test that the process group is killed after the time limit."""
+    from file_scraper.aio import run_command_async
+    start = time.time()
+    (returncode, _, _, exceeded) = _run(lambda: run_command_async(
+        ['sh', '-c', 'sleep 10; echo late'], limits={'timeout': 0.5}))
+    assert time.time() - start < 5
+    assert exceeded == 'timeout'
+    assert returncode != 0
+
+
+@pytest.mark.parametrize('limits', [None, {'memory': 10 ** 9}])
+def test_run_command_async_missing(limits):
+    """Test that a missing command raises OSError."""
+    from file_scraper.aio import run_command_async
+    with pytest.raises(OSError):
+        _run(lambda: run_command_async(['missing_command_xyz'],
+                                       limits=limits))
+
+
+def test_concurrent_scrapers(monkeypatch):
+    """Test that the tools of several scrapers are run at the same time
+    without executor threads.
+    """
+    import asyncio
+
+    def _no_executor(*args):
+        """Fail the test, if the executor is used."""
+        raise AssertionError('executor used')
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, 'run_in_executor',
+                        _no_executor)
+    scrapers = [_SleepScraper('filename', 'test/sleep') for _ in range(8)]
+
+    async def _scrape():
+        """Scrape and return the names of the threads while running."""
+        tasks = asyncio.gather(*[scraper.scrape_file_async()
+                                 for scraper in scrapers])
+        await asyncio.sleep(0.2)
+        running = [thread.name for thread in threading.enumerate()]
+        await tasks
+        return running
+
+    start = time.time()
+    running = _run(_scrape)
+    assert not [name for name in running if name.startswith('asyncio_')]
+    assert time.time() - start < 2
+    assert all(scraper.messages() == '0' for scraper in scrapers)
+
+
+def test_scrape_file_async_replay():
+    """Test that the results are the same as in the synchronous run, when
+    scrape_file() is run again for each tool.
+    """
+    scraper = _TwoToolScraper('filename', 'test/tools')
+    _run(scraper.scrape_file_async)
+    expected = _TwoToolScraper('filename', 'test/tools')
+    expected.scrape_file()
+    assert scraper.info == expected.info
+    assert scraper.messages() == 'start\nfirst\n\nsecond\n'
+    assert scraper.errors() == 'ERROR: missing'
+
+
+def test_scrape_file_async_executor():
+    """Test that a scraper giving a new command in each run is run in the
+    executor.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(1)
+    submitted = []
+    submit = executor.submit
+
+    def _submit(*args):
+        """Record the use of the executor."""
+        submitted.append(args)
+        return submit(*args)
+
+    executor.submit = _submit
+    _ChangingScraper.runs = 0
+    scraper = _ChangingScraper('filename', 'test/sleep')
+    try:
+        _run(lambda: scraper.scrape_file_async(executor))
+    finally:
+        executor.shutdown()
+    assert len(submitted) == 1
+    assert scraper.messages() == '3'
+    assert scraper._replay is None
+
+
+def test_scrape_file_async():
+    """Test scraping with scrape_file_async()."""
+    filename = 'tests/data/text_xml/valid_1.0_dtd.xml'
+    scraper = Xmllint(filename, 'text/xml')
+    _run(scraper.scrape_file_async)
+    expected = Xmllint(filename, 'text/xml')
+    expected.scrape_file()
+    assert scraper.info == expected.info
+    assert scraper.well_formed == expected.well_formed
+
+
+def test_scrape_async():
+    """Test that Scraper.scrape_async() gives the same results."""
+    import asyncio
+    filenames = ['tests/data/text_plain/valid__utf8.txt',
+                 'tests/data/text_xml/valid_1.0_well_formed.xml']
+    scrapers = [Scraper(filename) for filename in filenames]
+    _run(lambda: asyncio.gather(*[
+        scraper.scrape_async(check_wellformed=False)
+        for scraper in scrapers]))
+    for scraper in scrapers:
+        expected = Scraper(scraper.filename)
+        expected.scrape(check_wellformed=False)
+        assert scraper.mimetype == expected.mimetype
+        assert scraper.streams == expected.streams
+        assert scraper.well_formed == expected.well_formed
+
+
+class _BlockingScraper(_SleepScraper):
+    """Scraper making a blocking call."""
+
+    def scrape_file(self):
+        """Make the call."""
+        self._blocking_call()
+        self.messages(threading.current_thread().name)
+        self._collect_elements()
+
+
+def test_blocking_call():
+    """Test that a scraper making a blocking call is run in the executor."""
+    scraper = _BlockingScraper('filename', 'test/sleep')
+    _run(scraper.scrape_file_async)
+    assert scraper.messages() != threading.current_thread().name
@@ -11,10 +11,28 @@ This module tests:
     - That _collect_elements() method works and is able to gather all results
       from metadata methods
     - Concatenation of strings or empty lists with and without prefix
+    - That ArtifactStore creates each artifact only once, also when requested
+      from parallel threads, and raises the creation error again for
+      subsequent requests.
+    - That scrapers use the artifact store given in the parameters, and create
+      the artifacts themselves without a store.
+    - That ArtifactStore with a maximum size removes the least recently used
+      artifacts, and does not store the creation errors.
+    - That ArtifactStore creates an artifact again, when the stored one is
+      not valid anymore.
+    - That Shell reports the exceeded resource limit, and scrapers report it
+      in their errors with the limits of the tool merged over the default
+      limits.
+    - That the metadata methods are looked up once for each class, and that
+      important metadata methods are called only once for each stream.
 """
 import subprocess
+import threading
+import time
+
+import pytest
 from file_scraper.base import (Shell, BaseScraper, BaseDetector, concat,
-                               SkipElementException)
+                               SkipElementException, ArtifactStore)
 import file_scraper.utils
 
 
@@ -161,6 +179,61 @@ def test_collect_elements():
             'collect_this': 'collected'}}
 
 
+class BaseScraperStreams(BaseScraperVersion):
+    """Scraper with several streams and important metadata."""
+
+    def __init__(self, *args, **kwargs):
+        super(BaseScraperStreams, self).__init__(*args, **kwargs)
+        self.calls = []
+        self._stream = None
+
+    def iter_tool_streams(self, stream_type):
+        for index in range(3):
+            self._stream = index
+            yield {}
+
+    @file_scraper.utils.metadata()
+    def _index(self):
+        return self._stream
+
+    @file_scraper.utils.metadata(important=True)
+    def _important(self):
+        self.calls.append(self._stream)
+        return 'important %s' % self._stream
+
+
+def test_metadata_methods():
+    """Test the metadata method table and collection from several streams."""
+    # pylint: disable=protected-access
+    assert BaseScraperVersion._metadata_methods() == [
+        ('_collect_this', 'collect_this', False),
+        ('_index', 'index', False),
+        ('_mimetype', 'mimetype', False),
+        ('_skip_this', 'skip_this', False),
+        ('_stream_type', 'stream_type', False),
+        ('_version', 'version', False)]
+    assert ('_important', 'important', True) in \
+        BaseScraperStreams._metadata_methods()
+    assert BaseScraperStreams._metadata_methods() is \
+        BaseScraperStreams._metadata_methods()
+    assert '_important' not in [
+        method for (method, _, _) in BaseScraperVersion._metadata_methods()]
+
+    scraper = BaseScraperStreams('testfilename', 'test/mimetype')
+    with pytest.raises(
+            file_scraper.base.ImportantMetadataAlreadyDefined):
+        scraper._collect_elements()
+    assert scraper.calls == [0, 1]
+
+    scraper = BaseScraperStreams('testfilename', 'test/mimetype')
+    scraper.iter_tool_streams = lambda stream_type: iter([{}])
+    scraper._stream = 0
+    scraper._collect_elements()
+    assert scraper.calls == [0]
+    assert scraper.streams[0]['important'] == 'important 0'
+    assert 'skip_this' not in scraper.streams[0]
+
+
 def test_check_supported():
     """Test scraper's _check_supported() method."""
     # pylint: disable=protected-access
@@ -203,3 +276,144 @@ def test_concat():
     assert concat([], 'prefix:') == ''
     assert concat(['test'], 'prefix:') == 'prefix:test'
     assert concat(['test', 'test'], 'prefix:') == 'prefix:test\nprefix:test'
+
+
+def test_artifact_store():
+    """Test that artifacts are created once."""
+    calls = []
+
+    def _factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'parsed': True}
+
+    store = ArtifactStore()
+    threads = [threading.Thread(target=store.get, args=('key', _factory))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get('key', _factory) == {'parsed': True}
+    assert len(calls) == 1
+    assert store.get('other', lambda: 'value') == 'value'
+
+    def _error():
+        calls.append(1)
+        raise ValueError('Broken file')
+
+    del calls[:]
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            store.get('error', _error)
+    assert len(calls) == 1
+
+
+def test_artifact_store_max_size():
+    """Test that the least recently used artifacts are removed."""
+    calls = []
+
+    def _factory():
+        calls.append(1)
+        return len(calls)
+
+    store = ArtifactStore(max_size=2)
+    assert store.get('first', _factory) == 1
+    assert store.get('second', _factory) == 2
+    assert store.get('first', _factory) == 1
+    assert store.get('third', _factory) == 3
+    assert store.get('first', _factory) == 1
+    assert store.get('second', _factory) == 4
+
+
+def test_artifact_store_max_size_error():
+    """Test that a store with a maximum size does not keep errors."""
+    calls = []
+
+    def _factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise IOError('Transient error')
+        return 'value'
+
+    store = ArtifactStore(max_size=2)
+    with pytest.raises(IOError):
+        store.get('key', _factory)
+    assert store.get('key', _factory) == 'value'
+    assert store.get('key', _factory) == 'value'
+    assert len(calls) == 2
+
+
+def test_artifact_store_valid():
+    """Test that an artifact out of date is created again."""
+    calls = []
+
+    def _factory():
+        calls.append(1)
+        return len(calls)
+
+    store = ArtifactStore(max_size=2)
+    assert store.get('key', _factory, lambda value: True) == 1
+    assert store.get('key', _factory, lambda value: value > 1) == 2
+    assert store.get('key', _factory, lambda value: value > 1) == 2
+    assert store.get('key', _factory) == 2
+
+
+def test_scraper_artifact():
+    """Test that scrapers share artifacts only through the store."""
+    calls = []
+
+    def _factory():
+        calls.append(1)
+        return 'artifact'
+
+    # pylint: disable=protected-access
+    params = {'artifact_store': ArtifactStore()}
+    for _ in range(2):
+        scraper = BaseScraperBasic('testfilename', 'test/mimetype',
+                                   params=params)
+        assert scraper._artifact('key', _factory) == 'artifact'
+    assert len(calls) == 1
+
+    scraper = BaseScraperBasic('testfilename', 'test/mimetype')
+    scraper._artifact('key', _factory)
+    scraper._artifact('key', _factory)
+    assert len(calls) == 3
+
+
+def test_shell_limits(monkeypatch):
+    """Test that Shell reports the exceeded limit."""
+
+    # pylint: disable=unused-argument
+    def _run_command_limited(cmd, limits, stdout=subprocess.PIPE, env=None):
+        return (-9, b'', b'', 'timeout')
+
+    monkeypatch.setattr(file_scraper.base, 'run_command_limited',
+                        _run_command_limited)
+    shell = Shell(['/usr/bin/testcommand'], limits={'timeout': 5})
+    assert shell.limit_error is None
+    assert shell.returncode == -9
+    assert shell.limit_error == \
+        'testcommand was stopped after the time limit of 5 seconds.'
+    assert Shell(['testcommand']).limit_error is None
+
+
+def test_tool_shell():
+    """Test that scrapers report the exceeded limits of their tools."""
+
+    class LimitedScraper(BaseScraperBasic):
+        """Scraper running a command with limits."""
+
+        def scrape_file(self):
+            self.shell = self._tool_shell(['sleep', '5'])
+            assert self.shell.returncode != 0
+            self._collect_elements()
+
+    params = {'tool_limits': {'default': {'timeout': 60, 'max_output': 10},
+                              'sleep': {'timeout': 0.2}}}
+    scraper = LimitedScraper('testfilename', 'test/mimetype', params=params)
+    scraper.scrape_file()
+    assert scraper.shell.limits == {'timeout': 0.2, 'max_output': 10}
+    assert scraper.errors() == \
+        'ERROR: sleep was stopped after the time limit of 0.2 seconds.'
+    assert scraper.well_formed is False
@@ -0,0 +1,148 @@
+"""
+Tests for the scraping result cache.
+
+This module tests that:
+    - Results can be stored to the cache and read from it.
+    - The cache key depends on the file content, the well-formed check
+      option, the scraper parameters, the content of the files given in the
+      parameters and the extra hash, but not on the file name.
+    - The least recently used results are evicted, when the cache grows over
+      its maximum size, and the total size of the results is kept up to
+      date, also when results are replaced and the cache is cleared.
+    - An already calculated digest of the file can be used for the key
+      instead of reading the file.
+    - Scraper uses the cached result instead of running the detectors and
+      scrapers for a file with identical content.
+"""
+import os
+import shutil
+
+import file_scraper.scraper
+from file_scraper.base import BaseScraper
+from file_scraper.cache import ResultCache
+from file_scraper.scraper import Scraper
+from file_scraper.utils import hexdigest, metadata
+
+TEST_FILE = 'tests/data/text_plain/valid__utf8.txt'
+
+
+class _CountingScraper(BaseScraper):
+    """Scraper which counts how many times it has been run."""
+
+    runs = 0
+
+    def scrape_file(self):
+        _CountingScraper.runs += 1
+        self.messages('Scraped.')
+        self._collect_elements()
+
+    @metadata()
+    def _stream_type(self):
+        return 'text'
+
+
+def test_put_get(testpath):
+    """Test storing and reading results."""
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'))
+    result = {'mimetype': 'text/plain', 'streams': {0: {'index': 0}}}
+    assert cache.get('key') is None
+    cache.put('key', result)
+    assert cache.get('key') == result
+    cache.clear()
+    assert cache.get('key') is None
+
+
+def test_key(testpath):
+    """Test that the key depends on the content and options."""
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'))
+    copy = os.path.join(testpath, 'copy.txt')
+    shutil.copy(TEST_FILE, copy)
+    key = cache.key(TEST_FILE, True, {})
+    assert cache.key(copy, True, {}) == key
+    assert cache.key(TEST_FILE, False, {}) != key
+    assert cache.key(TEST_FILE, True, {'delimiter': ';'}) != key
+    assert ResultCache(extra_hash='jhove-1.20').key(
+        TEST_FILE, True, {}) != key
+    assert cache.key(None, True, {}, digest=hexdigest(
+        TEST_FILE, 'SHA-256')) == key
+    with open(copy, 'ab') as outfile:
+        outfile.write(b'changed')
+    assert cache.key(copy, True, {}) != key
+
+
+def test_key_param_files(testpath):
+    """Test that the key depends on the files given in the parameters."""
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'))
+    rules = os.path.join(testpath, 'rules.sch')
+    with open(rules, 'wb') as outfile:
+        outfile.write(b'first rules')
+    key = cache.key(TEST_FILE, True, {'schematron': rules})
+    with open(rules, 'wb') as outfile:
+        outfile.write(b'other rules')
+    assert cache.key(TEST_FILE, True, {'schematron': rules}) != key
+
+
+def _total_size(cache):
+    """Return the stored total size of the results."""
+    # pylint: disable=protected-access
+    connection = cache._connect()
+    try:
+        return connection.execute(
+            "SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_total_size(testpath):
+    """Test that the total size of the results is kept up to date."""
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'),
+                        max_size=2000)
+    cache.put('first', {'data': 'x' * 800})
+    first_size = _total_size(cache)
+    cache.put('first', {'data': 'x' * 900})
+    assert _total_size(cache) == first_size + 100
+    cache.put('second', {'data': 'x' * 800})
+    cache.put('third', {'data': 'x' * 800})
+    assert _total_size(cache) == 2 * first_size
+    cache.clear()
+    assert _total_size(cache) == 0
+
+
+def test_eviction(testpath):
+    """Test that the least recently used results are evicted."""
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'),
+                        max_size=2000)
+    cache.put('first', {'data': 'x' * 800})
+    cache.put('second', {'data': 'x' * 800})
+    assert cache.get('first') is not None
+    cache.put('third', {'data': 'x' * 800})
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
+
+
+def test_scraper_cache(testpath, monkeypatch):
+    """Test that Scraper reuses the cached results."""
+    # pylint: disable=unused-argument
+    def _iter_scrapers(mimetype, version, check_wellformed, params):
+        return [_CountingScraper]
+
+    monkeypatch.setattr(file_scraper.scraper, 'iter_detectors', lambda: [])
+    monkeypatch.setattr(file_scraper.scraper, 'iter_scrapers', _iter_scrapers)
+    cache = ResultCache(os.path.join(testpath, 'cache.sqlite'))
+    copy = os.path.join(testpath, 'copy.txt')
+    shutil.copy(TEST_FILE, copy)
+
+    _CountingScraper.runs = 0
+    scraper = Scraper(TEST_FILE)
+    scraper.scrape(result_cache=cache)
+    cached = Scraper(copy)
+    cached.scrape(result_cache=cache)
+    assert _CountingScraper.runs == 1
+    assert cached.filename == copy
+    assert cached.streams == scraper.streams
+    assert cached.info == scraper.info
+    assert cached.well_formed == scraper.well_formed
+
+    cached.scrape(check_wellformed=False, result_cache=cache)
+    assert _CountingScraper.runs == 2
@@ -5,9 +5,12 @@ This module tests that:
     - FidoDetector and MagicDetector detect MIME types correctly.
     - FidoDetector returns an empty dict from get_important() with
       certain mimetypes and MagicDetector returns certain mimetypes.
+    - The Fido signature engine is shared between detections and rebuilt
+      when the signature files change.
 """
 import pytest
-from file_scraper.detectors import FidoDetector, MagicDetector
+import file_scraper.detectors
+from file_scraper.detectors import FidoDetector, MagicDetector, fido_engine
 from tests.common import get_files
 
 CHANGE_FIDO = {
@@ -72,3 +75,16 @@ def test_important(detector_class, mimetype):
         assert detector.get_important() == {}
     else:
         assert detector.get_important() == {'mimetype': mimetype}
+
+
+def test_fido_engine(monkeypatch):
+    """Test that the Fido engine is cached until the signatures change."""
+    engine = fido_engine()
+    assert fido_engine() is engine
+    assert engine.formats
+
+    monkeypatch.setattr(file_scraper.detectors, '_fido_signature_stamp',
+                        lambda: (('formats-v94.xml', 1, 1),))
+    new_engine = fido_engine()
+    assert new_engine is not engine
+    assert fido_engine() is new_engine
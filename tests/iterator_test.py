@@ -4,11 +4,38 @@ Test for file_scraper.scrapers.
 This module tests that:
     - iter_scrapers(mimetype, version) returns the correct scrapers.
     - iter_detectors() returns the correct detectors.
+    - planned_scrapers() returns the same scrapers as calling is_supported()
+      of all scraper classes, in the registry order, also with the well-formed
+      check disabled and with a Schematron file given.
+    - The dispatch index is built only once, and again when new scraper
+      classes are defined.
+    - Threads dispatching at the same time as the indexes are built again
+      get complete indexes.
+    - The registered mimetypes of the scrapers are the supported mimetypes
+      of the scraper classes, and is_supported() returns True only for the
+      registered mimetypes.
+    - Importing the scraper does not import the scraper modules or their
+      3rd party libraries, and registered scrapers are imported only for
+      files of their mimetypes.
 """
+import itertools
+import subprocess
+import sys
+import threading
 
 import pytest
 
-from file_scraper.iterator import iter_scrapers, iter_detectors
+from file_scraper.base import BaseScraper
+from file_scraper.iterator import (SCRAPERS, SCRAPER_SUPERCLASSES,
+                                   ScraperNotFound, _DISPATCH, _REGISTRY,
+                                   _dispatch_index, iter_detectors,
+                                   iter_scrapers, load_class,
+                                   planned_scrapers, registered_scrapers,
+                                   scraper_names)
+from file_scraper.scrapers.schematron import Schematron
+
+MIMETYPES = ["text/xml", "text/html", "application/pdf", "image/tiff",
+             "audio/x-wav", "test/unknown"]
 
 
 @pytest.mark.parametrize(
@@ -91,3 +118,131 @@ def test_iter_detectors():
     detectors = iter_detectors()
     assert set([x.__name__ for x in detectors]) == set(["FidoDetector",
                                                         "MagicDetector"])
+
+
+def _supporting_scrapers(mimetype, version, check_wellformed, params):
+    """
+    Return the scrapers supporting the file by calling is_supported(), the
+    registered scrapers first in the registry order.
+    """
+    registered = registered_scrapers()
+    others = [cls for (module, name) in SCRAPER_SUPERCLASSES
+              for cls in load_class(module, name).__subclasses__()
+              if cls not in registered]
+    scrapers = [cls for cls in registered + others
+                if cls.is_supported(mimetype, version, check_wellformed,
+                                    params)]
+    return scrapers or [ScraperNotFound]
+
+
+@pytest.mark.parametrize(
+    ["mimetype", "version"],
+    [("text/xml", "1.0"), ("text/html", "5.0"), ("application/pdf", "A-1b"),
+     ("application/pdf", "foo"), ("image/tiff", None), ("audio/x-wav", ""),
+     ("test/unknown", None)])
+def test_planned_scrapers(mimetype, version):
+    """Test that the planned scrapers are the supporting scrapers."""
+    for (check_wellformed, params) in itertools.product(
+            [True, False], [{}, {'schematron': 'file.sch'}]):
+        assert planned_scrapers(
+            mimetype, version, check_wellformed, params) == \
+            _supporting_scrapers(mimetype, version, check_wellformed, params)
+    assert planned_scrapers("text/xml", "1.0", True,
+                            {"schematron": "file.sch"}) == [Schematron]
+
+
+def test_dispatch_index():
+    """Test that the index is built again only for new scraper classes."""
+    index = _dispatch_index()
+    assert _dispatch_index() is index
+    assert planned_scrapers("test/dispatch", None) == [ScraperNotFound]
+
+    class DispatchScraper(BaseScraper):
+        """Scraper defined after building the index."""
+
+        _supported = {"test/dispatch": ["1.0"]}
+
+        def scrape_file(self):
+            pass
+
+    assert planned_scrapers("test/dispatch", "1.0") == [DispatchScraper]
+    assert planned_scrapers("test/dispatch", "2.0") == [ScraperNotFound]
+    assert _dispatch_index() is not index
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason='Requires Python 3')
+def test_concurrent_dispatch():
+    """Test dispatching in threads while the indexes are built again."""
+    mimetypes = ["text/xml", "image/png", "application/pdf", "text/csv"]
+    expected = dict((mimetype, planned_scrapers(mimetype, None))
+                    for mimetype in mimetypes)
+    errors = []
+
+    def _dispatch():
+        """Dispatch files and store the unexpected results."""
+        for _ in range(200):
+            for mimetype in mimetypes:
+                try:
+                    if planned_scrapers(mimetype, None) != \
+                            expected[mimetype]:
+                        errors.append(mimetype)
+                except Exception as error:  # pylint: disable=broad-except
+                    errors.append(error)
+
+    def _clear():
+        """Clear the indexes, as register_scraper() does."""
+        for _ in range(2000):
+            _REGISTRY.clear()
+            _DISPATCH.clear()
+
+    threads = [threading.Thread(target=_dispatch) for _ in range(4)]
+    threads.append(threading.Thread(target=_clear))
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+
+def test_registry():
+    """Test that the registry agrees with the scraper classes."""
+    classes = registered_scrapers()
+    assert len(set(classes)) == len(SCRAPERS)
+    for (cls, (_, _, mimetypes)) in zip(classes, SCRAPERS):
+        # pylint: disable=protected-access
+        assert set(cls._supported) <= set(mimetypes)
+        for (mimetype, version, check_wellformed, params) in \
+                itertools.product(MIMETYPES + list(cls._supported),
+                                  ["1.0", "5.0", None], [True, False],
+                                  [{}, {"schematron": "file.sch"}]):
+            if cls.is_supported(mimetype, version, check_wellformed, params):
+                assert mimetype in mimetypes
+    assert scraper_names() == sorted("%s.%s" % (cls.__module__, cls.__name__)
+                                     for cls in classes)
+
+
+def test_lazy_imports():
+    """Test that the scraper modules are imported only when needed."""
+    script = (
+        "import sys\n"
+        "from file_scraper.scraper import Scraper\n"
+        "from file_scraper.iterator import planned_scrapers\n"
+        "print(' '.join(sorted(sys.modules)))\n"
+        "planned_scrapers('text/csv', None)\n"
+        "print(' '.join(sorted(sys.modules)))\n")
+    output = subprocess.check_output([sys.executable, "-c", script])
+    (at_start, after_csv) = [set(line.split()) for line in
+                             output.decode("utf-8").splitlines()[-2:]]
+    heavy = set(["wand", "PIL", "magic", "fido", "lxml", "pymediainfo",
+                 "file_scraper.detectors", "file_scraper.scrapers.csv_scraper",
+                 "file_scraper.scrapers.magic"])
+    assert not at_start & heavy
+    assert "file_scraper.scrapers.csv_scraper" in after_csv
+    assert "file_scraper.scrapers.magic" in after_csv
+    assert "wand" not in after_csv
+    assert "PIL" not in after_csv
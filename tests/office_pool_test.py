@@ -0,0 +1,322 @@
+"""
+Tests for the LibreOffice profile pool.
+
+This module tests that:
+    - The Office scraper converts files with the profiles of the pool, when
+      parameter office_pool is given, and the initialized profile is used
+      again for the following files.
+    - The scratch directory is emptied after each conversion.
+    - A profile is created again after the maximum number of documents and
+      after a failed conversion.
+    - A document, which can not be converted, does not reset the profile.
+    - Conversions at the same time get profiles of their own.
+    - The pool of a process is created once, and removed when closed.
+    - With pyuno, the documents are converted in a long-lived LibreOffice
+      instance of the profile, which is started once and restarted only
+      after it has been stopped by the time limit. The instance is not used
+      with limits, which can not be applied to it, and the documents are
+      converted with soffice processes, if it can not be started.
+"""
+import os
+import stat
+import time
+
+import pytest
+
+import file_scraper.office_pool
+from file_scraper.office_pool import OfficePool, instance_limits, office_pool
+from file_scraper.scrapers.office import Office
+
+FAKE_SOFFICE = """#!/bin/sh
+case "$*" in
+    *--accept=*)
+        if [ -n "$FAKE_SOFFICE_NO_ACCEPT" ]; then exit 1; fi
+        exec sleep 1000 ;;
+esac
+for arg in "$@"; do
+    case "$arg" in
+        -env:UserInstallation=file:*) profile="${arg#*=file:}" ;;
+    esac
+    last="$arg"
+    if [ "$previous" = "--outdir" ]; then outdir="$arg"; fi
+    previous="$arg"
+done
+if [ ! -d "$profile" ]; then
+    mkdir -p "$profile"
+    echo "new profile"
+fi
+case "$last" in
+    *crash*) kill -KILL $$ ;;
+    *broken*) echo "Error: source file could not be loaded" >&2; exit 1 ;;
+esac
+name=$(basename "$last")
+touch "$outdir/${name%.*}.pdf"
+echo "convert $last -> $outdir/${name%.*}.pdf"
+"""
+
+FILENAME = 'tests/data/application_vnd.oasis.opendocument.text/valid_1.1.odt'
+MIMETYPE = 'application/vnd.oasis.opendocument.text'
+
+
+@pytest.fixture(autouse=True)
+def fake_soffice(tmpdir, monkeypatch):
+    """Put a fake soffice command in PATH."""
+    command = tmpdir.join('soffice')
+    command.write(FAKE_SOFFICE)
+    command.chmod(command.stat().mode | stat.S_IXUSR)
+    monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+
+
+class _Struct(object):
+    """UNO struct."""
+
+
+class _FakeUno(object):
+    """
+    Stand-in for the pyuno calls of the LibreOffice instance.
+
+    The connection gives a desktop, which converts the files by their
+    names: files with 'broken' in the name can not be loaded, and loading a
+    file with 'hang' in the name takes 1.5 seconds.
+    """
+
+    def __init__(self):
+        """Initialize the connection counter."""
+        self.connections = 0
+        self.ServiceManager = self  # pylint: disable=invalid-name
+
+    def getComponentContext(self):  # pylint: disable=invalid-name
+        """Return the local context."""
+        return self
+
+    def createInstanceWithContext(self, name, context):
+        """Return a resolver or the desktop."""
+        # pylint: disable=invalid-name, unused-argument
+        return self
+
+    def resolve(self, url):
+        """Connect to an instance."""
+        assert url.startswith('uno:pipe,name=file-scraper-office-')
+        if os.environ.get('FAKE_SOFFICE_NO_ACCEPT'):
+            raise IOError('No connection')
+        self.connections += 1
+        return self
+
+    @staticmethod
+    def systemPathToFileUrl(path):  # pylint: disable=invalid-name
+        """Return URL of a path."""
+        return 'file://' + path
+
+    @staticmethod
+    def createUnoStruct(name):  # pylint: disable=invalid-name
+        """Return a struct."""
+        assert name == 'com.sun.star.beans.PropertyValue'
+        return _Struct()
+
+    def loadComponentFromURL(self, url, frame, flags, properties):
+        """Load a document."""
+        # pylint: disable=invalid-name, unused-argument
+        if 'hang' in url:
+            time.sleep(1.5)
+        if 'broken' in url:
+            raise ValueError('Unsupported URL')
+        return self
+
+    @staticmethod
+    def supportsService(name):  # pylint: disable=invalid-name
+        """Return True for text documents."""
+        return name == 'com.sun.star.text.GenericTextDocument'
+
+    @staticmethod
+    def storeToURL(url, properties):  # pylint: disable=invalid-name
+        """Export the document."""
+        assert properties[0].Value == 'writer_pdf_Export'
+        open(url[len('file://'):], 'w').close()
+
+    def close(self, deliver):
+        """Close the document."""
+
+    def getCurrentComponent(self):  # pylint: disable=invalid-name
+        """Check the connection."""
+
+    def terminate(self):
+        """Stop the instance."""
+
+
+@pytest.fixture
+def fake_uno(monkeypatch):
+    """Use the LibreOffice instances with a fresh pool of the process."""
+    uno = _FakeUno()
+    monkeypatch.setattr(file_scraper.office_pool, 'uno', uno)
+    monkeypatch.setattr(file_scraper.office_pool, '_POOL', {})
+    yield uno
+    office_pool().close()
+
+
+def _scrape(filename=FILENAME, params=None):
+    """Scrape a file with the profile pool."""
+    scraper = Office(filename, MIMETYPE,
+                     params=dict(params or {}, office_pool=True))
+    scraper.scrape_file()
+    return scraper
+
+
+def _copy(tmpdir, name):
+    """Copy the test file to the given name."""
+    path = str(tmpdir.join(name))
+    with open(FILENAME, 'rb') as infile:
+        with open(path, 'wb') as outfile:
+            outfile.write(infile.read())
+    return path
+
+
+def test_profile_reused():
+    """Test that the initialized profile is used again."""
+    scraper = _scrape()
+    assert scraper.well_formed
+    assert not scraper.errors()
+    assert 'valid_1.1.pdf' in scraper.messages()
+    scraper = _scrape()
+    assert scraper.well_formed
+    assert 'new profile' not in scraper.messages()
+
+
+def test_scratch_cleaned(tmpdir):
+    """Test that the converted files are removed after conversion."""
+    pool = OfficePool(root=str(tmpdir.join('pool')))
+    with pool.profile() as profile:
+        open(os.path.join(profile.scratch, 'file.pdf'), 'w').close()
+        os.makedirs(os.path.join(profile.scratch, 'directory'))
+    assert os.listdir(profile.scratch) == []
+    with pool.profile() as next_profile:
+        assert next_profile is profile
+
+
+def test_profile_reset(tmpdir):
+    """Test that profiles are created again when needed."""
+    pool = OfficePool(max_documents=2, root=str(tmpdir.join('pool')))
+    with pool.profile() as profile:
+        marker = os.path.join(profile.home, 'marker')
+        open(marker, 'w').close()
+    assert os.path.exists(marker)
+    with pool.profile() as profile:
+        pass
+    assert not os.path.exists(marker)
+    assert profile.documents == 0
+
+    open(marker, 'w').close()
+    with pool.profile() as profile:
+        profile.failed = True
+    assert not os.path.exists(marker)
+
+    open(marker, 'w').close()
+    with pytest.raises(ValueError):
+        with pool.profile() as profile:
+            raise ValueError('Conversion failed')
+    assert not os.path.exists(marker)
+    assert os.path.isdir(profile.scratch)
+
+
+def test_crash(tmpdir):
+    """Test that a crashed conversion resets the profile."""
+    crash_file = _copy(tmpdir, 'crash.odt')
+    _scrape()
+    assert 'new profile' not in _scrape().messages()
+    _scrape(crash_file)
+    assert 'new profile' in _scrape().messages()
+
+
+def test_broken_document(tmpdir):
+    """Test that a document, which can not be converted, does not reset
+    the profile.
+    """
+    _scrape()
+    scraper = _scrape(_copy(tmpdir, 'broken.odt'))
+    assert not scraper.well_formed
+    assert 'could not be loaded' in scraper.errors()
+    assert 'new profile' not in _scrape().messages()
+
+
+def test_concurrent_profiles(tmpdir):
+    """Test that conversions at the same time use different profiles."""
+    pool = OfficePool(root=str(tmpdir.join('pool')))
+    with pool.profile() as first, pool.profile() as second:
+        assert first.path != second.path
+    with pool.profile() as profile:
+        assert profile in [first, second]
+
+
+def test_office_pool(tmpdir):
+    """Test the pool of the process."""
+    assert office_pool() is office_pool()
+    pool = OfficePool(root=str(tmpdir.join('pool')))
+    with pool.profile():
+        pass
+    assert os.path.isdir(pool.root)
+    pool.close()
+    assert not os.path.exists(pool.root)
+
+
+@pytest.mark.parametrize(('limits', 'expected'), [
+    (None, {}),
+    ({'timeout': 10, 'memory': 2**31, 'max_output': None},
+     {'timeout': 10, 'memory': 2**31}),
+    ({'timeout': 10, 'cpu_time': 10}, None),
+    ({'max_output': 1000}, None),
+])
+def test_instance_limits(fake_uno, limits, expected):
+    """Test the limits, with which the instance is used."""
+    assert instance_limits(limits) == expected
+
+
+def test_instance_limits_without_uno():
+    """Test that the instance is not used without pyuno."""
+    if file_scraper.office_pool.uno is None:
+        assert instance_limits(None) is None
+
+
+def test_instance(fake_uno, tmpdir):
+    """Test that the documents are converted in one instance."""
+    for _ in range(3):
+        scraper = _scrape()
+        assert scraper.well_formed
+        assert not scraper.errors()
+        assert 'valid_1.1.pdf using filter : writer_pdf_Export' in \
+            scraper.messages()
+        assert 'new profile' not in scraper.messages()
+    scraper = _scrape(_copy(tmpdir, 'broken.odt'))
+    assert not scraper.well_formed
+    assert 'could not be loaded' in scraper.errors()
+    assert _scrape().well_formed
+    assert fake_uno.connections == 1
+
+
+def test_instance_timeout(fake_uno, tmpdir):
+    """Test that the instance is stopped and restarted after the time
+    limit.
+    """
+    params = {'tool_limits': {'soffice': {'timeout': 0.5}}}
+    assert _scrape(params=params).well_formed
+    scraper = _scrape(_copy(tmpdir, 'hang.odt'), params=params)
+    assert not scraper.well_formed
+    assert 'soffice was stopped after the time limit of 0.5 seconds.' in \
+        scraper.errors()
+    assert fake_uno.connections == 1
+    assert _scrape(params=params).well_formed
+    assert fake_uno.connections == 2
+
+
+@pytest.mark.parametrize('params', [
+    {'tool_limits': {'soffice': {'cpu_time': 10}}},
+    {'no_accept': True},
+])
+def test_instance_not_used(fake_uno, monkeypatch, params):
+    """Test that soffice processes are used, when the instance can not be
+    used.
+    """
+    if params.pop('no_accept', False):
+        monkeypatch.setenv('FAKE_SOFFICE_NO_ACCEPT', '1')
+    scraper = _scrape(params=params)
+    assert scraper.well_formed
+    assert 'new profile' in scraper.messages()
+    assert fake_uno.connections == 0
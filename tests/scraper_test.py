@@ -9,15 +9,30 @@ This module tests that:
     - checksum() method raises ValueError when illegal algorithm is given.
     - checksum() method raises IOError when checksum calculation is attempted
       for a file that does not exist.
+    - checksums() method calculates several checksums with one read pass,
+      and checksums requested in scrape() are calculated in the same pass
+      as the cache key and not calculated again afterwards.
     - empty text files are not well-formed according to the scraper.
     - non-existent files are not well-formed according to the scraper.
     - giving None instead of a file name to the scraper results in successful
       scraping with a result of not well-formed.
+    - scrape_many() returns a scraped result for every given file, both with
+      a worker pool and in the calling process, and the results match the
+      results of a single Scraper.
+    - the cache parameter of the Schematron scraper is given to the scraper
+      through scrape_many(), and not taken as the result cache.
+    - concurrent scraping combines the scraper results in the same order and
+      with the same result as sequential scraping.
 """
+import os
+import time
 import pytest
 import file_scraper.scraper
-from file_scraper.scraper import Scraper
+from file_scraper.cache import ResultCache
+from file_scraper.scraper import Scraper, scrape_many
 from file_scraper.base import BaseScraper
+from file_scraper.scrapers.schematron import Schematron
+from file_scraper.utils import hexdigests, metadata
 
 
 class _TestScraper(BaseScraper):
@@ -34,6 +49,33 @@ class _TestScraper(BaseScraper):
         return self.filename == 'textfile'
 
 
+class _SlowScraper(BaseScraper):
+    """Scraper which takes the given time to finish."""
+
+    _delay = 0
+
+    def scrape_file(self):
+        time.sleep(self._delay)
+        self.messages('%s finished' % self.__class__.__name__)
+        self._collect_elements()
+
+    @metadata()
+    def _stream_type(self):
+        return 'binary'
+
+
+class _SlowScraper1(_SlowScraper):
+    """Scraper which finishes last."""
+
+    _delay = 0.2
+
+
+class _SlowScraper2(_SlowScraper):
+    """Scraper which finishes first."""
+
+    _delay = 0
+
+
 def test_is_textfile(monkeypatch):
     """Test that CheckTextFile well-formed value is returned."""
     monkeypatch.setattr(file_scraper.scraper, 'CheckTextFile', _TestScraper)
@@ -56,6 +98,33 @@ def test_checksum():
         assert scraper.checksum()
 
 
+def test_checksums(testpath, monkeypatch):
+    """Test that the checksums are calculated with one read pass."""
+    passes = []
+
+    def _hexdigests(filename, algorithms, extra_hash=None):
+        passes.append(list(algorithms))
+        return hexdigests(filename, algorithms, extra_hash)
+
+    monkeypatch.setattr(file_scraper.scraper, 'hexdigests', _hexdigests)
+    monkeypatch.setattr(file_scraper.scraper, 'iter_detectors', lambda: [])
+    monkeypatch.setattr(file_scraper.scraper, 'iter_scrapers',
+                        lambda **kwargs: [_SlowScraper])
+    scraper = Scraper('tests/data/text_plain/valid__utf8.txt')
+    assert scraper.checksums(['MD5', 'SHA-1']) == {
+        'MD5': 'b40c60d0770eb7bd1a345725f857c61a',
+        'SHA-1': 'a0d01fcbff5d86327d542687dcfd8b299d054147'}
+    assert scraper.checksum('SHA-1') == \
+        'a0d01fcbff5d86327d542687dcfd8b299d054147'
+    assert passes == [['MD5', 'SHA-1']]
+
+    del passes[:]
+    scraper.scrape(
+        result_cache=ResultCache(os.path.join(testpath, 'cache.sqlite')),
+        checksums=['MD5', 'SHA-1'])
+    assert scraper.checksum() == 'b40c60d0770eb7bd1a345725f857c61a'
+    assert passes == [['MD5', 'SHA-1', 'SHA-256']]
+
 def test_empty_file():
     """Test empty file."""
     scraper = Scraper('test/data/text_plain/invalid__empty.txt')
@@ -72,3 +141,82 @@ def test_missing_file():
     scraper = Scraper(None)
     scraper.scrape()
     assert not scraper.well_formed
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_scrape_many_missing_files(workers):
+    """Test that batch scraping results every given file."""
+    filenames = ['missing_file_%s' % index for index in range(4)]
+    scrapers = list(scrape_many(filenames, workers=workers))
+    assert sorted([scraper.filename for scraper in scrapers]) == filenames
+    for scraper in scrapers:
+        assert scraper.well_formed is False
+
+
+class _SchematronCacheScraper(Schematron):
+    """Schematron scraper reporting its cache parameter."""
+
+    def scrape_file(self):
+        # pylint: disable=protected-access
+        self.messages('cache: %s' % self._cache)
+        self._collect_elements()
+
+
+def test_scrape_many_schematron_cache(monkeypatch):
+    """Test giving the cache parameter of Schematron to scrape_many()."""
+    monkeypatch.setattr(file_scraper.scraper, 'iter_detectors', lambda: [])
+    monkeypatch.setattr(file_scraper.scraper, 'iter_scrapers',
+                        lambda **kwargs: [_SchematronCacheScraper])
+    (scraper,) = scrape_many(['tests/data/text_xml/valid_1.0_xsd.xml'],
+                             workers=1,
+                             schematron='tests/data/text_xml/local.sch',
+                             cache=False)
+    assert scraper.info[0]['messages'] == 'cache: False'
+
+
+def test_scrape_many():
+    """Test that batch scraping results match with single file scraping."""
+    filenames = ['tests/data/text_plain/valid__utf8.txt',
+                 'tests/data/image_png/valid_1.2.png']
+    results = {}
+    for scraper in scrape_many(filenames, workers=2, check_wellformed=False):
+        results[scraper.filename] = scraper
+
+    for filename in filenames:
+        scraper = Scraper(filename)
+        scraper.scrape(check_wellformed=False)
+        assert results[filename].mimetype == scraper.mimetype
+        assert results[filename].version == scraper.version
+        assert results[filename].streams == scraper.streams
+        assert results[filename].well_formed == scraper.well_formed
+
+
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_concurrent_order(monkeypatch, concurrent):
+    """Test that scraper results are combined in the iteration order."""
+    # pylint: disable=unused-argument
+    def _iter_scrapers(mimetype, version, check_wellformed, params):
+        return [_SlowScraper1, _SlowScraper2]
+
+    monkeypatch.setattr(file_scraper.scraper, 'iter_detectors', lambda: [])
+    monkeypatch.setattr(file_scraper.scraper, 'iter_scrapers', _iter_scrapers)
+    scraper = Scraper('tests/data/text_plain/valid__utf8.txt')
+    scraper.scrape(concurrent=concurrent)
+    assert [scraper.info[index]['class'] for index in range(2)] == [
+        '_SlowScraper1', '_SlowScraper2']
+    assert scraper.streams[0]['stream_type'] == 'binary'
+    assert scraper.well_formed
+
+
+def test_concurrent():
+    """Test that concurrent scraping gives the same result as sequential."""
+    for filename in ['tests/data/video_mp4/valid__h264_aac.mp4',
+                     'tests/data/image_png/valid_1.2.png']:
+        sequential = Scraper(filename)
+        sequential.scrape(check_wellformed=False)
+        concurrent = Scraper(filename)
+        concurrent.scrape(check_wellformed=False, concurrent=True)
+        assert concurrent.mimetype == sequential.mimetype
+        assert concurrent.version == sequential.version
+        assert concurrent.streams == sequential.streams
+        assert concurrent.info == sequential.info
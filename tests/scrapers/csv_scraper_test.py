@@ -20,6 +20,18 @@ This module tests that:
       full well-formed check and for empty, None or arbitrary string as the
       version.
     - MIME type other than 'text/csv' is not supported
+    - the streaming check gives the same results for these files as the
+      default check.
+    - the streaming check collects the given number of quoting, field count
+      and character encoding errors with their line numbers and byte
+      offsets, also when the errors are in different read blocks, and
+      reports them in file order, also when an encoding error is found by
+      reading ahead of the earlier CSV errors.
+    - the streaming check locates the errors of records spanning several
+      lines at the first line of the record, and reports all errors with
+      max_errors None.
+    - the streaming check finds the delimiter of a file with CR LF line
+      breaks, and gives the same result as the default check.
 """
 
 import os
@@ -118,7 +130,8 @@ MISSING_END_QUOTE = VALID_CSV + \
          'invalid__', ['year', 'brand', 'model', 'detail', 'other'])
     ]
 )
-def test_scraper(testpath, csv_text, result_dict, prefix, header,
+@pytest.mark.parametrize('streaming', [False, True])
+def test_scraper(testpath, csv_text, result_dict, prefix, header, streaming,
                  evaluate_scraper):
     """Write test data and run csv scraping for the file."""
 
@@ -134,16 +147,18 @@ def test_scraper(testpath, csv_text, result_dict, prefix, header,
         correct.filename, correct.mimetype, True, params={
             'separator': correct.streams[0]['separator'],
             'delimiter': correct.streams[0]['delimiter'],
-            'fields': header})
+            'fields': header,
+            'streaming': streaming})
     scraper.scrape_file()
 
     evaluate_scraper(scraper, correct)
 
 
-def test_pdf_as_csv():
+@pytest.mark.parametrize('streaming', [False, True])
+def test_pdf_as_csv(streaming):
     """Test CSV scraper with PDF files."""
 
-    scraper = Csv(PDF_PATH, MIMETYPE)
+    scraper = Csv(PDF_PATH, MIMETYPE, params={'streaming': streaming})
     scraper.scrape_file()
 
     assert not scraper.well_formed, scraper.messages() + scraper.errors()
@@ -151,12 +166,13 @@ def test_pdf_as_csv():
     assert scraper.errors()
 
 
-def test_no_parameters(testpath):
+@pytest.mark.parametrize('streaming', [False, True])
+def test_no_parameters(testpath, streaming):
     """Test scraper without separate parameters."""
     with open(os.path.join(testpath, 'valid__.csv'), 'wb') as outfile:
         outfile.write(VALID_CSV)
 
-    scraper = Csv(outfile.name, MIMETYPE)
+    scraper = Csv(outfile.name, MIMETYPE, params={'streaming': streaming})
     scraper.scrape_file()
 
     assert scraper.mimetype == MIMETYPE
@@ -165,6 +181,99 @@ def test_no_parameters(testpath):
     assert scraper.well_formed
 
 
+@pytest.mark.parametrize('max_errors', [1, 10])
+def test_streaming_errors(testpath, max_errors):
+    """Test that the streaming check collects errors with offsets."""
+    short_line = HEADER + VALID_CSV.split(b'\n')[0] + b'\n'
+    invalid_char = short_line + b'1,2,3\n' + b'1,2,3,4,5\n' * 110000
+    invalid_quote = invalid_char + b'1,\xff,3,4,5\n'
+    csv_text = invalid_quote + b'1,"2"x,3,4,5\n'
+    with open(os.path.join(testpath, 'invalid__.csv'), 'wb') as outfile:
+        outfile.write(csv_text)
+
+    scraper = Csv(outfile.name, MIMETYPE, params={
+        'delimiter': ',', 'separator': '\n', 'streaming': True,
+        'max_errors': max_errors})
+    scraper.scrape_file()
+
+    errors = [
+        'CSV not well-formed: wrong field count on line 3, 5 fields '
+        'expected (byte offset %s).' % len(short_line),
+        'Invalid UTF-8 character: invalid start byte (byte offset %s).'
+        % (len(invalid_char) + 2),
+        'CSV error on line %s: \',\' expected after \'"\' (byte offset %s).'
+        % (csv_text.count(b'\n'), len(invalid_quote))]
+    assert scraper.errors() == '\n'.join(
+        'ERROR: %s' % error for error in errors[:max_errors])
+    assert not scraper.well_formed
+    assert 'successfully' not in scraper.messages()
+
+
+def test_streaming_error_order(testpath):
+    """Test that encoding errors read ahead do not hide earlier errors."""
+    csv_text = HEADER + b'1,2\n' + b'1,2,3\n' + b'1,2,3,4,\xff\n'
+    with open(os.path.join(testpath, 'invalid__.csv'), 'wb') as outfile:
+        outfile.write(csv_text)
+
+    scraper = Csv(outfile.name, MIMETYPE, params={
+        'delimiter': ',', 'separator': '\n', 'streaming': True,
+        'max_errors': 2})
+    scraper.scrape_file()
+
+    assert scraper.errors() == '\n'.join([
+        'ERROR: CSV not well-formed: wrong field count on line 2, 5 fields '
+        'expected (byte offset %s).' % len(HEADER),
+        'ERROR: CSV not well-formed: wrong field count on line 3, 5 fields '
+        'expected (byte offset %s).' % (len(HEADER) + 4)])
+
+
+def test_streaming_multiline_record(testpath):
+    """Test locating the errors of records spanning several lines."""
+    records = [b'a,b,c\n', b'1,"x\ny",3\n', b'\n', b'4,"multi\nline",6,7\n',
+               b'8,9,10\n', b'"1\n2",3\n', b'"x"y,z\n']
+    csv_text = b''.join(records)
+    with open(os.path.join(testpath, 'invalid__.csv'), 'wb') as outfile:
+        outfile.write(csv_text)
+
+    scraper = Csv(outfile.name, MIMETYPE, params={
+        'delimiter': ',', 'separator': '\n', 'streaming': True,
+        'max_errors': None})
+    scraper.scrape_file()
+
+    offsets = [len(b''.join(records[:index])) for index in [3, 5, 6]]
+    assert scraper.errors() == '\n'.join([
+        'ERROR: CSV not well-formed: wrong field count on line 5, 3 fields '
+        'expected (byte offset %s).' % offsets[0],
+        'ERROR: CSV not well-formed: wrong field count on line 8, 3 fields '
+        'expected (byte offset %s).' % offsets[1],
+        'ERROR: CSV error on line 10: \',\' expected after \'"\' '
+        '(byte offset %s).' % offsets[2]])
+    assert 'Check stopped' not in scraper.messages()
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+@pytest.mark.parametrize(
+    ['csv_text', 'well_formed', 'error'],
+    [
+        (b'id,name,value\r\n1,foo,3\r\n5,baz,6\r\n', True, ''),
+        (b'id,name,value\r\n1,foo,3\r\n4,bar\r\n5,baz,6\r\n', False,
+         'ERROR: CSV error on line 0: Could not determine delimiter'),
+    ]
+)
+def test_crlf(testpath, streaming, csv_text, well_formed, error):
+    """Test files with CR LF line breaks without the delimiter given."""
+    with open(os.path.join(testpath, 'crlf__.csv'), 'wb') as outfile:
+        outfile.write(csv_text)
+
+    scraper = Csv(outfile.name, MIMETYPE, params={'streaming': streaming})
+    scraper.scrape_file()
+
+    assert scraper.well_formed == well_formed
+    assert scraper.errors() == error
+    if well_formed:
+        assert scraper.streams[0]['delimiter'] == ','
+
+
 def test_no_wellformed(testpath):
     """Test scraper without well-formed check."""
     with open(os.path.join(testpath, 'valid__.csv'), 'wb') as outfile:
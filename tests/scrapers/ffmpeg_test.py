@@ -42,8 +42,13 @@ This module tests that:
       combinations as not supported.
     - A made up version with supported MIME type is reported as supported.
     - A made up MIME type with supported version is reported as not supported.
+    - The FFMpeg metadata base scraper finds the streams by index, also the
+      first of streams with the same index, and the stream types of the
+      streams of a file with many streams are collected correctly.
 """
+import ffmpeg
 import pytest
+from file_scraper.ffmpeg_base import FFMpeg
 from file_scraper.scrapers.ffmpeg import FFMpegWellformed
 from tests.common import parse_results
 
@@ -270,3 +275,59 @@ def test_is_supported_mpeg(mime, ver):
     assert not FFMpegWellformed.is_supported(mime, ver, False)
     assert FFMpegWellformed.is_supported(mime, 'foo', True)
     assert not FFMpegWellformed.is_supported('foo', ver, True)
+
+
+def _probe_result(videos, audios):
+    """
+    Return synthetic ffprobe result.
+
+    :videos: Number of video streams
+    :audios: Number of audio streams
+    :returns: ffprobe result as dict
+    """
+    streams = []
+    for index in range(videos + audios):
+        codec_type = 'video' if index < videos else 'audio'
+        streams.append({'index': index, 'codec_type': codec_type,
+                        'codec_long_name': '%s codec' % codec_type})
+    return {'format': {'format_name': 'mov'}, 'streams': streams}
+
+
+@pytest.mark.parametrize(['videos', 'audios', 'sound'],
+                         [(300, 200, 'Yes'), (500, 0, 'No')])
+def test_ffmpeg_streams(monkeypatch, videos, audios, sound):
+    """Test collecting the streams of a file with many streams."""
+    monkeypatch.setattr(ffmpeg, 'probe',
+                        lambda filename: _probe_result(videos, audios))
+    scraper = FFMpeg('testfilename', 'video/quicktime')
+    scraper.scrape_file()
+    assert len(scraper.streams) == videos + audios + 1
+    assert scraper.streams[0]['stream_type'] == 'videocontainer'
+    for index in range(1, videos + audios + 1):
+        stream = scraper.streams[index]
+        assert stream['index'] == index
+        if index <= videos:
+            assert stream['stream_type'] == 'video'
+            assert stream['sound'] == sound
+        else:
+            assert stream['stream_type'] == 'audio'
+            assert 'sound' not in stream
+        assert stream['codec_name'] == '%s codec' % stream['stream_type']
+
+
+def test_ffmpeg_set_tool_stream(monkeypatch):
+    """Test setting the stream by index."""
+    result = _probe_result(2, 1)
+    result['streams'].append({'index': 1, 'codec_type': 'data'})
+    monkeypatch.setattr(ffmpeg, 'probe', lambda filename: result)
+    scraper = FFMpeg('testfilename', 'video/quicktime')
+    scraper.scrape_file()
+    # pylint: disable=protected-access
+    scraper.set_tool_stream(2)
+    assert scraper._stream_type() == 'video'
+    scraper.set_tool_stream(3)
+    assert scraper._stream_type() == 'audio'
+    scraper.set_tool_stream(10)
+    assert scraper._stream_type() == 'audio'
+    scraper.set_tool_stream(0)
+    assert scraper._stream_type() == 'videocontainer'
@@ -88,12 +88,33 @@ This module tests that:
         - application/xhtml+xml, 1.0
     - Utf8JHove reports MIME type text/plain with '', None or a made up version
       as not supported, as well as a made up MIME type.
+    - With jhove_daemon parameter, JHove is run in the JHove daemon with the
+      absolute path of the file, and the JHove command line tool is used if
+      the daemon can not be reached or the Nailgun client can not be run.
+    - The JHove daemon listens to a unix socket in a directory readable only
+      by the user, and the socket is removed when the daemon is stopped.
+    - Each process has a JHove daemon of its own.
+    - A JHove run stopped by a resource limit, or giving a report which is
+      not well-formed, is reported in the errors of the scraper.
+    - The fields collected from the JHove report in one pass are the same as
+      with XPath queries, also for repeated fields and mixed content, and the
+      report is kept only when requested.
+    - The charset of HTML files is queried from the kept report, and fields
+      not collected from a report which is not kept are not accepted.
 """
 import os
+import stat
+import subprocess
+import sys
 import pytest
+from lxml import etree
 
+import file_scraper.base
+import file_scraper.jhove_base
+from file_scraper.jhove_base import NAMESPACES, REPORT_FIELDS, parse_report
 from file_scraper.scrapers.jhove import GifJHove, TiffJHove, PdfJHove, \
     Utf8JHove, JpegJHove, HtmlJHove, WavJHove
+from file_scraper.spawn_server import SpawnServerError
 from tests.common import parse_results
 
 
@@ -475,3 +496,202 @@ def test_is_supported_utf8(mime, ver, class_):
     assert not class_.is_supported(mime, ver, False)
     assert not class_.is_supported(mime, 'foo', True)
     assert not class_.is_supported('foo', ver, True)
+
+
+JHOVE_REPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<jhove xmlns="http://hul.harvard.edu/ois/xml/ns/jhove">
+ <repInfo uri="valid_1989a.gif">
+  <format>GIF</format>
+  <version>89a</version>
+  <status>Well-Formed and valid</status>
+  <mimeType>image/gif</mimeType>
+ </repInfo>
+</jhove>"""
+
+
+class _FakeDaemon(object):
+    """JHove daemon which only tells the command to run."""
+
+    def __init__(self):
+        self.stopped = False
+
+    def command(self, args):
+        return ['ng'] + args
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.mark.parametrize(
+    ['daemon_returncode', 'commands'],
+    [
+        (0, ['ng']),
+        (230, ['ng', 'jhove']),
+        (OSError, ['ng', 'jhove']),
+        (SpawnServerError, ['ng', 'jhove'])
+    ]
+)
+def test_jhove_daemon(monkeypatch, daemon_returncode, commands):
+    """Test JHove daemon usage and fallback to the command line tool."""
+    executed = []
+    daemon = _FakeDaemon()
+    filename = 'tests/data/image_gif/valid_1989a.gif'
+
+    # pylint: disable=unused-argument
+    def _run_command(cmd, stdout=subprocess.PIPE, env=None):
+        executed.append(cmd[0])
+        if cmd[0] == 'ng':
+            assert cmd[-1] == os.path.abspath(filename)
+            if daemon_returncode in [OSError, SpawnServerError]:
+                raise daemon_returncode('ng can not be run')
+            return (daemon_returncode,
+                    JHOVE_REPORT if daemon_returncode == 0 else b'', b'')
+        assert cmd[-1] == filename
+        return (0, JHOVE_REPORT, b'')
+
+    monkeypatch.setattr(file_scraper.base, 'run_command', _run_command)
+    monkeypatch.setattr(file_scraper.jhove_base, 'jhove_daemon',
+                        lambda: daemon)
+    scraper = GifJHove(filename, 'image/gif', True, {'jhove_daemon': True})
+    scraper.scrape_file()
+    assert executed == commands
+    assert daemon.stopped == (daemon_returncode != 0)
+    assert scraper.well_formed
+    assert scraper.streams[0]['version'] == '1989a'
+
+
+FAKE_NAILGUN_SERVER = """
+import socket, sys, time
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(sys.argv[1][len('local:'):])
+server.listen(1)
+time.sleep(60)
+"""
+
+
+def test_daemon_socket(monkeypatch):
+    """Test that the daemon listens to a private unix socket."""
+    monkeypatch.setattr(
+        file_scraper.jhove_base.JHoveDaemon, 'server_command',
+        lambda self: [sys.executable, '-c', FAKE_NAILGUN_SERVER,
+                      self.address])
+    daemon = file_scraper.jhove_base.JHoveDaemon()
+    assert daemon.start()
+    assert daemon.alive
+    path = daemon.address[len('local:'):]
+    socket_dir = os.path.dirname(path)
+    assert stat.S_IMODE(os.stat(socket_dir).st_mode) == 0o700
+    assert stat.S_ISSOCK(os.stat(path).st_mode)
+    assert daemon.command(['-h', 'xml'])[:3] == \
+        ['ng', '--nailgun-server', 'local:' + path]
+    daemon.stop()
+    assert not daemon.alive
+    assert not os.path.exists(socket_dir)
+
+
+def test_daemon_per_process(monkeypatch):
+    """Test that a daemon of another process is not used."""
+    # pylint: disable=protected-access
+    started = []
+
+    def _start(self):
+        """Pretend to start the daemon."""
+        started.append(self)
+        return True
+
+    monkeypatch.setattr(file_scraper.jhove_base.JHoveDaemon, 'start', _start)
+    monkeypatch.setattr(file_scraper.jhove_base, '_DAEMON', {})
+    other = file_scraper.jhove_base.JHoveDaemon()
+    file_scraper.jhove_base._DAEMON[os.getpid() + 1] = other
+    daemon = file_scraper.jhove_base.jhove_daemon()
+    assert daemon is not other
+    assert started == [daemon]
+    assert file_scraper.jhove_base._DAEMON == {os.getpid(): daemon}
+
+
+@pytest.mark.parametrize(
+    ['script', 'limits', 'error'],
+    [
+        ('sleep 5', {'timeout': 0.5},
+         'jhove was stopped after the time limit of 0.5 seconds.'),
+        ('echo "<jhove>"; yes', {'max_output': 1000, 'timeout': 10},
+         'jhove was stopped after its output exceeded 1000 bytes.'),
+        ('echo "<jhove>"', {'timeout': 10},
+         'JHove report is not well-formed')
+    ]
+)
+def test_limited_jhove(tmpdir, monkeypatch, script, limits, error):
+    """Test that a stopped or broken JHove run is reported as an error."""
+    jhove = tmpdir.join('jhove')
+    jhove.write('#!/bin/sh\n%s\n' % script)
+    jhove.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+    scraper = GifJHove('tests/data/image_gif/valid_1989a.gif', 'image/gif',
+                       True, {'tool_limits': {'jhove': limits}})
+    scraper.scrape_file()
+    assert not scraper.well_formed
+    assert error in scraper.errors()
+
+
+PROPERTY_REPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<jhove xmlns="http://hul.harvard.edu/ois/xml/ns/jhove">
+ <repInfo uri="valid_4.01.html">
+  <format>HTML</format>
+  <version>HTML 4.01</version>
+  <status>Well-Formed and valid</status>
+  <profile>first</profile>
+  <profile>second<!-- comment --> part</profile>
+  <profile/>
+  <mimeType>text/html</mimeType>
+  <properties>
+   <property>
+    <name>Content</name>
+    <values><value>text/html; charset=UTF-8</value></values>
+   </property>
+  </properties>
+ </repInfo>
+</jhove>"""
+
+
+@pytest.mark.parametrize('report', [JHOVE_REPORT, PROPERTY_REPORT])
+@pytest.mark.parametrize('keep_tree', [False, True])
+def test_parse_report(report, keep_tree):
+    """Test that the fields are the same as with XPath queries."""
+    (fields, tree) = parse_report(report, REPORT_FIELDS, keep_tree)
+    expected_tree = etree.fromstring(report)
+    for field in REPORT_FIELDS:
+        results = expected_tree.xpath('//j:%s/text()' % field,
+                                      namespaces=NAMESPACES)
+        assert fields.get(field) == ('\n'.join(results) or None)
+    if keep_tree:
+        assert etree.tostring(tree) == etree.tostring(expected_tree)
+    else:
+        assert tree is None
+
+
+def test_parse_report_invalid():
+    """Test that reports which are not well-formed are not accepted."""
+    for report in [b'', '', b'<jhove>']:
+        with pytest.raises(etree.XMLSyntaxError):
+            parse_report(report, REPORT_FIELDS)
+
+
+def test_report_fields(monkeypatch):
+    """Test querying the charset and fields not collected."""
+
+    # pylint: disable=unused-argument
+    def _run_command(cmd, stdout=subprocess.PIPE, env=None):
+        return (0, PROPERTY_REPORT, b'')
+
+    monkeypatch.setattr(file_scraper.base, 'run_command', _run_command)
+    scraper = HtmlJHove('tests/data/text_html/valid_4.01.html', 'text/html')
+    scraper.scrape_file()
+    assert scraper.streams[0]['charset'] == 'UTF-8'
+    assert scraper.streams[0]['version'] == '4.01'
+    assert scraper.report_field('name') == 'Content'
+
+    scraper = GifJHove('tests/data/image_gif/valid_1989a.gif', 'image/gif')
+    scraper.scrape_file()
+    assert scraper.report_field('status') == 'Well-Formed and valid'
+    with pytest.raises(ValueError):
+        scraper.report_field('name')
@@ -5,7 +5,9 @@ Tests for XML encoding validator.
 
 This module tests that:
     - Well-formed XML files with latin-1, utf-8 or utf-16 encodings are
-      reported as well_formed and the charset is identified correctly.
+      reported as well_formed and the charset is identified correctly, also
+      in the streaming mode.
+    - The charset is found also from an XML file, which is not well-formed.
     - When full scraping is not done, scraper messages contain 'Skipping
       scraper' and well-formedness be reported as None.
     - When full scraping is done, MIME type text/xml with version 1.0 and
@@ -24,13 +26,14 @@ import pytest
 from file_scraper.scrapers.lxml_encoding import XmlEncoding
 
 
+@pytest.mark.parametrize('streaming', [False, True])
 @pytest.mark.parametrize(
     'file_encoding',
     [
         'latin_1', 'utf_8', 'utf_16'
     ]
 )
-def test_xml_encoding(testpath, file_encoding):
+def test_xml_encoding(testpath, file_encoding, streaming):
     """Test that encoding check from XML header works."""
     enc_match = {'latin_1': u'ISO-8859-15',
                  'utf_8': u'UTF-8',
@@ -41,12 +44,25 @@ def test_xml_encoding(testpath, file_encoding):
     with open(tmppath, 'wb') as file_:
         file_.write(xml.encode(file_encoding))
 
-    scraper = XmlEncoding(tmppath, 'text/xml')
+    scraper = XmlEncoding(tmppath, 'text/xml',
+                          params={'streaming': streaming})
     scraper.scrape_file()
     assert scraper.streams[0]['charset'] == enc_match[file_encoding]
     assert scraper.well_formed
 
 
+def test_not_wellformed(testpath):
+    """Test that encoding is found from a file, which is not well-formed."""
+    xml = u'''<?xml version="1.0" encoding="ISO-8859-15" ?>
+              <a>åäö</b>'''
+    tmppath = os.path.join(testpath, 'invalid__.xml')
+    with open(tmppath, 'wb') as file_:
+        file_.write(xml.encode('latin_1'))
+    scraper = XmlEncoding(tmppath, 'text/xml')
+    scraper.scrape_file()
+    assert scraper.streams[0]['charset'] == 'ISO-8859-15'
+
+
 def test_no_wellformed(testpath):
     """Test scraper without well-formed check."""
     (_, tmppath) = tempfile.mkstemp()
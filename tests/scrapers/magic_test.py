@@ -78,8 +78,21 @@ This module tests that:
       text/html
     - Made up MIME type with any version is not supported
     - When full scraping is not done, none of these combinations are supported.
+
+    - The loaded libmagic cookies are reused also by other threads, a cookie
+      is not given to two callers at once, and the pool does not grow with
+      the number of threads.
+    - magic_analyze() returns None values, if libmagic gives no result.
+    - The combined magic query returns the same MIME type, encoding and
+      description as separate libmagic queries.
 """
+import contextlib
+import threading
+
+import magic
 import pytest
+from file_scraper import magic_base
+from file_scraper.magic_base import magic_analyze, magic_cookie
 from file_scraper.scrapers.magic import (OfficeFileMagic, TextFileMagic,
                                          XmlFileMagic, HtmlFileMagic,
                                          PngFileMagic, JpegFileMagic,
@@ -370,3 +383,70 @@ def test_is_supported_deny(mime, ver, class_):
     assert class_.is_supported(mime, ver, False)
     assert not class_.is_supported(mime, 'foo', True)
     assert not class_.is_supported('foo', ver, True)
+
+
+def test_magic_cookie():
+    """Test that the cookies are reused, but not by two callers at once."""
+    with magic_cookie(magic.MAGIC_MIME_TYPE) as cookie:
+        with magic_cookie(magic.MAGIC_MIME_TYPE) as other:
+            assert other is not cookie
+        with magic_cookie(magic.MAGIC_NONE) as other:
+            assert other is not cookie
+    with magic_cookie(magic.MAGIC_MIME_TYPE) as reused:
+        assert reused in [cookie, other]
+
+    cookies = []
+
+    def _use_cookie():
+        """Use a cookie in a thread."""
+        with magic_cookie(magic.MAGIC_MIME_TYPE) as thread_cookie:
+            cookies.append(thread_cookie)
+
+    for _ in range(10):
+        thread = threading.Thread(target=_use_cookie)
+        thread.start()
+        thread.join()
+    assert len(set(id(thread_cookie) for thread_cookie in cookies)) == 1
+
+
+def test_magic_analyze_no_result(monkeypatch):
+    """Test that a missing libmagic result gives None values."""
+
+    class _NoResult(object):
+        """Cookie without results."""
+
+        @staticmethod
+        def file(_):
+            """Return no result."""
+            return None
+
+    @contextlib.contextmanager
+    def _cookie(_):
+        """Give the cookie without results."""
+        yield _NoResult()
+
+    monkeypatch.setattr(magic_base, 'magic_cookie', _cookie)
+    assert magic_analyze('tests/data/text_plain/valid__utf8.txt') == {
+        'mimetype': None, 'encoding': None, 'description': None}
+
+
+@pytest.mark.parametrize(
+    'filename',
+    [
+        'tests/data/text_plain/valid__utf8.txt',
+        'tests/data/text_plain/invalid__empty.txt',
+        'tests/data/image_png/valid_1.2.png',
+        'tests/data/application_warc/valid_1.0_.warc.gz',
+    ])
+def test_magic_analyze(filename):
+    """Test that the combined query matches separate queries."""
+    expected = {}
+    for (key, flags) in [('mimetype', magic.MAGIC_MIME_TYPE),
+                         ('encoding', magic.MAGIC_MIME_ENCODING),
+                         ('description', magic.MAGIC_NONE)]:
+        magic_ = magic.open(flags)
+        magic_.load()
+        expected[key] = magic_.file(filename)
+        magic_.close()
+    assert magic_analyze(filename) == expected
+    assert magic_analyze(filename, description=False)['description'] is None
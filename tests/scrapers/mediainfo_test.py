@@ -24,8 +24,12 @@ This module tests that:
         - video/MP2T, ''
     - These MIME types are also supported with a made up version.
     - Made up MIME types are not supported.
+    - Mediainfo scrapers sharing an artifact store parse the file only once,
+      and the results are the same as without sharing.
 """
 import pytest
+import file_scraper.mediainfo_base
+from file_scraper.base import ArtifactStore
 from file_scraper.scrapers.mediainfo import MpegMediainfo, WavMediainfo, \
     MkvMediainfo, MovMediainfo
 from tests.common import parse_results
@@ -297,3 +301,26 @@ def test_is_supported_mpeg(mime, ver):
     assert MpegMediainfo.is_supported(mime, ver, False)
     assert MpegMediainfo.is_supported(mime, 'foo', True)
     assert not MpegMediainfo.is_supported('foo', ver, True)
+
+
+def test_shared_parse(monkeypatch):
+    """Test that the scrapers of a file share the parsed result."""
+    parse = file_scraper.mediainfo_base.MediaInfo.parse
+    calls = []
+
+    def _parse(filename):
+        calls.append(filename)
+        return parse(filename)
+
+    monkeypatch.setattr(file_scraper.mediainfo_base.MediaInfo, 'parse',
+                        staticmethod(_parse))
+    filename = 'tests/data/video_quicktime/valid__dv_wav.mov'
+    params = {'artifact_store': ArtifactStore()}
+    for class_ in [MovMediainfo, MpegMediainfo, MovMediainfo]:
+        shared = class_(filename, 'video/quicktime', params=params)
+        shared.scrape_file()
+        scraper = class_(filename, 'video/quicktime')
+        scraper.scrape_file()
+        assert shared.streams == scraper.streams
+        assert shared.info == scraper.info
+    assert len(calls) == 4
@@ -31,10 +31,27 @@ This module tests that:
       where [verbosity] is "verbose" if verbose is True, otherwise "".
 
     - Schematron removes extra copies of identical elements, but not if their
-      attributes differ.
+      attributes differ. Only consecutive active patterns and fired rules
+      are considered as copies.
+
+    - Schematron is compiled and documents are validated in-process, and the
+      compiled validator is reused from memory for the subsequent documents.
+    - With several schematron files, the document is parsed once, and the
+      results of each schematron are given in info.
+    - A schematron file is compiled only once, when several workers compile
+      it at the same time.
+    - The shared validators give the right results, when documents are
+      validated in several threads at the same time.
+    - The least recently used compiled files are removed from the cache
+      directory, when it grows over the cache size.
 """
 import os
+import shutil
+import threading
+
+import lxml
 import pytest
+from lxml import etree
 from file_scraper.scrapers.schematron import Schematron
 from tests.common import parse_results
 
@@ -129,14 +146,14 @@ def test_xslt_filename():
     """Test that checksum for xslt filename is calculated properly."""
     # pylint: disable=protected-access
     scraper = Schematron('filename', 'text/xml')
-    scraper._schematron_file = 'tests/data/text_xml/local.sch'
-    assert '76ed62' in scraper._generate_xslt_filename()
+    schematron_file = 'tests/data/text_xml/local.sch'
+    assert '76ed62' in scraper._generate_xslt_filename(schematron_file)
     scraper._verbose = True
-    assert 'ddb11a' in scraper._generate_xslt_filename()
+    assert 'ddb11a' in scraper._generate_xslt_filename(schematron_file)
     scraper._extra_hash = 'abc'
-    assert '550d66' in scraper._generate_xslt_filename()
+    assert '550d66' in scraper._generate_xslt_filename(schematron_file)
     scraper._verbose = False
-    assert '791b2e' in scraper._generate_xslt_filename()
+    assert '791b2e' in scraper._generate_xslt_filename(schematron_file)
 
 
 def test_filter_duplicate_elements():
@@ -159,7 +176,228 @@ def test_filter_duplicate_elements():
                <svrl:active-pattern id="id"/>
            </svrl:schematron-output>"""
     scraper = Schematron('filename', 'text/xml')
-    result = scraper._filter_duplicate_elements(schtest)
+    result = scraper._filter_duplicate_elements(etree.fromstring(schtest))
     assert result.count(b'<svrl:active-pattern') == 1
     assert result.count(b'<svrl:fired-rule') == 1
     assert result.count(b'<svrl:failed-assert') == 2
+
+
+def test_filter_duplicate_order():
+    """Test that only consecutive duplicates are filtered."""
+    # pylint: disable=protected-access
+    schtest = \
+        b"""<svrl:schematron-output
+            xmlns:svrl="http://purl.oclc.org/dsdl/svrl">
+               <svrl:active-pattern id="id"/>
+               <svrl:fired-rule context="context"/>
+               <svrl:active-pattern id="id"/>
+               <svrl:fired-rule context="context 2"/>
+               <svrl:active-pattern id="id 2"/>
+               <svrl:fired-rule context="context"/>
+               <svrl:active-pattern id="id"/>
+               <svrl:active-pattern/>
+               <svrl:active-pattern/>
+           </svrl:schematron-output>"""
+    scraper = Schematron('filename', 'text/xml')
+    result = scraper._filter_duplicate_elements(etree.fromstring(schtest))
+    root = etree.fromstring(result)
+    assert [element.get('id') for element in root.iterchildren(
+        '{http://purl.oclc.org/dsdl/svrl}active-pattern')] == \
+        ['id', 'id 2', 'id', None]
+    assert [element.get('context') for element in root.iterchildren(
+        '{http://purl.oclc.org/dsdl/svrl}fired-rule')] == \
+        ['context', 'context 2', 'context']
+
+
+def _schematron_dir(testpath):
+    """
+    Create directory of the compilation stylesheets for the tests.
+
+    The stylesheets bundled with lxml are used, without optimization.
+
+    :testpath: Test directory
+    :returns: Path to the stylesheet directory
+    """
+    schematron_dir = os.path.join(testpath, 'iso_schematron_xslt1')
+    shutil.copytree(os.path.join(
+        os.path.dirname(lxml.__file__),
+        'isoschematron/resources/xsl/iso-schematron-xslt1'), schematron_dir)
+    with open(os.path.join(schematron_dir, 'optimize_schematron.xsl'),
+              'wb') as outfile:
+        outfile.write(IDENTITY_XSL)
+    return schematron_dir
+
+
+def test_validator_cache(testpath, monkeypatch):
+    """Test in-process validation with the validators kept in memory."""
+    # pylint: disable=protected-access
+    schematron_dir = _schematron_dir(testpath)
+
+    compiled = []
+    compile_schematron = Schematron._compile_schematron
+
+    def _compile_schematron(self, schematron_file):
+        compiled.append(schematron_file)
+        return compile_schematron(self, schematron_file)
+
+    monkeypatch.setattr(Schematron, '_compile_schematron',
+                        _compile_schematron)
+
+    results = []
+    for filename in ['valid_1.0_well_formed.xml', 'invalid_1.0_local_xsd.xml',
+                     'invalid__empty.xml']:
+        scraper = Schematron(
+            os.path.join('tests/data/text_xml', filename), 'text/xml',
+            params={'schematron': 'tests/data/text_xml/local.sch'})
+        scraper._schematron_dirname = schematron_dir
+        scraper._cachepath = testpath
+        scraper.scrape_file()
+        results.append(scraper)
+
+    assert len(compiled) == 1
+    assert results[0].well_formed
+    assert '<svrl:schematron-output' in results[0].messages()
+    assert not results[1].well_formed
+    assert '<svrl:failed-assert ' in results[1].messages()
+    assert not results[2].well_formed
+    assert 'Document is empty' in results[2].errors()
+
+
+def test_multiple_schematrons(testpath, monkeypatch):
+    """Test validation with several schematron files."""
+    # pylint: disable=protected-access
+    schematron_dir = _schematron_dir(testpath)
+    heading_sch = os.path.join(testpath, 'heading.sch')
+    with open(heading_sch, 'wb') as outfile:
+        outfile.write(HEADING_SCH)
+
+    parsed = []
+    parse = etree.parse
+
+    def _parse(source, *args, **kwargs):
+        """Count the parsed documents."""
+        parsed.append(source)
+        return parse(source, *args, **kwargs)
+
+    filename = 'tests/data/text_xml/invalid_1.0_local_xsd.xml'
+    scraper = Schematron(filename, 'text/xml', params={
+        'schematron': [heading_sch, 'tests/data/text_xml/local.sch']})
+    scraper._schematron_dirname = schematron_dir
+    scraper._cachepath = testpath
+    monkeypatch.setattr(etree, 'parse', _parse)
+    scraper.scrape_file()
+
+    assert parsed.count(filename) == 1
+    assert not scraper.well_formed
+    results = scraper.info['schematron']
+    assert [result['schematron'] for result in results] == \
+        [heading_sch, 'tests/data/text_xml/local.sch']
+    assert results[0]['well_formed']
+    assert '<svrl:failed-assert ' not in results[0]['messages']
+    assert not results[1]['well_formed']
+    assert '<svrl:failed-assert ' in results[1]['messages']
+
+
+def test_single_flight_compile(testpath, monkeypatch):
+    """Test that parallel compilations of a file are done only once."""
+    # pylint: disable=protected-access
+    schematron_dir = _schematron_dir(testpath)
+    compiled = []
+    compile_to_file = Schematron._compile_to_file
+
+    def _compile_to_file(self, schematron_file, xslt_filename):
+        compiled.append(schematron_file)
+        return compile_to_file(self, schematron_file, xslt_filename)
+
+    monkeypatch.setattr(Schematron, '_compile_to_file', _compile_to_file)
+
+    def _compile():
+        """Compile the schematron file in one worker."""
+        scraper = Schematron('filename', 'text/xml')
+        scraper._schematron_dirname = schematron_dir
+        scraper._cachepath = testpath
+        results.append(scraper._compile_schematron(
+            'tests/data/text_xml/local.sch'))
+
+    results = []
+    threads = [threading.Thread(target=_compile) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(compiled) == 1
+    assert len(results) == 8
+    assert len(set(results)) == 1
+    assert os.path.isfile(results[0])
+
+
+def test_concurrent_validation(testpath):
+    """Test validating documents with a shared validator in threads."""
+    # pylint: disable=protected-access
+    schematron_dir = _schematron_dir(testpath)
+    filenames = ['valid_1.0_well_formed.xml', 'invalid_1.0_local_xsd.xml'] * 8
+    results = {}
+
+    def _scrape(index, filename):
+        """Validate one document."""
+        scraper = Schematron(
+            os.path.join('tests/data/text_xml', filename), 'text/xml',
+            params={'schematron': 'tests/data/text_xml/local.sch'})
+        scraper._schematron_dirname = schematron_dir
+        scraper._cachepath = testpath
+        scraper.scrape_file()
+        results[index] = scraper
+
+    threads = [threading.Thread(target=_scrape, args=(index, filename))
+               for (index, filename) in enumerate(filenames)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for (index, filename) in enumerate(filenames):
+        assert results[index].well_formed == filename.startswith('valid')
+        assert ('<svrl:failed-assert ' in results[index].messages()) != \
+            filename.startswith('valid')
+
+
+def test_cache_eviction(testpath):
+    """Test that least recently used compiled files are removed."""
+    # pylint: disable=protected-access
+    scraper = Schematron('filename', 'text/xml')
+    scraper._schematron_dirname = _schematron_dir(testpath)
+    scraper._cachepath = os.path.join(testpath, 'cache')
+    schematron_file = 'tests/data/text_xml/local.sch'
+
+    filenames = []
+    for extra_hash in ['first', 'second', 'third']:
+        scraper._extra_hash = extra_hash
+        filenames.append(scraper._compile_schematron(schematron_file))
+        os.utime(filenames[-1], (len(filenames), len(filenames)))
+    assert all(os.path.isfile(filename) for filename in filenames)
+
+    scraper._cache_size = 2 * os.path.getsize(filenames[0])
+    scraper._extra_hash = 'first'
+    scraper._compile_schematron(schematron_file)
+    scraper._extra_hash = 'fourth'
+    filenames.append(scraper._compile_schematron(schematron_file))
+    assert [os.path.isfile(filename) for filename in filenames] == \
+        [True, False, False, True]
+
+
+IDENTITY_XSL = b"""<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="@*|node()">
+    <xsl:copy><xsl:apply-templates select="@*|node()"/></xsl:copy>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+HEADING_SCH = b"""<sch:schema xmlns:sch="http://purl.oclc.org/dsdl/schematron">
+  <sch:ns prefix="local" uri="http://localhost/"/>
+  <sch:pattern id="check_heading">
+    <sch:rule context="local:note">
+      <sch:assert test="local:heading">Element heading not found.</sch:assert>
+    </sch:rule>
+  </sch:pattern>
+</sch:schema>"""
@@ -28,10 +28,24 @@ This module tests that:
     - A made up MIME type is not supported, but version is.
 
     - Schema, catalogs and network-usage can be defined as parameters.
+
+    - XSD validation in-process gives the same result as xmllint, and a
+      schema is compiled only once for several files.
+    - A local schema changed at the same path is compiled again, also when
+      the changed file is included by the top level schema, and a failed
+      schema compilation is not cached.
+    - The streaming mode gives the same results as the default mode, and the
+      streaming pass is shared with XmlEncoding.
+    - The parsed document tree is shared with XmlEncoding.
 """
 import os
 import pytest
+import file_scraper.scrapers.xmllint
+from file_scraper.base import ArtifactStore
+import file_scraper.scrapers.lxml_encoding
+from file_scraper.scrapers.lxml_encoding import XmlEncoding
 from file_scraper.scrapers.xmllint import Xmllint
+from file_scraper.xml_base import parse_xml, scan_xml
 from tests.common import parse_results
 
 ROOTPATH = os.path.abspath(os.path.join(
@@ -172,3 +186,200 @@ def test_parameters():
                       params={'catalog_path': 'catpath'})
     assert scraper._catalogs
     assert scraper._catalog_path == 'catpath'
+
+
+@pytest.mark.parametrize(
+    ['filename', 'well_formed'],
+    [
+        ('valid_1.0_local_xsd.xml', True),
+        ('invalid_1.0_local_xsd.xml', False)
+    ]
+)
+def test_validate_in_process(filename, well_formed, monkeypatch):
+    """Test XSD validation in-process and with xmllint."""
+    filename = os.path.join('tests/data/text_xml', filename)
+    params = {'schema': os.path.join(ROOTPATH,
+                                     'tests/data/text_xml/local.xsd'),
+              'no_network': False}
+    monkeypatch.setattr(file_scraper.scrapers.xmllint, '_SCHEMAS',
+                        ArtifactStore(max_size=1))
+    for in_process in [True, False]:
+        monkeypatch.setattr(Xmllint, '_validate_in_process',
+                            lambda self, value=in_process: value)
+        scraper = Xmllint(filename, 'text/xml', True, params)
+        scraper.scrape_file()
+        assert scraper.well_formed == well_formed
+        if well_formed:
+            assert 'Success' in scraper.messages()
+        else:
+            assert 'Schemas validity error' in scraper.errors()
+
+
+def test_schema_cache(monkeypatch):
+    """Test that the schema is compiled once for several files."""
+    compiled = []
+    xml_schema = file_scraper.scrapers.xmllint.etree.XMLSchema
+
+    def _xml_schema(*args, **kwargs):
+        """Count the compiled schemas."""
+        compiled.append(args)
+        return xml_schema(*args, **kwargs)
+
+    monkeypatch.setattr(file_scraper.scrapers.xmllint, '_SCHEMAS',
+                        ArtifactStore(max_size=1))
+    monkeypatch.setattr(file_scraper.scrapers.xmllint.etree, 'XMLSchema',
+                        _xml_schema)
+    params = {'schema': os.path.join(ROOTPATH,
+                                     'tests/data/text_xml/local.xsd'),
+              'no_network': False}
+    for filename in ['valid_1.0_local_xsd.xml', 'invalid_1.0_local_xsd.xml',
+                     'valid_1.0_local_xsd.xml']:
+        scraper = Xmllint(os.path.join('tests/data/text_xml', filename),
+                          'text/xml', True, params)
+        scraper.scrape_file()
+    assert len(compiled) == 1
+
+
+SIP_SCHEMA = b"""<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:element name="root">
+    <xs:complexType>
+      <xs:sequence><xs:element name="%s"/></xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>"""
+
+SIP_DOCUMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<root xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+      xsi:noNamespaceSchemaLocation="schema.xsd"><a/></root>"""
+
+
+def test_schema_cache_changed(tmpdir, monkeypatch):
+    """Test that a changed local schema is not used from the cache."""
+    monkeypatch.setattr(file_scraper.scrapers.xmllint, '_SCHEMAS',
+                        ArtifactStore(max_size=4))
+    monkeypatch.setattr(Xmllint, '_validate_in_process', lambda self: True)
+    tmpdir.join('document.xml').write(SIP_DOCUMENT, 'wb')
+    results = []
+    for element in [b'a', b'element_b']:
+        tmpdir.join('schema.xsd').write(SIP_SCHEMA % element, 'wb')
+        scraper = Xmllint(str(tmpdir.join('document.xml')), 'text/xml', True,
+                          {'no_network': False})
+        scraper.scrape_file()
+        results.append(scraper.well_formed)
+    assert results == [True, False]
+
+
+INCLUDING_SCHEMA = b"""<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <xs:include schemaLocation="types/included.xsd"/>
+</xs:schema>"""
+
+
+@pytest.mark.parametrize('schema_param', [False, True])
+def test_schema_cache_included(tmpdir, monkeypatch, schema_param):
+    """Test that a changed included schema is not used from the cache."""
+    monkeypatch.setattr(file_scraper.scrapers.xmllint, '_SCHEMAS',
+                        ArtifactStore(max_size=4))
+    monkeypatch.setattr(Xmllint, '_validate_in_process', lambda self: True)
+    tmpdir.join('document.xml').write(SIP_DOCUMENT, 'wb')
+    tmpdir.join('schema.xsd').write(INCLUDING_SCHEMA, 'wb')
+    params = {'no_network': False}
+    if schema_param:
+        params['schema'] = str(tmpdir.join('schema.xsd'))
+    results = []
+    for element in [b'a', b'element_b']:
+        tmpdir.join('types', 'included.xsd').write(
+            SIP_SCHEMA % element, 'wb', ensure=True)
+        scraper = Xmllint(str(tmpdir.join('document.xml')), 'text/xml', True,
+                          params)
+        scraper.scrape_file()
+        results.append(scraper.well_formed)
+    assert results == [True, False]
+
+
+def test_schema_error_not_cached(tmpdir, monkeypatch):
+    """Test that a failed schema compilation is not used from the cache."""
+    monkeypatch.setattr(file_scraper.scrapers.xmllint, '_SCHEMAS',
+                        ArtifactStore(max_size=4))
+    monkeypatch.setattr(Xmllint, '_validate_in_process', lambda self: True)
+    tmpdir.join('document.xml').write(SIP_DOCUMENT, 'wb')
+    schema = tmpdir.join('schema.xsd')
+    results = []
+    # The broken and fixed schemas have the same size and modification time
+    for content in [SIP_SCHEMA.replace(b'xs:sequence', b'xs:sekwence'),
+                    SIP_SCHEMA]:
+        schema.write(content % b'a', 'wb')
+        schema.setmtime(1000000000)
+        scraper = Xmllint(str(tmpdir.join('document.xml')), 'text/xml', True,
+                          {'no_network': False})
+        scraper.scrape_file()
+        results.append(scraper.well_formed)
+    assert results == [False, True]
+
+
+@pytest.mark.parametrize(
+    ['filename', 'params'],
+    [
+        ('valid_1.0_well_formed.xml', {}),
+        ('valid_1.0_dtd.xml', {}),
+        ('invalid_1.0_dtd.xml', {}),
+        ('valid_1.0_local_xsd.xml', {'schema': os.path.join(
+            ROOTPATH, 'tests/data/text_xml/local.xsd')}),
+        ('invalid_1.0_local_xsd.xml', {'schema': os.path.join(
+            ROOTPATH, 'tests/data/text_xml/local.xsd')}),
+        ('invalid_1.0_catalog.xml', {
+            'catalog_path': 'tests/data/text_xml/test-catalog.xml'}),
+        ('invalid_1.0_no_closing_tag.xml', {})
+    ]
+)
+def test_streaming(filename, params, monkeypatch):
+    """Test the streaming mode and sharing the pass with XmlEncoding."""
+    filename = os.path.join('tests/data/text_xml', filename)
+    scraper = Xmllint(filename, 'text/xml', True, params)
+    scraper.scrape_file()
+
+    scans = []
+
+    def _scan_xml(filename):
+        """Count the streaming passes."""
+        scans.append(filename)
+        return scan_xml(filename)
+
+    for module in [file_scraper.scrapers.xmllint,
+                   file_scraper.scrapers.lxml_encoding]:
+        monkeypatch.setattr(module, 'scan_xml', _scan_xml)
+    params = dict(params, streaming=True, artifact_store=ArtifactStore())
+    streaming = Xmllint(filename, 'text/xml', True, params)
+    streaming.scrape_file()
+    encoding = XmlEncoding(filename, 'text/xml', True, params)
+    encoding.scrape_file()
+
+    assert streaming.well_formed == scraper.well_formed
+    assert streaming.streams == scraper.streams
+    assert len(scans) == 1
+
+
+def test_shared_tree(monkeypatch):
+    """Test that the parsed document tree is shared with XmlEncoding."""
+    parsed = []
+
+    def _parse_xml(filename):
+        """Count the parsed documents."""
+        parsed.append(filename)
+        return parse_xml(filename)
+
+    for module in [file_scraper.scrapers.xmllint,
+                   file_scraper.scrapers.lxml_encoding]:
+        monkeypatch.setattr(module, 'parse_xml', _parse_xml)
+    params = {'schema': os.path.join(ROOTPATH,
+                                     'tests/data/text_xml/local.xsd'),
+              'artifact_store': ArtifactStore()}
+    filename = 'tests/data/text_xml/valid_1.0_local_xsd.xml'
+    scraper = Xmllint(filename, 'text/xml', True, params)
+    scraper.scrape_file()
+    encoding = XmlEncoding(filename, 'text/xml', True, params)
+    encoding.scrape_file()
+    assert scraper.well_formed
+    assert encoding.streams[0]['charset'] == 'UTF-8'
+    assert len(parsed) == 1
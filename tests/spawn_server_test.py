@@ -0,0 +1,143 @@
+"""
+Tests for the spawn server.
+
+This module tests that:
+    - Commands run in the spawn server give the same results as with
+      run_command(), also with stdout directed to a file and with custom
+      environment variables.
+    - The errors of running a command, e.g. a missing command, are raised
+      as in run_command().
+    - The resource limits are applied in the spawn server.
+    - Several commands are run in the spawn server at the same time.
+    - The spawn server is restarted, if it has died, and an exited server
+      is not used for running commands.
+    - A command is not run again, if the server exits while running it.
+    - The commands are run in the current working directory of the scraper
+      process.
+    - Scrapers give the same results with parameter spawn_server.
+"""
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+import pytest
+
+from file_scraper.base import Shell
+from file_scraper.scrapers.xmllint import Xmllint
+from file_scraper.spawn_server import (SpawnServerError,
+                                      SpawnServerUnavailable, spawn_server)
+from file_scraper.utils import run_command
+
+
+@pytest.mark.parametrize(
+    'command',
+    [
+        ['seq', '5'],
+        ['sh', '-c', 'echo error >&2; exit 2'],
+        ['printenv', 'FILE_SCRAPER_TEST']
+    ]
+)
+def test_run(command):
+    """Test that the results are the same as with run_command()."""
+    env = {'FILE_SCRAPER_TEST': 'testing'}
+    assert spawn_server().run(command, env=env) == \
+        run_command(command, env=env) + (None,)
+
+
+def test_run_to_file():
+    """Test having output of a command directed to a file."""
+    with NamedTemporaryFile('w+') as outfile:
+        shell = Shell(['seq', '3'], output_file=outfile, spawn=True)
+        assert shell.returncode == 0
+        assert not shell.stdout
+        outfile.seek(0)
+        assert outfile.read() == '1\n2\n3\n'
+
+
+def test_run_error():
+    """Test that the error of running a command is raised."""
+    with pytest.raises(OSError):
+        spawn_server().run(['file-scraper-nonexistent-command'])
+
+
+def test_limits():
+    """Test that the limits are applied in the spawn server."""
+    shell = Shell(['sleep', '10'], limits={'timeout': 0.2}, spawn=True)
+    assert shell.returncode != 0
+    assert shell.limit_error == \
+        'sleep was stopped after the time limit of 0.2 seconds.'
+
+
+def test_concurrent_commands():
+    """Test that several commands are run at the same time."""
+    shells = [Shell(['sleep', '0.5'], spawn=True) for _ in range(8)]
+    threads = [threading.Thread(target=shell.run) for shell in shells]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.time() - start < 2
+    assert all(shell.returncode == 0 for shell in shells)
+
+
+def test_restart():
+    """Test that a dead server is restarted, and not used after exit."""
+    server = spawn_server()
+    # pylint: disable=protected-access
+    server._process.kill()
+    server._process.wait()
+    with pytest.raises(SpawnServerUnavailable):
+        server.run(['true'])
+    assert Shell(['echo', 'test'], spawn=True).stdout == b'test\n'
+    assert spawn_server() is server
+    assert server.alive
+
+
+def test_exit_while_running(tmpdir):
+    """Test that a command is not run again, if the server exits."""
+    log = str(tmpdir.join('log'))
+    shell = Shell(['sh', '-c', 'echo run >> "$0"; sleep 1', log], spawn=True)
+    errors = []
+
+    def _run():
+        """Run the command and store the error."""
+        try:
+            shell.run()
+        except SpawnServerError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=_run)
+    thread.start()
+    while not tmpdir.join('log').check():
+        time.sleep(0.01)
+    server = spawn_server()
+    # pylint: disable=protected-access
+    server._process.kill()
+    thread.join()
+    assert len(errors) == 1
+    time.sleep(1.2)
+    assert tmpdir.join('log').read() == 'run\n'
+
+
+def test_working_directory(tmpdir, monkeypatch):
+    """Test that the commands are run in the current working directory."""
+    spawn_server()
+    tmpdir.join('file.txt').write('content')
+    monkeypatch.chdir(tmpdir)
+    assert Shell(['cat', 'file.txt'], spawn=True).stdout == b'content'
+    with open('output.txt', 'w') as outfile:
+        Shell(['echo', 'test'], output_file=outfile, spawn=True).run()
+    assert tmpdir.join('output.txt').read() == 'test\n'
+
+
+def test_scraper():
+    """Test that scrapers give the same results with the spawn server."""
+    filename = 'tests/data/text_xml/valid_1.0_dtd.xml'
+    scraper = Xmllint(filename, 'text/xml', params={'spawn_server': True})
+    scraper.scrape_file()
+    expected = Xmllint(filename, 'text/xml')
+    expected.scrape_file()
+    assert scraper.info == expected.info
+    assert scraper.well_formed == expected.well_formed
+    assert spawn_server().alive
@@ -8,6 +8,9 @@ This module tests the following utility functions:
         - MD5 algorithm can also be used.
         - An extra hash can be given to the function and this extra hash is
           appended to the file in calculation
+    - hexdigests
+        - Returns the hashes of several algorithms at once, also with an
+          extra hash and for files larger than the read buffer.
     - sanitize_string
         - For strings without any non-printable control characters, the
           original string is returned.
@@ -73,14 +76,34 @@ This module tests the following utility functions:
           recorded in that file.
         - If custom environment variables are supplied, they are used when
           running the command.
+    - stream_cached
+        - The value of the method is computed once, until the stream cache
+          of the scraper is emptied, and exceptions are not stored.
+    - run_command_limited
+        - Commands within the limits give the same results as with
+          run_command().
+        - Commands running over the time limit, writing more than the output
+          limit, or exceeding the CPU time or memory limits are stopped, and
+          the exceeded limit is returned.
+        - The processes started by the command are stopped with it.
+        - A command killed by a signal is not reported as exceeding the
+          memory limit.
+        - The command is started without preexec_fn, and a missing command
+          raises OSError also when the resource limits are set.
 """
 
+import errno
+import hashlib
 import os
+import subprocess
+import time
 from tempfile import TemporaryFile
 import pytest
+import six
 
-from file_scraper.utils import hexdigest, sanitize_string,\
-    iso8601_duration, strip_zeros, combine_metadata, run_command
+from file_scraper.utils import hexdigest, hexdigests, sanitize_string,\
+    iso8601_duration, strip_zeros, combine_metadata, run_command, \
+    run_command_limited, stream_cached
 
 
 @pytest.mark.parametrize(
@@ -105,6 +128,22 @@ def test_hexdigest(filepath, extra_hash, algorithm, expected_hash):
                          extra_hash=extra_hash) == expected_hash
 
 
+@pytest.mark.parametrize("extra_hash", [None, b"abc123"])
+def test_hexdigests(testpath, extra_hash):
+    """Test that hexdigests returns the hashes of hexdigest."""
+    large_file = os.path.join(testpath, "large.bin")
+    with open(large_file, "wb") as outfile:
+        outfile.write(os.urandom(1024 * 1024 * 2 + 123))
+    for filepath in ["tests/data/image_png/valid_1.2.png", large_file]:
+        with open(filepath, "rb") as infile:
+            data = infile.read() + (extra_hash or b"")
+        assert hexdigests(filepath, ["MD5", "SHA-1", "sha256"],
+                          extra_hash=extra_hash) == {
+                              "MD5": hashlib.md5(data).hexdigest(),
+                              "SHA-1": hashlib.sha1(data).hexdigest(),
+                              "sha256": hashlib.sha256(data).hexdigest()}
+
+
 @pytest.mark.parametrize(
     ["original_string", "sanitized_string"],
     [
@@ -324,3 +363,134 @@ def test_run_command_with_env():
     assert stdout == b"testing\n"
     assert statuscode == 0
     assert not stderr
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        ["seq", "5"],
+        ["sh", "-c", "echo error >&2; exit 2"],
+    ]
+)
+def test_run_command_limited(command):
+    """Test that commands within the limits are run normally."""
+    limits = {"timeout": 10, "max_output": 1000, "cpu_time": 10,
+              "memory": 2**30}
+    assert run_command_limited(command, limits) == \
+        run_command(command) + (None,)
+
+
+def test_run_command_timeout():
+    """Test that a command is stopped at the time limit."""
+    start = time.time()
+    (statuscode, _, _, exceeded) = run_command_limited(
+        ["sleep", "10"], {"timeout": 0.5})
+    assert time.time() - start < 5
+    assert statuscode != 0
+    assert exceeded == "timeout"
+
+
+def test_run_command_max_output():
+    """Test that a command is stopped when its output is too large."""
+    (statuscode, stdout, _, exceeded) = run_command_limited(
+        ["yes"], {"max_output": 100000, "timeout": 10})
+    assert statuscode != 0
+    assert len(stdout) == 100000
+    assert exceeded == "max_output"
+
+
+def test_run_command_cpu_time():
+    """Test that a command is stopped at the CPU time limit."""
+    (statuscode, _, _, exceeded) = run_command_limited(
+        ["sh", "-c", "while true; do :; done"],
+        {"cpu_time": 1, "timeout": 20})
+    assert statuscode != 0
+    assert exceeded == "cpu_time"
+
+
+def test_run_command_memory():
+    """Test that a command can not allocate over the memory limit."""
+    (statuscode, _, stderr, exceeded) = run_command_limited(
+        ["python", "-c", "'x' * 2**30"], {"memory": 2**28, "timeout": 20})
+    assert statuscode != 0
+    assert b"MemoryError" in stderr
+    assert exceeded == "memory"
+
+
+def test_run_command_process_group():
+    """Test that the processes started by the command are stopped."""
+    start = time.time()
+    (statuscode, stdout, _, exceeded) = run_command_limited(
+        ["sh", "-c", "sleep 5; echo hi"], {"timeout": 0.5})
+    assert time.time() - start < 3
+    assert statuscode != 0
+    assert not stdout
+    assert exceeded == "timeout"
+
+
+def test_run_command_signal():
+    """Test that a crash is not reported as exceeding the memory limit."""
+    (statuscode, _, _, exceeded) = run_command_limited(
+        ["sh", "-c", "kill -SEGV $$"], {"memory": 2**30, "timeout": 20})
+    assert statuscode == -11
+    assert exceeded is None
+
+
+@pytest.mark.skipif(six.PY2, reason="Requires Python 3")
+def test_run_command_no_preexec(monkeypatch):
+    """Test that the command is started in a new session without preexec_fn.
+    """
+    calls = []
+    popen = subprocess.Popen
+
+    def _popen(*args, **kwargs):
+        """Store the arguments of Popen."""
+        calls.append(kwargs)
+        return popen(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", _popen)
+    (statuscode, stdout, _, _) = run_command_limited(
+        ["sh", "-c", "ulimit -t; ulimit -v"],
+        {"cpu_time": 10, "memory": 2**30, "timeout": 20})
+    assert statuscode == 0
+    assert stdout.split() == [b"10", str(2**20).encode()]
+    assert calls[0]["start_new_session"]
+    assert "preexec_fn" not in calls[0]
+
+
+@pytest.mark.parametrize("limits", [{"timeout": 10}, {"memory": 2**30}])
+def test_run_command_limited_missing(limits):
+    """Test that a missing command raises OSError."""
+    with pytest.raises(OSError) as error:
+        run_command_limited(["file-scraper-nonexistent-command"], limits)
+    assert error.value.errno == errno.ENOENT
+
+
+def test_stream_cached():
+    """Test computing a value once per stream."""
+
+    class _Scraper(object):
+        """Scraper with a cached method."""
+
+        def __init__(self):
+            self._stream_cache = {}
+            self.calls = 0
+
+        @stream_cached
+        def _value(self):
+            """Return the number of calls, fail on the first call."""
+            self.calls += 1
+            if self.calls == 1:
+                raise ValueError()
+            return self.calls
+
+    # pylint: disable=protected-access
+    scraper = _Scraper()
+    with pytest.raises(ValueError):
+        scraper._value()
+    assert scraper._value() == 2
+    assert scraper._value() == 2
+    scraper._stream_cache = {}
+    assert scraper._value() == 3
+    assert _Scraper._value.__doc__ == \
+        'Return the number of calls, fail on the first call.'
@@ -0,0 +1,90 @@
+"""
+Tests for xml_base.py
+
+This module tests that:
+    - scan_xml() finds the XML version, encoding, doctype and the schema
+      locations of a document, the same as parsing the whole document tree.
+    - scan_xml() returns the syntax error of a not well-formed document.
+    - scan_xml() removes the parsed elements from memory, also from a large
+      document.
+    - scan_xml() accepts text nodes over the default size limit of libxml2.
+"""
+import os
+
+import pytest
+from lxml import etree
+
+from file_scraper.xml_base import find_schema_locations, scan_xml
+
+
+@pytest.mark.parametrize(
+    'filename',
+    [
+        'valid_1.0_well_formed.xml',
+        'valid_1.0_dtd.xml',
+        'valid_1.0_local_xsd.xml',
+        'valid_1.0_xsd.xml'
+    ]
+)
+def test_scan_xml(filename):
+    """Test that scanning gives the same results as parsing the tree."""
+    filename = os.path.join('tests/data/text_xml', filename)
+    result = scan_xml(filename)
+    tree = etree.parse(filename)
+    assert result['error'] is None
+    assert result['version'] == tree.docinfo.xml_version
+    assert result['encoding'] == tree.docinfo.encoding
+    assert result['doctype'] == tree.docinfo.doctype
+    assert (result['schema_locations'],
+            result['no_namespace_schema_locations']) == \
+        find_schema_locations(tree)
+
+
+@pytest.mark.parametrize(
+    'filename',
+    ['invalid_1.0_no_closing_tag.xml', 'invalid__empty.xml']
+)
+def test_scan_xml_invalid(filename):
+    """Test scanning a document, which is not well-formed."""
+    result = scan_xml(os.path.join('tests/data/text_xml', filename))
+    assert isinstance(result['error'], etree.XMLSyntaxError)
+
+
+def test_scan_xml_large(testpath, monkeypatch):
+    """Test that the parsed elements are removed while scanning."""
+    filename = os.path.join(testpath, 'large.xml')
+    with open(filename, 'wb') as outfile:
+        outfile.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<root>')
+        for _ in range(1000):
+            outfile.write(b'<a><b>text</b></a>' * 100)
+        outfile.write(b'<c xmlns:xsi="http://www.w3.org/2001/XMLSchema-'
+                      b'instance" xsi:noNamespaceSchemaLocation="c.xsd"/>'
+                      b'</root>')
+
+    roots = []
+    iterparse = etree.iterparse
+
+    def _iterparse(*args, **kwargs):
+        """Keep the root element for checking its size afterwards."""
+        for event, element in iterparse(*args, **kwargs):
+            if not roots:
+                roots.append(element)
+            yield (event, element)
+
+    monkeypatch.setattr(etree, 'iterparse', _iterparse)
+    result = scan_xml(filename)
+    assert result['error'] is None
+    assert result['no_namespace_schema_locations'] == set(['c.xsd'])
+    assert len(roots[0]) <= 1
+
+
+def test_scan_xml_huge_text(testpath):
+    """Test that a text node over 10 MB is well-formed."""
+    filename = os.path.join(testpath, 'huge.xml')
+    with open(filename, 'wb') as outfile:
+        outfile.write(b'<?xml version="1.0"?>\n<root><text>')
+        outfile.write(b'x' * (11 * 1024 * 1024))
+        outfile.write(b'</text></root>')
+    result = scan_xml(filename)
+    assert result['error'] is None
+    assert result['version'] == '1.0'